@@ -11,7 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 from datetime import timedelta
 from pathlib import Path
-from decouple import config
+from decouple import config, Csv
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -50,9 +50,11 @@ INSTALLED_APPS = [
     # local apps
     'users',
     'market',
+    'monitoring',
 ]
 
 MIDDLEWARE = [
+    'monitoring.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,6 +62,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'monitoring.middleware.QueryProfilerMiddleware',
 ]
 
 REST_FRAMEWORK = {
@@ -111,6 +114,11 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
 }
 
+VERIFY_CODE_BACKEND = config('VERIFY_CODE_BACKEND', default='database')
+# Claims authentication (users.authentication) only trusts token versions kept in a cache shared by all workers;
+# with the default local-memory CACHE_BACKEND every request loads the user row instead.
+TOKEN_VERSION_CACHE_TIMEOUT = config('TOKEN_VERSION_CACHE_TIMEOUT', default=3600, cast=int)
+
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
@@ -145,6 +153,38 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='e-commerce'),
+    }
+}
+
+# Also how long cached product pages may show stale rating aggregates; reviews do not invalidate them.
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=300, cast=int)
+CHECKOUT_LOCK_MODE = config('CHECKOUT_LOCK_MODE', default='nowait')
+CART_BACKEND = config('CART_BACKEND', default='database')
+CART_CACHE_TIMEOUT = config('CART_CACHE_TIMEOUT', default=86400, cast=int)
+CART_IDLE_FLUSH_SECONDS = config('CART_IDLE_FLUSH_SECONDS', default=900, cast=int)
+PRODUCT_PRICE_BUCKETS = config('PRODUCT_PRICE_BUCKETS', default='10,50,100,500,1000', cast=Csv(float))
+
+IMAGE_UPLOAD_MAX_SIZE = config('IMAGE_UPLOAD_MAX_SIZE', default=10 * 1024 * 1024, cast=int)
+IMAGE_UPLOAD_MAX_PIXELS = config('IMAGE_UPLOAD_MAX_PIXELS', default=40_000_000, cast=int)
+IMAGE_UPLOAD_MAX_DIMENSION = config('IMAGE_UPLOAD_MAX_DIMENSION', default=2560, cast=int)
+
+PRODUCT_IMAGE_WIDTHS = config('PRODUCT_IMAGE_WIDTHS', default='160,320,640,1280', cast=Csv(int))
+PRODUCT_IMAGE_FORMATS = config('PRODUCT_IMAGE_FORMATS', default='webp,jpeg', cast=Csv())
+PRODUCT_IMAGE_QUALITY = config('PRODUCT_IMAGE_QUALITY', default=80, cast=int)
+PRODUCT_IMAGE_WORKERS = config('PRODUCT_IMAGE_WORKERS', default=2, cast=int)
+PRODUCT_IMAGE_MAX_PENDING = config('PRODUCT_IMAGE_MAX_PENDING', default=64, cast=int)
+
+PASSWORD_HASH_WORKERS = config('PASSWORD_HASH_WORKERS', default=2, cast=int)
+PASSWORD_HASH_MAX_PENDING = config('PASSWORD_HASH_MAX_PENDING', default=32, cast=int)
+PASSWORD_HASH_ADMISSION_TIMEOUT = config('PASSWORD_HASH_ADMISSION_TIMEOUT', default=0.5, cast=float)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -188,6 +228,32 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'users.User'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+EMAIL_POOL_WORKERS = config('EMAIL_POOL_WORKERS', default=2, cast=int)
+EMAIL_POOL_QUEUE_SIZE = config('EMAIL_POOL_QUEUE_SIZE', default=1000, cast=int)
+EMAIL_POOL_BATCH_SIZE = config('EMAIL_POOL_BATCH_SIZE', default=50, cast=int)
+EMAIL_POOL_BATCH_WAIT = config('EMAIL_POOL_BATCH_WAIT', default=0.5, cast=float)
+EMAIL_POOL_SHUTDOWN_TIMEOUT = config('EMAIL_POOL_SHUTDOWN_TIMEOUT', default=30, cast=float)
+
+SMS_BACKEND = config('SMS_BACKEND', default='twilio')
+TWILIO_ACCOUNT_SID = config('account_sit', default='')
+TWILIO_AUTH_TOKEN = config('auth_token', default='')
+TWILIO_FROM_NUMBER = config('TWILIO_FROM_NUMBER', default='+998938340103')
+SMS_CONCURRENCY = config('SMS_CONCURRENCY', default=20, cast=int)
+SMS_MAX_RETRIES = config('SMS_MAX_RETRIES', default=3, cast=int)
+SMS_RETRY_BACKOFF = config('SMS_RETRY_BACKOFF', default=0.5, cast=float)
+SMS_RETRY_BACKOFF_MAX = config('SMS_RETRY_BACKOFF_MAX', default=10, cast=float)
+SMS_COALESCE_WINDOW = config('SMS_COALESCE_WINDOW', default=2, cast=float)
+SMS_SHUTDOWN_TIMEOUT = config('SMS_SHUTDOWN_TIMEOUT', default=30, cast=float)
+
+QUERY_PROFILER_ENABLED = config('QUERY_PROFILER_ENABLED', default=False, cast=bool)
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = config('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', default=3, cast=int)
+
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default='')
+METRICS_FLUSH_INTERVAL = config('METRICS_FLUSH_INTERVAL', default=5, cast=float)
+METRICS_MAX_SERIES = config('METRICS_MAX_SERIES', default=2000, cast=int)
+# /metrics answers 404 until a token is set; scrapers send it as a bearer token.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
 
 SWAGGER_SETTINGS = {
     'SECURITY_DEFINITIONS': {
@@ -5,6 +5,7 @@ from django.urls import path, re_path, include
 from django.views.static import serve
 from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
+from monitoring.views import metrics
 from rest_framework import permissions
 
 admin.site.site_header = 'E-commerce Admin'
@@ -27,6 +28,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('users.urls')),
     path('api/v1/market/', include('market.urls')),
+    path('api/v1/monitoring/', include('monitoring.urls')),
+    path('metrics', metrics, name='metrics'),
 
 
     re_path(r'static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT}),
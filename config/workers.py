@@ -0,0 +1,15 @@
+"""
+Process pool worker bootstrap.
+
+``init_worker`` is the ``initializer`` of the spawn-context ``ProcessPoolExecutor`` pools (password hashing,
+product picture variants): a spawned worker starts from a bare interpreter and must set up Django before it
+runs any job that touches settings or the ORM.
+"""
+
+import os
+
+
+def init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
@@ -17,6 +17,10 @@ class ErrorCodes(Enum):
     EXPIRED_OR_INVALID_CODE = 12
     NOT_EXPIRED = 13
     NOT_REGISTERED_YET = 14
+    OUT_OF_STOCK = 15
+    PRODUCT_BUSY = 16
+    TOO_MANY_REQUESTS = 17
+    FILE_TOO_LARGE = 18
 
 
 error_messages = {
@@ -34,6 +38,10 @@ error_messages = {
     12: {'result': 'Your confirmation code is invalid or expired', 'status_code': status.HTTP_400_BAD_REQUEST},
     13: {'result': 'Your confirmation code is not expired', 'status_code': status.HTTP_400_BAD_REQUEST},
     14: {'result': 'You have not fully registered yet', 'status_code': status.HTTP_400_BAD_REQUEST},
+    15: {'result': 'Not enough products in stock', 'status_code': status.HTTP_409_CONFLICT},
+    16: {'result': 'Products are being purchased right now, try again', 'status_code': status.HTTP_409_CONFLICT},
+    17: {'result': 'Too many requests right now, try again later', 'status_code': status.HTTP_429_TOO_MANY_REQUESTS},
+    18: {'result': 'Uploaded file is too large', 'status_code': status.HTTP_413_REQUEST_ENTITY_TOO_LARGE},
 }
 
 
@@ -0,0 +1,316 @@
+import csv
+import io
+import json
+import os
+
+from django.db import transaction
+from django.db.models import F
+from rest_framework.exceptions import ValidationError
+
+from .cache import bump_catalog_generation
+from .models import Author, Category, Product, SubCategory
+from .search import update_search_vectors
+
+CSV, JSONL = ('csv', 'jsonl')
+FILE_FORMATS = (CSV, JSONL)
+CONTENT_TYPES = {CSV: 'text/csv', JSONL: 'application/x-ndjson'}
+COLUMNS = ['sku', 'name', 'description', 'price', 'stock_quantity', 'category', 'sub_category', 'authors']
+REQUIRED_COLUMNS = ('sku', 'name', 'price')
+AUTHOR_SEPARATOR = '|'
+DEFAULT_IMPORT_CHUNK_SIZE = 1000
+MAX_IMPORT_CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+# Row keys that, when present, overwrite the matching columns of an existing product.
+UPDATE_FIELDS = {
+    'name': ('name',),
+    'price': ('price',),
+    'description': ('description',),
+    'stock_quantity': ('stock_quantity',),
+    'category': ('category',),
+    'sub_category': ('category', 'sub_category'),
+}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+class RowError:
+    # Stands in for a row that could not be parsed, so it is reported like an invalid one.
+    def __init__(self, message):
+        self.message = message
+
+
+def detect_format(filename, default=CSV):
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    if extension in ('jsonl', 'ndjson'):
+        return JSONL
+    if extension == 'csv':
+        return CSV
+    return default
+
+
+def author_key(name):
+    return ' '.join(name.split()).lower()
+
+
+def read_rows(file, file_format):
+    """
+    Yield ``(line number, row)`` from a binary file object, one line at a time.
+
+    CSV cells that are empty count as missing, except ``authors`` where an empty cell clears the authors;
+    authors are ``|`` separated in CSV and a list (or a ``|`` separated string) in JSON Lines. A JSON Lines
+    line that does not hold an object is yielded as a ``RowError``; a CSV header without the required columns
+    or text that is not UTF-8 raises ``ImportFileError``.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    line = 0
+    try:
+        if file_format == CSV:
+            reader = csv.DictReader(text)
+            missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ImportFileError(f'CSV header is missing the columns: {", ".join(missing)}')
+            for row in reader:
+                line = reader.line_num
+                row = {key: value for key, value in row.items()
+                       if key is not None and (value or key == 'authors')}
+                yield line, split_authors(row)
+        else:
+            for line, text_line in enumerate(text, 1):
+                if not text_line.strip():
+                    continue
+                try:
+                    row = json.loads(text_line)
+                except ValueError as error:
+                    yield line, RowError(f'Invalid JSON: {error}')
+                    continue
+                if not isinstance(row, dict):
+                    yield line, RowError('Expected a JSON object')
+                    continue
+                yield line, split_authors(row)
+    except (UnicodeDecodeError, csv.Error) as error:
+        raise ImportFileError(f'Could not read the file after line {line}: {error}')
+
+
+def split_authors(row):
+    if isinstance(row.get('authors'), str):
+        row['authors'] = [name.strip() for name in row['authors'].split(AUTHOR_SEPARATOR) if name.strip()]
+    return row
+
+
+class CatalogLookup:
+    """
+    Name to id maps for categories, sub-categories and authors, loaded once per import.
+
+    Names are matched case-insensitively; when several rows share a name the oldest one wins.
+    """
+
+    def __init__(self):
+        self.categories = {}
+        for pk, name in Category.objects.order_by('-pk').values_list('pk', 'name'):
+            self.categories[name.lower()] = pk
+        self.sub_categories = {}
+        self.sub_category_parents = {}
+        for pk, name, category_id in SubCategory.objects.order_by('-pk').values_list('pk', 'name', 'category_id'):
+            self.sub_categories[(category_id, name.lower())] = pk
+            self.sub_categories[(None, name.lower())] = pk
+            self.sub_category_parents[pk] = category_id
+        self.authors = {}
+        for pk, first_name, last_name in Author.objects.order_by('-pk').values_list('pk', 'first_name', 'last_name'):
+            self.authors[author_key(f'{first_name} {last_name}')] = pk
+
+    def resolve(self, data):
+        """Model values and author ids for one validated row, or the errors keyed by column."""
+        values = {key: data[key] for key in ('sku', 'name', 'price', 'description', 'stock_quantity')
+                  if key in data}
+        errors = {}
+        category_id = None
+        if data.get('category'):
+            category_id = self.categories.get(data['category'].lower())
+            if category_id is None:
+                errors['category'] = [f'Unknown category "{data["category"]}"']
+        if 'category' in data:
+            values['category_id'] = category_id
+        if data.get('sub_category'):
+            sub_category_id = self.sub_categories.get((category_id, data['sub_category'].lower()))
+            if sub_category_id is None:
+                errors['sub_category'] = [f'Unknown sub-category "{data["sub_category"]}"']
+            else:
+                values['sub_category_id'] = sub_category_id
+                values['category_id'] = self.sub_category_parents[sub_category_id]
+        elif 'sub_category' in data:
+            values['sub_category_id'] = None
+        author_ids = None
+        if 'authors' in data:
+            author_ids = []
+            for name in data['authors']:
+                author_id = self.authors.get(author_key(name))
+                if author_id is None:
+                    errors.setdefault('authors', []).append(f'Unknown author "{name}"')
+                elif author_id not in author_ids:
+                    author_ids.append(author_id)
+        return values, author_ids, errors
+
+
+class ImportReport:
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.max_errors = max_errors
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+        self.error = None
+
+    @property
+    def written(self):
+        return self.created + self.updated
+
+    def add_error(self, line, sku, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'sku': sku, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'error': self.error,
+        }
+
+
+def import_products(rows, chunk_size=DEFAULT_IMPORT_CHUNK_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """
+    Upsert products by ``sku`` from ``(line number, row)`` pairs such as ``read_rows()`` yields.
+
+    Rows are validated one by one and written ``chunk_size`` at a time, each chunk in its own transaction
+    with one ``bulk_create(update_conflicts=True)`` per set of present columns, so a row only overwrites the
+    columns it has. Invalid rows are reported and skipped; an unreadable file stops the import but keeps the
+    chunks already written. Returns an ``ImportReport``.
+    """
+    from .serializers import ProductImportRowSerializer
+
+    validator = ProductImportRowSerializer()
+    lookup = CatalogLookup()
+    report = ImportReport(max_errors)
+    chunk = {}
+    try:
+        for line, row in rows:
+            report.rows += 1
+            if isinstance(row, RowError):
+                report.add_error(line, None, {'non_field_errors': [row.message]})
+                continue
+            try:
+                data = validator.run_validation(row)
+            except ValidationError as error:
+                report.add_error(line, row.get('sku'), error.detail)
+                continue
+            values, author_ids, errors = lookup.resolve(data)
+            if errors:
+                report.add_error(line, data['sku'], errors)
+                continue
+            if data['sku'] in chunk:
+                # Keep file order: the later row for a sku must land after the earlier one.
+                write_chunk(chunk, report)
+                chunk = {}
+            chunk[data['sku']] = (values, author_ids, frozenset(data))
+            if len(chunk) >= chunk_size:
+                write_chunk(chunk, report)
+                chunk = {}
+    except ImportFileError as error:
+        report.error = str(error)
+    if chunk:
+        write_chunk(chunk, report)
+    if report.written:
+        bump_catalog_generation()
+    return report
+
+
+def write_chunk(chunk, report):
+    skus = list(chunk)
+    groups = {}
+    for values, _, present in chunk.values():
+        groups.setdefault(present, []).append(Product(**values))
+    with transaction.atomic():
+        existing = set(Product.objects.filter(sku__in=skus).values_list('sku', flat=True))
+        for present, products in groups.items():
+            update_fields = {field for key in present for field in UPDATE_FIELDS.get(key, ())}
+            Product.objects.bulk_create(products, update_conflicts=True, unique_fields=['sku'],
+                                        update_fields=sorted(update_fields) + ['updated_at'])
+        ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+        through = Product.author.through
+        replaced = [ids[sku] for sku, (_, author_ids, _) in chunk.items() if author_ids is not None]
+        if replaced:
+            through.objects.filter(product_id__in=replaced).delete()
+            through.objects.bulk_create([through(product_id=ids[sku], author_id=author_id)
+                                         for sku, (_, author_ids, _) in chunk.items()
+                                         for author_id in author_ids or ()])
+        update_search_vectors(list(ids.values()))
+    report.created += len(skus) - len(existing)
+    report.updated += len(existing)
+
+
+def export_rows(queryset=None, chunk_size=DEFAULT_IMPORT_CHUNK_SIZE):
+    """
+    Yield lists of up to ``chunk_size`` product rows shaped like the import columns.
+
+    Products are read with ``iterator()`` (a server-side cursor on PostgreSQL) in primary key order, and the
+    authors of each chunk are fetched with one extra query.
+    """
+    products = ((queryset if queryset is not None else Product.objects.all())
+                .order_by('pk')
+                .values('pk', 'sku', 'name', 'description', 'price', 'stock_quantity',
+                        category_name=F('category__name'), sub_category_name=F('sub_category__name')))
+    chunk = []
+    for product in products.iterator(chunk_size=chunk_size):
+        chunk.append(product)
+        if len(chunk) == chunk_size:
+            yield export_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield export_chunk(chunk)
+
+
+def export_chunk(products):
+    authors = {}
+    for product_id, first_name, last_name in (Product.author.through.objects
+                                              .filter(product_id__in=[product['pk'] for product in products])
+                                              .order_by('product_id', 'id')
+                                              .values_list('product_id', 'author__first_name',
+                                                           'author__last_name')):
+        authors.setdefault(product_id, []).append(f'{first_name} {last_name}')
+    return [{
+        'sku': product['sku'],
+        'name': product['name'],
+        'description': product['description'],
+        'price': product['price'],
+        'stock_quantity': product['stock_quantity'],
+        'category': product['category_name'],
+        'sub_category': product['sub_category_name'],
+        'authors': authors.get(product['pk'], []),
+    } for product in products]
+
+
+def render_export(chunks, file_format):
+    """Encode ``export_rows()`` chunks as CSV (with a header) or JSON Lines, one string per chunk."""
+    if file_format == JSONL:
+        for rows in chunks:
+            yield ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+        return
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow([row['sku'] or '', row['name'], row['description'], row['price'],
+                             row['stock_quantity'], row['category'] or '', row['sub_category'] or '',
+                             AUTHOR_SEPARATOR.join(row['authors'])])
+        yield buffer.getvalue()
@@ -0,0 +1,53 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CATALOG_GENERATION_KEY = 'market:catalog:generation'
+
+
+def _initial_generation():
+    # Seeded from the clock so a generation lost to eviction never falls back onto keys cached before it.
+    return time.time_ns() // 1000000
+
+
+def get_catalog_generation():
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, _initial_generation(), timeout=None)
+        generation = cache.get(CATALOG_GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.set(CATALOG_GENERATION_KEY, _initial_generation(), timeout=None)
+
+
+def catalog_cache_key(action, params, request=None):
+    if request is not None:
+        # Serialized pages hold absolute media URLs, so each scheme and host gets its own entry.
+        params = {**params, 'origin': request.build_absolute_uri('/')}
+    normalized = json.dumps(params, sort_keys=True, default=str, separators=(',', ':'))
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f'market:catalog:{get_catalog_generation()}:{action}:{digest}'
+
+
+def cached_catalog(action, params, builder, request=None):
+    """
+    Read-through cache for catalog reads.
+
+    Keys embed the catalog generation, so bumping it on any catalog write makes every older entry unreachable
+    without scanning or deleting keys; they simply expire. Pass the ``request`` the builder serializes with so
+    URLs built from it are never served to another host.
+    """
+    key = catalog_cache_key(action, params, request)
+    data = cache.get(key)
+    if data is None:
+        data = builder()
+        cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,323 @@
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+from .models import Cart, CartItem
+
+CART_DATABASE, CART_CACHE = ('database', 'cache')
+CART_BACKENDS = (CART_DATABASE, CART_CACHE)
+MAX_CART_LINES = 500
+FLUSH_BATCH_SIZE = 500
+
+CART_KEY = 'market:cart:{}'
+DIRTY_SEQUENCE_KEY = 'market:cart:dirty:sequence'
+DIRTY_SLOT_KEY = 'market:cart:dirty:{}'
+DIRTY_CURSOR_KEY = 'market:cart:dirty:cursor'
+CART_LOCK_KEY = 'market:cart:lock:{}'
+# Seconds a lock is held at most (a crashed holder cannot block the cart for longer) and waited for at most.
+CART_LOCK_TIMEOUT = 10
+CART_LOCK_WAIT = 5
+
+
+def cart_lines(items):
+    return [{'product': product_id, 'quantity': quantity} for product_id, quantity in sorted(items.items())]
+
+
+def load_cart_items(user_ids):
+    carts = {user_id: {} for user_id in user_ids}
+    for user_id, product_id, quantity in (CartItem.objects
+                                          .filter(cart__user_id__in=user_ids)
+                                          .values_list('cart__user_id', 'product_id', 'quantity')):
+        carts[user_id][product_id] = carts[user_id].get(product_id, 0) + quantity
+    return carts
+
+
+def write_cart_items(carts):
+    """
+    Make ``CartItem`` match ``{user_id: {product_id: quantity}}`` for every cart at once.
+
+    Only the difference is written: one ``DELETE`` for removed lines, one ``bulk_update`` for changed
+    quantities and one ``bulk_create`` for new lines, whatever the number of carts.
+    """
+    if not carts:
+        return
+    with transaction.atomic():
+        cart_ids = dict(Cart.objects.filter(user_id__in=carts.keys()).values_list('user_id', 'pk'))
+        missing = [Cart(user_id=user_id) for user_id in carts if user_id not in cart_ids]
+        if missing:
+            Cart.objects.bulk_create(missing, ignore_conflicts=True)
+            cart_ids = dict(Cart.objects.filter(user_id__in=carts.keys()).values_list('user_id', 'pk'))
+        users = {cart_id: user_id for user_id, cart_id in cart_ids.items()}
+
+        existing, stale, changed = {}, [], []
+        for row in CartItem.objects.filter(cart_id__in=users.keys()).only('pk', 'cart_id', 'product_id', 'quantity'):
+            key = (users[row.cart_id], row.product_id)
+            quantity = carts[key[0]].get(row.product_id)
+            if quantity is None or key in existing:
+                stale.append(row.pk)
+                continue
+            existing[key] = row
+            if row.quantity != quantity:
+                row.quantity = quantity
+                changed.append(row)
+
+        if stale:
+            CartItem.objects.filter(pk__in=stale).delete()
+        if changed:
+            CartItem.objects.bulk_update(changed, ['quantity'], batch_size=FLUSH_BATCH_SIZE)
+        CartItem.objects.bulk_create([
+            CartItem(cart_id=cart_ids[user_id], product_id=product_id, quantity=quantity)
+            for user_id, items in carts.items()
+            for product_id, quantity in items.items()
+            if (user_id, product_id) not in existing
+        ], batch_size=FLUSH_BATCH_SIZE)
+
+
+def acquire_cart_lock(user_id, wait=CART_LOCK_WAIT):
+    """Take the per-user cart lock with ``cache.add``; returns its token, or ``None`` after ``wait`` seconds."""
+    key = CART_LOCK_KEY.format(user_id)
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + wait
+    delay = 0.002
+    while not cache.add(key, token, CART_LOCK_TIMEOUT):
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(delay)
+        delay = min(delay * 2, 0.05)
+    return token
+
+
+def release_cart_lock(user_id, token):
+    key = CART_LOCK_KEY.format(user_id)
+    # Only the holder deletes it; a lock that expired and was taken by someone else is left alone.
+    if cache.get(key) == token:
+        cache.delete(key)
+
+
+@contextmanager
+def cart_lock(user_id):
+    token = acquire_cart_lock(user_id)
+    if token is None:
+        raise CustomAPIException(ErrorCodes.TOO_MANY_REQUESTS)
+    try:
+        yield
+    finally:
+        release_cart_lock(user_id, token)
+
+
+class BaseCartStore:
+    def locked(self, user_id):
+        """Held around every read-modify-write of one cart."""
+        return nullcontext()
+
+    def get_items(self, user_id):
+        raise NotImplementedError
+
+    def save_items(self, user_id, items):
+        raise NotImplementedError
+
+    def add(self, user_id, product_id, quantity):
+        with self.locked(user_id):
+            items = self.get_items(user_id)
+            items[product_id] = items.get(product_id, 0) + quantity
+            return self.save_items(user_id, items)
+
+    def set(self, user_id, product_id, quantity):
+        with self.locked(user_id):
+            items = self.get_items(user_id)
+            if quantity:
+                items[product_id] = quantity
+            else:
+                items.pop(product_id, None)
+            return self.save_items(user_id, items)
+
+    def remove(self, user_id, product_id):
+        return self.set(user_id, product_id, 0)
+
+    def clear(self, user_id):
+        with self.locked(user_id):
+            return self.save_items(user_id, {})
+
+    def flush(self, user_ids=None, idle=None):
+        return 0
+
+    def flush_cart(self, user_id):
+        """Write one cart to ``CartItem`` now; returns its version, for ``discard`` after checkout."""
+        return None
+
+    def discard(self, user_id, version=None, ordered=None):
+        pass
+
+    @staticmethod
+    def check_size(items):
+        if len(items) > MAX_CART_LINES:
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, message='Cart is full')
+
+
+class DatabaseCartStore(BaseCartStore):
+    """Every change is written to ``CartItem`` straight away."""
+
+    def get_items(self, user_id):
+        return load_cart_items([user_id])[user_id]
+
+    def save_items(self, user_id, items):
+        self.check_size(items)
+        write_cart_items({user_id: items})
+        return items
+
+    def add(self, user_id, product_id, quantity):
+        with transaction.atomic():
+            updated = (CartItem.objects
+                       .filter(cart__user_id=user_id, product_id=product_id)
+                       .update(quantity=F('quantity') + quantity))
+            if not updated:
+                cart, _ = Cart.objects.get_or_create(user_id=user_id)
+                if CartItem.objects.filter(cart=cart).count() >= MAX_CART_LINES:
+                    raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, message='Cart is full')
+                CartItem.objects.create(cart=cart, product_id=product_id, quantity=quantity)
+        return self.get_items(user_id)
+
+
+class CacheCartStore(BaseCartStore):
+    """
+    Active carts live in the cache as one ``{product_id: quantity}`` entry per user and reach ``CartItem`` only
+    when flushed: on checkout, or from ``flush_carts`` once they have been idle for a while.
+
+    A cart that becomes dirty appends its user id to a log of numbered slots (the slot number comes from an
+    atomic ``incr``), so concurrent writers never overwrite each other's registrations and the flusher reads
+    only the slots added since its last run. Dirty entries are stored without a timeout so they cannot expire
+    before they are written back.
+
+    Every change to an entry, and the flusher clearing its dirty flag, happens under a per-user lock taken with
+    ``cache.add``, so concurrent edits of one cart are serialized and a write that lands during a flush keeps
+    the cart dirty. Entries and locks are only shared between processes through a shared cache backend
+    (memcached, Redis); with the default local-memory cache each process has its own carts.
+    """
+
+    def locked(self, user_id):
+        return cart_lock(user_id)
+
+    def entry(self, user_id):
+        key = CART_KEY.format(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            entry = {'items': load_cart_items([user_id])[user_id], 'dirty': False, 'version': 0,
+                     'touched': time.time()}
+            cache.add(key, entry, settings.CART_CACHE_TIMEOUT)
+        return entry
+
+    def get_items(self, user_id):
+        return dict(self.entry(user_id)['items'])
+
+    def save_items(self, user_id, items):
+        self.check_size(items)
+        entry = self.entry(user_id)
+        was_dirty = entry['dirty']
+        entry.update(items=items, dirty=True, version=entry['version'] + 1, touched=time.time())
+        cache.set(CART_KEY.format(user_id), entry, None)
+        if not was_dirty:
+            self.mark_dirty(user_id)
+        return items
+
+    def mark_dirty(self, user_id):
+        try:
+            slot = cache.incr(DIRTY_SEQUENCE_KEY)
+        except ValueError:
+            cache.add(DIRTY_SEQUENCE_KEY, 0, None)
+            slot = cache.incr(DIRTY_SEQUENCE_KEY)
+        cache.set(DIRTY_SLOT_KEY.format(slot), user_id, None)
+
+    def write_back(self, user_ids, idle=None):
+        """Flush the dirty carts among ``user_ids``; carts touched within ``idle`` seconds are kept back."""
+        keys = {CART_KEY.format(user_id): user_id for user_id in user_ids}
+        entries = {keys[key]: entry for key, entry in cache.get_many(keys.keys()).items() if entry['dirty']}
+        cutoff = time.time() - idle if idle is not None else None
+        ready = {user_id: entry for user_id, entry in entries.items()
+                 if cutoff is None or entry['touched'] <= cutoff}
+        write_cart_items({user_id: entry['items'] for user_id, entry in ready.items()})
+
+        pending = [user_id for user_id in entries if user_id not in ready]
+        for user_id, entry in ready.items():
+            if not self.mark_clean(user_id, entry['version']):
+                # Changed while it was being written, so it is still dirty and needs a new slot.
+                pending.append(user_id)
+        return ready.keys(), pending
+
+    def mark_clean(self, user_id, version):
+        """Clear the dirty flag if the entry is still at ``version``; a cart being edited right now is skipped."""
+        token = acquire_cart_lock(user_id, wait=0)
+        if token is None:
+            return False
+        try:
+            key = CART_KEY.format(user_id)
+            latest = cache.get(key)
+            if latest is None:
+                return True
+            if latest['version'] != version:
+                return False
+            latest['dirty'] = False
+            cache.set(key, latest, settings.CART_CACHE_TIMEOUT)
+            return True
+        finally:
+            release_cart_lock(user_id, token)
+
+    def flush(self, user_ids=None, idle=None):
+        if user_ids is not None:
+            flushed, pending = self.write_back(user_ids, idle)
+            return len(flushed)
+
+        cursor = cache.get(DIRTY_CURSOR_KEY) or 0
+        sequence = cache.get(DIRTY_SEQUENCE_KEY) or 0
+        total = 0
+        while cursor < sequence:
+            end = min(cursor + FLUSH_BATCH_SIZE, sequence)
+            slots = [DIRTY_SLOT_KEY.format(slot) for slot in range(cursor + 1, end + 1)]
+            flushed, pending = self.write_back(set(cache.get_many(slots).values()), idle)
+            for user_id in pending:
+                self.mark_dirty(user_id)
+            cache.delete_many(slots)
+            cache.set(DIRTY_CURSOR_KEY, end, None)
+            total += len(flushed)
+            cursor = end
+        return total
+
+    def flush_cart(self, user_id):
+        with self.locked(user_id):
+            entry = self.entry(user_id)
+            if entry['dirty']:
+                write_cart_items({user_id: entry['items']})
+                entry['dirty'] = False
+                cache.set(CART_KEY.format(user_id), entry, settings.CART_CACHE_TIMEOUT)
+            return entry['version']
+
+    def discard(self, user_id, version=None, ordered=None):
+        """
+        Drop the cart after a checkout of the cart ``flush_cart`` returned ``version`` for. A cart edited since
+        keeps those edits: only the ``ordered`` ``{product_id: quantity}`` is taken out of it.
+        """
+        with self.locked(user_id):
+            key = CART_KEY.format(user_id)
+            entry = cache.get(key)
+            if entry is None:
+                return
+            if version is None or entry['version'] == version:
+                cache.delete(key)
+                return
+            ordered = ordered or {}
+            items = {product_id: quantity - ordered.get(product_id, 0)
+                     for product_id, quantity in entry['items'].items()}
+            self.save_items(user_id, {product_id: quantity for product_id, quantity in items.items() if quantity > 0})
+
+
+CART_STORES = {CART_DATABASE: DatabaseCartStore(), CART_CACHE: CacheCartStore()}
+
+
+def get_cart_store():
+    return CART_STORES[settings.CART_BACKEND]
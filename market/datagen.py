@@ -0,0 +1,435 @@
+import io
+import json
+import random
+import time
+from bisect import bisect
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+
+from users.models import User, DONE, ORDINARY_USER, VIA_EMAIL
+from .cache import bump_catalog_generation
+from .models import (Author, Cart, CartItem, Category, Order, OrderItem, Payment, Product, Review, SubCategory,
+                     ORDER_STATUS_CHOICES, PAYMENT_METHOD_CHOICES)
+from .search import update_search_vectors
+
+FIRST_NAMES = ('Aziz', 'Dilnoza', 'Jasur', 'Malika', 'Otabek', 'Nodira', 'Sardor', 'Kamola', 'Bekzod', 'Zarina',
+               'John', 'Emma', 'Liam', 'Olivia', 'Noah', 'Ava')
+LAST_NAMES = ('Karimov', 'Rahimova', 'Tursunov', 'Yusupova', 'Aliyev', 'Saidova', 'Smith', 'Johnson', 'Brown',
+              'Miller', 'Davis', 'Wilson')
+ADJECTIVES = ('red', 'blue', 'green', 'classic', 'modern', 'compact', 'deluxe', 'wireless', 'organic', 'vintage',
+              'portable', 'premium', 'smart', 'silent', 'heavy', 'light')
+NOUNS = ('book', 'lamp', 'chair', 'phone', 'kettle', 'jacket', 'backpack', 'watch', 'speaker', 'blender', 'notebook',
+         'sneakers', 'camera', 'mug', 'keyboard', 'pillow')
+REVIEW_COMMENTS = {
+    1: ('Broke after a week.', 'Not as described.'),
+    2: ('Disappointing quality.', 'Arrived late and scratched.'),
+    3: ('Does the job.', 'Average, nothing special.'),
+    4: ('Good value for the price.', 'Works well, minor issues.'),
+    5: ('Excellent, would buy again!', 'Exactly what I needed.'),
+}
+PAYMENT_COMPLETED, PAYMENT_PENDING, PAYMENT_FAILED, PAYMENT_REFUNDED = (2, 1, 3, 4)
+MAX_ITEMS_PER_ORDER = 50
+
+
+def escape_copy_text(value):
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_formatter(field):
+    """Render a Python value in PostgreSQL ``COPY ... FROM STDIN`` text format."""
+    if isinstance(field, models.BooleanField):
+        return lambda value: '\\N' if value is None else ('t' if value else 'f')
+    if isinstance(field, models.JSONField):
+        return lambda value: '\\N' if value is None else escape_copy_text(json.dumps(value))
+    if isinstance(field, (models.IntegerField, models.FloatField, models.ForeignKey)):
+        return lambda value: '\\N' if value is None else str(value)
+    if isinstance(field, models.DateTimeField):
+        return lambda value: '\\N' if value is None else value.isoformat(' ')
+    return lambda value: '\\N' if value is None else escape_copy_text(str(value))
+
+
+def insert_adapter(field):
+    if isinstance(field, models.JSONField):
+        return lambda value: None if value is None else json.dumps(value)
+    if isinstance(field, models.DateTimeField):
+        return connection.ops.adapt_datetimefield_value
+    return None
+
+
+class TableWriter:
+    """
+    Bulk loads rows for ``fields`` of ``model``; every other concrete column gets its default, computed once.
+
+    Rows are buffered and written ``batch_size`` at a time with ``COPY`` on PostgreSQL and an ``executemany``
+    ``INSERT`` elsewhere. Ids are explicit, so rows can reference each other without reading anything back;
+    ``parents`` are flushed first so foreign keys always point at rows that are already written.
+    """
+
+    def __init__(self, model, fields, batch_size, parents=()):
+        self.model = model
+        self.batch_size = batch_size
+        self.parents = parents
+        self.rows = []
+        self.written = 0
+        self.copy = connection.vendor == 'postgresql'
+        by_name = {field.attname: field for field in model._meta.concrete_fields}
+        now = datetime.now()
+        extra = []
+        for field in model._meta.concrete_fields:
+            if field.attname in fields or isinstance(field, models.AutoField):
+                continue
+            if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add):
+                extra.append((field, now))
+            else:
+                extra.append((field, field.get_default()))
+        self.fields = [by_name[name] for name in fields]
+        columns = [field.column for field in self.fields] + [field.column for field, _ in extra]
+        table = connection.ops.quote_name(model._meta.db_table)
+        column_list = ', '.join(connection.ops.quote_name(column) for column in columns)
+        if self.copy:
+            self.sql = f'COPY {table} ({column_list}) FROM STDIN'
+            self.formatters = [copy_formatter(field) for field in self.fields]
+            self.suffix = ''.join('\t' + copy_formatter(field)(value) for field, value in extra)
+        else:
+            self.sql = f'INSERT INTO {table} ({column_list}) VALUES ({", ".join(["%s"] * len(columns))})'
+            self.adapters = [insert_adapter(field) for field in self.fields]
+            self.constants = tuple((insert_adapter(field) or (lambda value: value))(value) for field, value in extra)
+
+    def add(self, *values):
+        self.rows.append(values)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for parent in self.parents:
+            parent.flush()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.copy:
+                formatters, suffix = self.formatters, self.suffix
+                buffer = io.StringIO()
+                buffer.writelines(
+                    '\t'.join([format_value(value) for format_value, value in zip(formatters, row)]) + suffix + '\n'
+                    for row in rows)
+                buffer.seek(0)
+                cursor.copy_expert(self.sql, buffer)
+            else:
+                adapters, constants = self.adapters, self.constants
+                cursor.executemany(self.sql, [
+                    tuple(value if adapt is None else adapt(value) for adapt, value in zip(adapters, row))
+                    + constants for row in rows])
+        self.written += len(rows)
+
+
+class WeightedChoice:
+    """``rng.choices(values, weights)[0]`` for small integer weights, as one table lookup."""
+
+    def __init__(self, values, weights):
+        self.table = [value for value, weight in zip(values, weights) for _ in range(weight)]
+
+    def pick(self, rng):
+        return self.table[int(rng.random() * len(self.table))]
+
+
+class ZipfSampler:
+    """Draws from ``values`` with Zipf-distributed popularity; which value gets which rank is shuffled by ``rng``."""
+
+    def __init__(self, values, exponent, rng):
+        self.values = list(values)
+        rng.shuffle(self.values)
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, len(self.values) + 1)))
+        self.total = self.cum_weights[-1] if self.cum_weights else 0
+
+    def pick(self, rng):
+        return self.values[bisect(self.cum_weights, rng.random() * self.total, 0, len(self.values) - 1)]
+
+    def distinct(self, rng, k):
+        k = min(k, len(self.values))
+        chosen = set()
+        while len(chosen) < k:
+            chosen.add(self.pick(rng))
+        return list(chosen)
+
+
+RATINGS = WeightedChoice((1, 2, 3, 4, 5), (6, 4, 10, 28, 52))
+QUANTITIES = WeightedChoice((1, 2, 3, 4, 5), (70, 18, 7, 3, 2))
+ORDER_STATUSES = WeightedChoice([status for status, _ in ORDER_STATUS_CHOICES], (10, 15, 55, 20))
+PAYMENT_STATUSES = WeightedChoice((PAYMENT_COMPLETED, PAYMENT_PENDING, PAYMENT_FAILED, PAYMENT_REFUNDED),
+                                  (85, 5, 7, 3))
+
+
+GENERATED_MODELS = (User, Category, SubCategory, Author, Product, Product.author.through, Review, Order, OrderItem,
+                    Cart, CartItem, Payment)
+
+
+@contextmanager
+def deferred_indexes(models_):
+    """
+    Drop the secondary indexes and foreign keys of ``models_`` (PostgreSQL) and recreate them on exit.
+
+    Building an index once over the loaded rows and validating a foreign key with one join is much cheaper
+    than maintaining them row by row during ``COPY``. Primary keys and unique constraints stay in place. Run it
+    inside a transaction so an interrupted load rolls the schema back too.
+    """
+    tables = [model._meta.db_table for model in models_]
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT t.relname, c.conname, pg_get_constraintdef(c.oid) FROM pg_constraint c "
+            "JOIN pg_class t ON t.oid = c.conrelid "
+            "WHERE c.contype = 'f' AND t.relname = ANY(%s) AND pg_table_is_visible(t.oid)", [tables])
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT s.relname, pg_get_indexdef(i.indexrelid) FROM pg_index i "
+            "JOIN pg_class t ON t.oid = i.indrelid JOIN pg_class s ON s.oid = i.indexrelid "
+            "WHERE t.relname = ANY(%s) AND pg_table_is_visible(t.oid) AND NOT i.indisprimary "
+            "AND NOT i.indisunique", [tables])
+        indexes = cursor.fetchall()
+        for table, name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} DROP CONSTRAINT {quote(name)}')
+        for name, _ in indexes:
+            cursor.execute(f'DROP INDEX {quote(name)}')
+    yield
+    with connection.cursor() as cursor:
+        for _, definition in indexes:
+            cursor.execute(definition)
+        for table, name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}')
+
+
+def next_id(model):
+    return (model.objects.aggregate(last=models.Max('pk'))['last'] or 0) + 1
+
+
+class DataGenerator:
+    """
+    Generates a synthetic shop of the requested size, deterministically from ``seed``.
+
+    Popularity is skewed the way real traffic is: products, subcategories, authors, reviewers and customers are
+    all drawn from Zipf distributions, ratings lean towards five stars, and order dates grow denser towards
+    ``until``. Ids continue after the rows already in the database, and each phase gets its own random stream,
+    so the same seed and sizes always produce the same rows on an empty database.
+
+    Everything is loaded in one transaction. On PostgreSQL the secondary indexes and foreign keys of the
+    generated tables are rebuilt after the load unless ``defer_indexes`` is off, which locks those tables for
+    the duration.
+    """
+
+    def __init__(self, seed=0, users=100000, categories=20, subcategories=200, authors=5000, products=50000,
+                 reviews=500000, orders=1000000, order_items=3000000, carts=20000, days=730, until=None,
+                 zipf_exponent=1.1, batch_size=50000, password='password', defer_indexes=True, log=None):
+        self.seed = seed
+        self.sizes = {'users': users, 'categories': categories, 'subcategories': subcategories, 'authors': authors,
+                      'products': products, 'reviews': reviews, 'orders': orders, 'order_items': order_items,
+                      'carts': carts}
+        self.days = days
+        self.until = until or datetime.combine(datetime.now().date(), datetime.min.time())
+        self.zipf_exponent = zipf_exponent
+        self.batch_size = batch_size
+        self.password = password
+        self.defer_indexes = defer_indexes and connection.vendor == 'postgresql'
+        self.log = log or (lambda message: None)
+
+    def rng(self, phase):
+        return random.Random(f'{self.seed}:{phase}')
+
+    def moment(self, rng, recent_bias=1.0):
+        # recent_bias > 1 packs more rows into the last days, like a growing shop.
+        return self.until - timedelta(seconds=self.days * 86400 * rng.random() ** recent_bias)
+
+    def writer(self, model, fields, parents=()):
+        return TableWriter(model, fields, self.batch_size, parents)
+
+    def timed(self, name, phase):
+        started = time.monotonic()
+        written = phase()
+        elapsed = time.monotonic() - started
+        self.log(f'{name}: {written} rows in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f}/s)')
+        return written
+
+    def run(self):
+        self.ids = {model: next_id(model) for model in GENERATED_MODELS}
+        self.user_ids = range(self.ids[User], self.ids[User] + self.sizes['users'])
+        self.product_ids = range(self.ids[Product], self.ids[Product] + self.sizes['products'])
+        if not self.user_ids or not self.product_ids:
+            raise ValueError('users and products must be positive')
+        self.product_sampler = ZipfSampler(self.product_ids, self.zipf_exponent, self.rng('product-popularity'))
+        self.customer_sampler = ZipfSampler(self.user_ids, 0.8, self.rng('customer-activity'))
+
+        with transaction.atomic():
+            indexes = deferred_indexes(GENERATED_MODELS) if self.defer_indexes else nullcontext()
+            with indexes:
+                counts = {
+                    'users': self.timed('users', self.generate_users),
+                    'categories': self.timed('categories', self.generate_categories),
+                    'authors': self.timed('authors', self.generate_authors),
+                    'products': self.timed('products', self.generate_products),
+                    'reviews': self.timed('reviews', self.generate_reviews),
+                    'orders': self.timed('orders, order items and payments', self.generate_orders),
+                    'carts': self.timed('carts', self.generate_carts),
+                }
+                started = time.monotonic()
+            if self.defer_indexes:
+                self.log(f'indexes and foreign keys: {time.monotonic() - started:.1f}s')
+            if connection.vendor == 'postgresql':
+                # Fresh statistics (and the indexes being back) keep the author subquery of the search vector
+                # on index scans; with the pre-load ones it scans the whole join table for every product.
+                with connection.cursor() as cursor:
+                    for model in GENERATED_MODELS:
+                        cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+            self.finish()
+        bump_catalog_generation()
+        return counts
+
+    def generate_users(self):
+        rng = self.rng('users')
+        password = make_password(self.password)
+        users = self.writer(User, ['id', 'username', 'email', 'first_name', 'last_name', 'password', 'auth_types',
+                                   'auth_status', 'user_roles', 'date_joined', 'created_at', 'updated_at'])
+        for user_id in self.user_ids:
+            joined = self.moment(rng)
+            users.add(user_id, f'user_{user_id}', f'user_{user_id}@example.com', rng.choice(FIRST_NAMES),
+                      rng.choice(LAST_NAMES), password, VIA_EMAIL, DONE, ORDINARY_USER, joined, joined, joined)
+        users.flush()
+        return users.written
+
+    def generate_categories(self):
+        rng = self.rng('categories')
+        first_category = self.ids[Category]
+        categories = self.writer(Category, ['id', 'name', 'description'])
+        for index in range(self.sizes['categories']):
+            categories.add(first_category + index, f'Category {index + 1}', f'All about {rng.choice(NOUNS)}s')
+        subcategories = self.writer(SubCategory, ['id', 'name', 'description', 'category_id'], parents=[categories])
+        category_sampler = ZipfSampler(range(first_category, first_category + self.sizes['categories']), 1.0, rng)
+        self.subcategory_category = {}
+        for index in range(self.sizes['subcategories']):
+            subcategory_id, category_id = self.ids[SubCategory] + index, category_sampler.pick(rng)
+            self.subcategory_category[subcategory_id] = category_id
+            subcategories.add(subcategory_id, f'Subcategory {index + 1}', f'{rng.choice(ADJECTIVES)} things',
+                              category_id)
+        subcategories.flush()
+        return categories.written + subcategories.written
+
+    def generate_authors(self):
+        rng = self.rng('authors')
+        authors = self.writer(Author, ['id', 'first_name', 'last_name'])
+        for index in range(self.sizes['authors']):
+            authors.add(self.ids[Author] + index, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))
+        authors.flush()
+        return authors.written
+
+    def review_plan(self):
+        # Replayed twice: once to aggregate ratings onto products, once to write the reviews themselves.
+        rng = self.rng('reviews')
+        reviewer_sampler = ZipfSampler(self.user_ids, 1.0, self.rng('reviewer-activity'))
+        for index in range(self.sizes['reviews']):
+            rating = RATINGS.pick(rng)
+            yield (self.ids[Review] + index, reviewer_sampler.pick(rng), self.product_sampler.pick(rng),
+                   rating, rng.choice(REVIEW_COMMENTS[rating]), self.moment(rng, 1.5))
+
+    def generate_products(self):
+        rng = self.rng('products')
+        ratings = {}
+        for _, _, product_id, rating, _, _ in self.review_plan():
+            counts = ratings.setdefault(product_id, [0] * 5)
+            counts[rating - 1] += 1
+
+        fields = ['id', 'sku', 'name', 'description', 'price', 'stock_quantity', 'category_id', 'sub_category_id',
+                  'rating_sum', 'rating_count', 'rating_average', 'rating_1', 'rating_2', 'rating_3', 'rating_4',
+                  'rating_5', 'created_at', 'updated_at']
+        products = self.writer(Product, fields)
+        product_authors = self.writer(Product.author.through, ['product_id', 'author_id'], parents=[products])
+        subcategory_ids = list(self.subcategory_category) or [None]
+        subcategory_sampler = ZipfSampler(subcategory_ids, 1.0, rng)
+        author_sampler = ZipfSampler(range(self.ids[Author], self.ids[Author] + self.sizes['authors']), 1.0, rng)
+        self.prices = {}
+        for product_id in self.product_ids:
+            subcategory_id = subcategory_sampler.pick(rng)
+            price = round(min(rng.lognormvariate(3.5, 1.0), 20000), 2)
+            self.prices[product_id] = price
+            counts = ratings.get(product_id, [0] * 5)
+            total, count = sum(star * counts[star - 1] for star in range(1, 6)), sum(counts)
+            created = self.moment(rng)
+            products.add(product_id, f'SKU{product_id:08d}',
+                         f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS)} {product_id}',
+                         f'A {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} for everyday use', price,
+                         rng.randint(0, 500), self.subcategory_category.get(subcategory_id), subcategory_id,
+                         total, count, total / count if count else 0, *counts, created, created)
+            if self.sizes['authors']:
+                for author_id in author_sampler.distinct(rng, rng.choice((1, 1, 1, 2, 3))):
+                    product_authors.add(product_id, author_id)
+        product_authors.flush()
+        return products.written + product_authors.written
+
+    def generate_reviews(self):
+        reviews = self.writer(Review, ['id', 'user_id', 'product_id', 'rating', 'comment', 'created_at',
+                                       'updated_at'])
+        for review_id, user_id, product_id, rating, comment, created in self.review_plan():
+            reviews.add(review_id, user_id, product_id, rating, comment, created, created)
+        reviews.flush()
+        return reviews.written
+
+    def generate_orders(self):
+        rng = self.rng('orders')
+        orders = self.writer(Order, ['id', 'user_id', 'total_price', 'status', 'created_at', 'updated_at'])
+        items = self.writer(OrderItem, ['id', 'order_id', 'product_id', 'price', 'quantity', 'created_at',
+                                        'updated_at'], parents=[orders])
+        payments = self.writer(Payment, ['id', 'order_id', 'user_id', 'amount', 'status', 'method',
+                                         'gateway_response', 'created_at', 'updated_at'], parents=[orders])
+        methods = [method for method, _ in PAYMENT_METHOD_CHOICES]
+        mean_items = self.sizes['order_items'] / self.sizes['orders'] if self.sizes['orders'] else 0
+        item_id, payment_id = self.ids[OrderItem], self.ids[Payment]
+        for index in range(self.sizes['orders']):
+            order_id, user_id = self.ids[Order] + index, self.customer_sampler.pick(rng)
+            created = self.moment(rng, 2.0)
+            count = 1 + round(rng.expovariate(1 / (mean_items - 1))) if mean_items > 1 else 1
+            lines = [(product_id, QUANTITIES.pick(rng))
+                     for product_id in self.product_sampler.distinct(rng, min(count, MAX_ITEMS_PER_ORDER))]
+            total = sum(self.prices[product_id] * quantity for product_id, quantity in lines)
+            status = ORDER_STATUSES.pick(rng)
+            orders.add(order_id, user_id, round(total, 2), status, created, created)
+            for product_id, quantity in lines:
+                items.add(item_id, order_id, product_id, self.prices[product_id], quantity, created, created)
+                item_id += 1
+            if status != 1 or rng.random() < 0.3:
+                method = rng.choice(methods)
+                payment_status = PAYMENT_STATUSES.pick(rng)
+                response = {'transaction_id': f'txn_{order_id}'} if method == 2 else None
+                payments.add(payment_id, order_id, user_id, round(total, 2), payment_status, method, response,
+                             created, created)
+                payment_id += 1
+        items.flush()
+        payments.flush()
+        return orders.written + items.written + payments.written
+
+    def generate_carts(self):
+        rng = self.rng('carts')
+        carts = self.writer(Cart, ['id', 'user_id'])
+        cart_items = self.writer(CartItem, ['id', 'cart_id', 'product_id', 'quantity'], parents=[carts])
+        item_id = self.ids[CartItem]
+        # The generated users are new, so none of them has a cart yet.
+        for index, user_id in enumerate(rng.sample(self.user_ids, min(self.sizes['carts'], len(self.user_ids)))):
+            cart_id = self.ids[Cart] + index
+            carts.add(cart_id, user_id)
+            for product_id in self.product_sampler.distinct(rng, rng.randint(1, 6)):
+                cart_items.add(item_id, cart_id, product_id, rng.randint(1, 3))
+                item_id += 1
+        cart_items.flush()
+        return carts.written + cart_items.written
+
+    def finish(self):
+        # Explicit ids leave the PostgreSQL sequences behind; move them past the generated rows.
+        statements = connection.ops.sequence_reset_sql(no_style(), GENERATED_MODELS)
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+        started = time.monotonic()
+        update_search_vectors(Product.objects.filter(pk__gte=self.ids[Product]).values('pk'))
+        self.log(f'search vectors: {time.monotonic() - started:.1f}s')
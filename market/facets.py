@@ -0,0 +1,36 @@
+from django.db.models import Count, Q
+
+
+def price_bucket_ranges(boundaries):
+    edges = [None, *boundaries, None]
+    return list(zip(edges, edges[1:]))
+
+
+def compute_facets(queryset, boundaries):
+    """
+    Facet counts for an already filtered product queryset.
+
+    One grouped query per dimension: category, sub-category and a single conditional-aggregation pass that
+    counts every price bucket at once.
+    """
+    queryset = queryset.order_by()
+    categories = queryset.values('category_id').annotate(count=Count('id')).order_by('category_id')
+    sub_categories = queryset.values('sub_category_id').annotate(count=Count('id')).order_by('sub_category_id')
+
+    ranges = price_bucket_ranges(boundaries)
+    buckets = {}
+    for index, (low, high) in enumerate(ranges):
+        condition = Q()
+        if low is not None:
+            condition &= Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        buckets[f'bucket_{index}'] = Count('id', filter=condition)
+    price_counts = queryset.aggregate(**buckets)
+
+    return {
+        'category': [{'id': row['category_id'], 'count': row['count']} for row in categories],
+        'sub_category': [{'id': row['sub_category_id'], 'count': row['count']} for row in sub_categories],
+        'price': [{'min': low, 'max': high, 'count': price_counts[f'bucket_{index}']}
+                  for index, (low, high) in enumerate(ranges)],
+    }
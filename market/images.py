@@ -0,0 +1,267 @@
+import io
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from config.workers import init_worker
+from .cache import bump_catalog_generation
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# Variant format -> (Pillow format, file extension, save options)
+IMAGE_FORMATS = {
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIRECTORY = 'variants'
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def picture_name(product_or_name):
+    name = getattr(product_or_name, 'picture', product_or_name)
+    name = getattr(name, 'name', name)
+    default = Product._meta.get_field('picture').get_default()
+    return name if name and name != default else None
+
+
+def variant_name(source, width, extension):
+    # The source extension stays in the stem, so "a.png" and "a.jpg" do not share variants.
+    directory, filename = posixpath.split(source)
+    return posixpath.join(directory, VARIANTS_DIRECTORY, f'{filename.replace(".", "_")}-{width}w.{extension}')
+
+
+def variant_widths(width, widths):
+    # Never upscale; a picture narrower than every configured width still gets one re-encoded copy.
+    return sorted({target for target in widths if target < width} or {width}, reverse=True)
+
+
+def normalize_mode(image):
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+    return image.convert('RGBA' if has_alpha else 'RGB')
+
+
+def without_alpha(image):
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def save_image(storage, name, image, image_format, quality):
+    pillow_format, _, options = IMAGE_FORMATS[image_format]
+    buffer = io.BytesIO()
+    image.save(buffer, pillow_format, quality=quality, **options)
+    # Variant names are stable, so a re-run replaces the files instead of getting a suffixed copy.
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def build_variants(source, widths=None, formats=None, quality=None, storage=None):
+    """
+    Write resized copies of the picture ``source`` and return where they are.
+
+    The result is what ``Product.picture_variants`` stores::
+
+        {"source": source, "width": 1600, "height": 1200,
+         "webp": [[1280, "product_pictures/variants/x_jpg-1280w.webp"], [640, ...], ...], "jpeg": [...]}
+
+    Widths are largest first. JPEG sources are decoded at the smallest scale that still covers the largest
+    variant (``Image.draft``), and each variant is downscaled from the previous one rather than from the
+    original.
+    """
+    widths = widths or settings.PRODUCT_IMAGE_WIDTHS
+    formats = formats or settings.PRODUCT_IMAGE_FORMATS
+    quality = quality or settings.PRODUCT_IMAGE_QUALITY
+    storage = storage or default_storage
+    with storage.open(source, 'rb') as file:
+        image = Image.open(file)
+        width, height = image.size
+        if image.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS:
+            width, height = height, width
+        largest = variant_widths(width, widths)[0]
+        scale = largest / width
+        # The size is in stored (pre-rotation) pixels; only JPEG decoders act on it.
+        image.draft('RGB', (max(round(image.size[0] * scale), 1), max(round(image.size[1] * scale), 1)))
+        image = normalize_mode(ImageOps.exif_transpose(image))
+    result = {'source': source, 'width': width, 'height': height}
+    current = image
+    for target in variant_widths(width, widths):
+        size = (target, max(round(height * target / width), 1))
+        if current.size != size:
+            current = current.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        for image_format in formats:
+            variant = without_alpha(current) if image_format == 'jpeg' else current
+            name = variant_name(source, target, IMAGE_FORMATS[image_format][1])
+            name = save_image(storage, name, variant, image_format, quality)
+            result.setdefault(image_format, []).append([target, name])
+    return result
+
+
+def picture_srcset(product, request=None):
+    """``{format: "url 1280w, url 640w, ..."}`` for the current picture, or ``{}`` until its variants exist."""
+    variants = product.picture_variants or {}
+    if not variants or variants.get('source') != picture_name(product):
+        return {}
+
+    def url(name):
+        location = default_storage.url(name)
+        return request.build_absolute_uri(location) if request is not None else location
+    return {image_format: ', '.join(f'{url(name)} {width}w' for width, name in variants[image_format])
+            for image_format in IMAGE_FORMATS if variants.get(image_format)}
+
+
+def variant_files(variants):
+    return {name for image_format in IMAGE_FORMATS for _, name in (variants or {}).get(image_format, [])}
+
+
+def process_product_picture(product_id, source):
+    """
+    Build the variants of one product picture and store them on the product; runs in a pool worker.
+
+    The update only applies while the product still has the same picture, so a slow job cannot overwrite the
+    variants of a newer upload. Files of the variants it replaces are deleted. Returns whether it applied.
+    """
+    previous = Product.objects.filter(pk=product_id).values_list('picture_variants', flat=True).first()
+    variants = build_variants(source)
+    applied = Product.objects.filter(pk=product_id, picture=source).update(picture_variants=variants)
+    if not applied:
+        stale = variant_files(variants)
+    else:
+        stale = variant_files(previous) - variant_files(variants)
+    for name in stale:
+        default_storage.delete(name)
+    return bool(applied)
+
+
+class PictureVariantPool:
+    """
+    Builds product picture variants in a pool of ``workers`` processes, off the request path.
+
+    ``submit()`` never blocks: at most ``max_pending`` pictures may be queued or running, and beyond that new
+    ones are dropped with a warning (``build_picture_variants`` picks them up later). A picture that is already
+    queued or running for the same product is not submitted again; its pending future is returned instead.
+    Finished jobs bump the catalog generation so cached product pages show the new ``srcset``. With
+    ``workers=0`` the variants are built inline.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.lock = threading.Lock()
+        self.executor = None
+        # (product id, source) -> future of the job building it; None while an inline build or a submit runs.
+        self.pending = {}
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0, 'duplicates': 0}
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),),
+                )
+            return self.executor
+
+    def claim(self, key):
+        with self.lock:
+            if key in self.pending:
+                self.counters['duplicates'] += 1
+                return False, self.pending[key]
+            self.pending[key] = None
+            return True, None
+
+    def release(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+
+    def submit(self, product_id, source):
+        key = (product_id, source)
+        claimed, future = self.claim(key)
+        if not claimed:
+            return future
+        if not self.workers:
+            try:
+                if process_product_picture(product_id, source):
+                    bump_catalog_generation()
+            except Exception:
+                logger.exception('Could not build variants of %s for product %s', source, product_id)
+            finally:
+                self.release(key)
+            return None
+        if not self.slots.acquire(blocking=False):
+            self.release(key)
+            self.count('dropped')
+            logger.warning('Picture variant queue is full, skipped %s for product %s', source, product_id)
+            return None
+        self.count('submitted')
+        try:
+            future = self.get_executor().submit(process_product_picture, product_id, source)
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for this and later jobs.
+            with self.lock:
+                self.executor = None
+            try:
+                future = self.get_executor().submit(process_product_picture, product_id, source)
+            except BaseException:
+                self.slots.release()
+                self.release(key)
+                raise
+        except BaseException:
+            self.slots.release()
+            self.release(key)
+            raise
+        with self.lock:
+            self.pending[key] = future
+        future.add_done_callback(lambda done: self.finish(done, product_id, source))
+        return future
+
+    def finish(self, future, product_id, source):
+        self.release((product_id, source))
+        self.slots.release()
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.count('failed')
+            logger.error('Could not build variants of %s for product %s', source, product_id,
+                         exc_info=future.exception())
+            return
+        self.count('completed')
+        if future.result():
+            bump_catalog_generation()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, 'workers': self.workers, 'pending': len(self.pending)}
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+picture_variant_pool = PictureVariantPool(
+    workers=settings.PRODUCT_IMAGE_WORKERS,
+    max_pending=settings.PRODUCT_IMAGE_MAX_PENDING,
+)
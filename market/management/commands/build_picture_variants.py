@@ -0,0 +1,63 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+from django.core.management.base import BaseCommand
+
+from config.workers import init_worker
+from market.cache import bump_catalog_generation
+from market.images import picture_name, process_product_picture
+from market.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Build the resized WebP/JPEG variants of product pictures that do not have them yet, in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--force', action='store_true', help='Rebuild variants that already exist')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Products read per query')
+
+    def pending(self, force, batch_size):
+        products = (Product.objects.exclude(picture__isnull=True).exclude(picture='')
+                    .order_by('pk').values_list('pk', 'picture', 'picture_variants'))
+        for pk, picture, variants in products.iterator(chunk_size=batch_size):
+            source = picture_name(picture)
+            if source and (force or (variants or {}).get('source') != source):
+                yield pk, source
+
+    def handle(self, *args, **options):
+        workers = max(options['workers'], 1)
+        self.counts = {'processed': 0, 'applied': 0, 'failed': 0}
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),),
+        )
+        with executor:
+            running = {}
+            # Keep a few jobs per worker queued instead of submitting the whole catalog up front.
+            for pk, source in self.pending(options['force'], options['batch_size']):
+                running[executor.submit(process_product_picture, pk, source)] = (pk, source)
+                if len(running) >= workers * 4:
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self.collect(future, *running.pop(future))
+            for future in as_completed(running):
+                self.collect(future, *running[future])
+        if self.counts['applied']:
+            bump_catalog_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Built variants for {self.counts["applied"]} of {self.counts["processed"]} pictures, '
+            f'{self.counts["failed"]} failed'))
+
+    def collect(self, future, pk, source):
+        self.counts['processed'] += 1
+        if future.exception() is not None:
+            self.counts['failed'] += 1
+            self.stderr.write(f'Product {pk} ({source}): {future.exception()}')
+        elif future.result():
+            self.counts['applied'] += 1
+        if self.counts['processed'] % 100 == 0:
+            self.stdout.write(f'{self.counts["processed"]} pictures processed')
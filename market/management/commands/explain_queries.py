@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from market.models import Product, Order, OrderItem, Cart, CartItem, Review, Payment
+from market.search import is_postgres
+from users.models import User
+
+INDEX_MARKERS = ('Index Scan', 'Index Only Scan', 'Bitmap Index Scan', 'USING INDEX', 'USING COVERING INDEX',
+                 'USING INTEGER PRIMARY KEY')
+
+
+def sample_id(model):
+    return model.objects.order_by('pk').values_list('pk', flat=True).first() or 1
+
+
+def endpoint_queries():
+    product = Product.objects.order_by('pk').first()
+    category_id = product.category_id if product and product.category_id else 1
+    sub_category_id = product.sub_category_id if product and product.sub_category_id else 1
+    user_id = sample_id(User)
+    queries = [
+        ('product (created_at)', Product.objects.order_by('-created_at', '-id')[:21]),
+        ('product (price)', Product.objects.order_by('price', 'id')[:21]),
+        ('product_filter', Product.objects.filter(category_id=category_id, sub_category_id=sub_category_id,
+                                                  price__gte=0, price__lte=1000).order_by('price', 'id')[:21]),
+        ('order (customers_list)', Order.objects.filter(user_id=user_id).order_by('-created_at')),
+        ('order_items_admin (per order)', OrderItem.objects.filter(order_id=sample_id(Order))),
+        ('cart items (per cart)', CartItem.objects.filter(cart_id=sample_id(Cart))),
+        ('review (per product)', Review.objects.filter(product_id=sample_id(Product)).order_by('-created_at')),
+        ('payment (per user)', Payment.objects.filter(user_id=user_id).order_by('-created_at')),
+    ]
+    if is_postgres():
+        from django.contrib.postgres.search import SearchQuery
+        from market.search import SEARCH_CONFIG
+        queries.append(('product_search', Product.objects.filter(
+            search_vector=SearchQuery('book', search_type='websearch', config=SEARCH_CONFIG))[:20]))
+    return queries
+
+
+class Command(BaseCommand):
+    help = 'Print the EXPLAIN plan of every market endpoint query and whether it uses an index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='Run EXPLAIN ANALYZE (PostgreSQL only)')
+        parser.add_argument('--disable-seqscan', action='store_true',
+                            help='SET enable_seqscan = off, so small tables still show which index would be used '
+                                 '(PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] and is_postgres() else {}
+        with transaction.atomic():
+            if options['disable_seqscan'] and is_postgres():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in endpoint_queries():
+                plan = queryset.explain(**explain_options)
+                uses_index = any(marker in plan for marker in INDEX_MARKERS)
+                style = self.style.SUCCESS if uses_index else self.style.WARNING
+                self.stdout.write(style(f'== {name}: {"index" if uses_index else "NO INDEX"}'))
+                self.stdout.write(plan)
+                self.stdout.write('')
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from market.bulk import CSV, DEFAULT_IMPORT_CHUNK_SIZE, FILE_FORMATS, detect_format, export_rows, render_export
+
+
+class Command(BaseCommand):
+    help = 'Stream every product to a CSV or JSON Lines file in the columns import_products accepts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='Write here instead of stdout')
+        parser.add_argument('--format', choices=FILE_FORMATS, help='Defaults to the output extension, then csv')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['output'], CSV)
+        chunks = render_export(export_rows(chunk_size=options['chunk_size']), file_format)
+        if not options['output']:
+            for text in chunks:
+                self.stdout.write(text, ending='')
+            return
+        with open(options['output'], 'w', encoding='utf-8', newline='') as file:
+            for text in chunks:
+                file.write(text)
+        self.stderr.write(self.style.SUCCESS(f'Exported products to {options["output"]}'))
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.carts import CART_CACHE, get_cart_store
+
+
+class Command(BaseCommand):
+    help = 'Write dirty cache-backed carts back to Cart/CartItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle', type=int, default=None,
+                            help='Only flush carts untouched for this many seconds '
+                                 '(default: CART_IDLE_FLUSH_SECONDS)')
+        parser.add_argument('--all', action='store_true', help='Flush every dirty cart, idle or not')
+
+    def handle(self, *args, **options):
+        if settings.CART_BACKEND != CART_CACHE:
+            self.stdout.write('CART_BACKEND is not "cache"; carts are already stored in the database.')
+            return
+        idle = options['idle'] if options['idle'] is not None else settings.CART_IDLE_FLUSH_SECONDS
+        if options['all']:
+            idle = None
+        flushed = get_cart_store().flush(idle=idle)
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts'))
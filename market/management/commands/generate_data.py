@@ -0,0 +1,41 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from market.datagen import DataGenerator
+
+
+class Command(BaseCommand):
+    help = ('Bulk load a synthetic shop (users, catalog, reviews, orders, payments and carts) with Zipf-skewed '
+            'popularity; the same --seed always generates the same rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--subcategories', type=int, default=200)
+        parser.add_argument('--authors', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=50000)
+        parser.add_argument('--reviews', type=int, default=500000)
+        parser.add_argument('--orders', type=int, default=1000000)
+        parser.add_argument('--order-items', type=int, default=3000000, help='Approximate total order items')
+        parser.add_argument('--carts', type=int, default=20000)
+        parser.add_argument('--days', type=int, default=730, help='How far back generated dates go')
+        parser.add_argument('--until', type=datetime.fromisoformat, help='Latest generated date (default: today)')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of product popularity')
+        parser.add_argument('--batch-size', type=int, default=50000, help='Rows per COPY / INSERT batch')
+        parser.add_argument('--password', default='password', help='Password of every generated user')
+        parser.add_argument('--keep-indexes', action='store_true',
+                            help='Load with indexes and foreign keys in place instead of rebuilding them afterwards '
+                                 '(PostgreSQL); slower, but does not lock the tables for the whole load')
+
+    def handle(self, *args, **options):
+        generator = DataGenerator(
+            seed=options['seed'], users=options['users'], categories=options['categories'],
+            subcategories=options['subcategories'], authors=options['authors'], products=options['products'],
+            reviews=options['reviews'], orders=options['orders'], order_items=options['order_items'],
+            carts=options['carts'], days=options['days'], until=options['until'], zipf_exponent=options['zipf'],
+            batch_size=options['batch_size'], password=options['password'],
+            defer_indexes=not options['keep_indexes'], log=self.stdout.write)
+        counts = generator.run()
+        self.stdout.write(self.style.SUCCESS(f'Generated {sum(counts.values())} rows'))
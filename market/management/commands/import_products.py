@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market.bulk import (DEFAULT_IMPORT_CHUNK_SIZE, FILE_FORMATS, MAX_REPORTED_ERRORS, detect_format,
+                         import_products, read_rows)
+
+
+class Command(BaseCommand):
+    help = 'Upsert products by sku from a CSV or JSON Lines file, streaming it in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FILE_FORMATS, help='Defaults to the file extension, then csv')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_IMPORT_CHUNK_SIZE)
+        parser.add_argument('--max-errors', type=int, default=MAX_REPORTED_ERRORS,
+                            help='Row errors to print; the rest are only counted')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        try:
+            file = open(options['path'], 'rb')
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            report = import_products(read_rows(file, file_format), options['chunk_size'], options['max_errors'])
+        for error in report.errors:
+            self.stderr.write(f'line {error["line"]} ({error["sku"]}): {json.dumps(error["errors"])}')
+        if report.failed > len(report.errors):
+            self.stderr.write(f'... {report.failed - len(report.errors)} more invalid rows')
+        summary = (f'{report.rows} rows: {report.created} created, {report.updated} updated, '
+                   f'{report.failed} failed')
+        if report.error:
+            raise CommandError(f'{report.error} (after {summary})')
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from market.cache import bump_catalog_generation
+from market.models import Product, Review
+from market.ratings import RATING_FIELDS, RATING_VALUES
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized rating aggregates of every product from the Review table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        histogram = {f'rating_{value}': Count('id', filter=Q(rating=value)) for value in RATING_VALUES}
+        rows = (Review.objects.filter(product__isnull=False, rating__in=RATING_VALUES)
+                .order_by()
+                .values('product_id')
+                .annotate(rating_sum=Sum('rating'), rating_count=Count('id'), **histogram))
+        total = 0
+        with transaction.atomic():
+            Product.objects.update(**{field: 0 for field in RATING_FIELDS})
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                product = Product(pk=row.pop('product_id'), **row)
+                product.rating_average = product.rating_sum / product.rating_count
+                batch.append(product)
+                if len(batch) == batch_size:
+                    Product.objects.bulk_update(batch, RATING_FIELDS)
+                    total += len(batch)
+                    batch = []
+            Product.objects.bulk_update(batch, RATING_FIELDS)
+            total += len(batch)
+            transaction.on_commit(bump_catalog_generation)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {total} products'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from market.models import Product
+from market.search import is_postgres, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.search_vector for every product in primary key batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not is_postgres():
+            self.stdout.write('Full-text search vectors are only maintained on PostgreSQL; nothing to do.')
+            return
+        batch_size = options['batch_size']
+        last_id, total = 0, 0
+        while True:
+            ids = list(Product.objects.filter(pk__gt=last_id).order_by('pk')
+                       .values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            total += update_search_vectors(ids)
+            last_id = ids[-1]
+            self.stdout.write(f'{total} products indexed')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {total} products'))
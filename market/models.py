@@ -1,4 +1,6 @@
 import textwrap
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from base_model.base_m import BaseModel
 from users.models import User
@@ -23,6 +25,14 @@ ORDER_STATUS_CHOICES = (
 )
 
 
+class SearchVectorIndex(GinIndex):
+    # GIN only exists on PostgreSQL; elsewhere (SQLite test runs) a plain index keeps table creation working.
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return models.Index.create_sql(self, model, schema_editor, using=using, **kwargs)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+
 class Category(BaseModel):
     name = models.CharField(max_length=50)
     description = models.TextField()
@@ -51,8 +61,12 @@ class Author(models.Model):
 
 
 class Product(BaseModel):
+    # Supplier stock keeping unit; the natural key bulk imports upsert on.
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=255)
     picture = models.ImageField(upload_to="product_pictures", default="default.jpg", blank=True, null=True)
+    # Resized copies of ``picture`` written by market.images; see build_variants() for the layout.
+    picture_variants = models.JSONField(default=dict, blank=True, editable=False)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='category_products',
                                  blank=True)
     sub_category = models.ForeignKey(SubCategory, on_delete=models.SET_NULL, null=True,
@@ -61,6 +75,24 @@ class Product(BaseModel):
     description = models.TextField()
     stock_quantity = models.IntegerField(default=1)
     author = models.ManyToManyField(Author, blank=True, related_name='author_products')
+    search_vector = SearchVectorField(null=True, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_average = models.FloatField(default=0, editable=False)
+    rating_1 = models.PositiveIntegerField(default=0, editable=False)
+    rating_2 = models.PositiveIntegerField(default=0, editable=False)
+    rating_3 = models.PositiveIntegerField(default=0, editable=False)
+    rating_4 = models.PositiveIntegerField(default=0, editable=False)
+    rating_5 = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['category', 'sub_category', 'price'], name='market_product_cat_sub_price'),
+            models.Index(fields=['created_at', 'id'], name='market_product_created_id'),
+            models.Index(fields=['price', 'id'], name='market_product_price_id'),
+            models.Index(fields=['rating_average', 'id'], name='market_product_rating_id'),
+            SearchVectorIndex(fields=['search_vector'], name='market_product_search_gin'),
+        ]
 
     def __str__(self):
         return self.name
@@ -72,6 +104,11 @@ class Review(BaseModel):
     comment = models.TextField()
     rating = models.IntegerField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='market_review_product_created'),
+        ]
+
     def __str__(self):
         return textwrap.shorten(self.comment, width=150, placeholder="...")
 
@@ -81,6 +118,11 @@ class Order(BaseModel):
     total_price = models.FloatField()
     status = models.IntegerField(choices=ORDER_STATUS_CHOICES, default=1)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='market_order_user_created'),
+        ]
+
     def __str__(self):
         return f"{self.user.first_name}'s order at {self.created_at}"
 
@@ -91,6 +133,11 @@ class OrderItem(BaseModel):
     quantity = models.IntegerField()
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'product'], name='market_orderitem_order_product'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} {self.quantity} {self.price}"
 
@@ -107,6 +154,11 @@ class CartItem(BaseModel):
     quantity = models.PositiveIntegerField()
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['cart', 'product'], name='market_cartitem_cart_product'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} {self.quantity}"
 
@@ -119,5 +171,11 @@ class Payment(BaseModel):
     method = models.IntegerField(choices=PAYMENT_METHOD_CHOICES, default=1)
     gateway_response = models.JSONField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='market_payment_user_created'),
+            models.Index(fields=['status', 'created_at'], name='market_payment_status_created'),
+        ]
+
     def __str__(self):
         return f"{self.order.user.first_name}'s payment with {self.amount}"
@@ -0,0 +1,94 @@
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+from .carts import get_cart_store
+from .models import Product, Order, OrderItem, CartItem
+
+LOCK_WAIT, LOCK_NOWAIT, LOCK_SKIP_LOCKED = ('wait', 'nowait', 'skip_locked')
+LOCK_MODES = (LOCK_WAIT, LOCK_NOWAIT, LOCK_SKIP_LOCKED)
+
+
+def merge_quantities(items):
+    quantities = {}
+    for item in items:
+        quantities[item['product']] = quantities.get(item['product'], 0) + item['quantity']
+    return quantities
+
+
+def reserve_stock(quantities):
+    """
+    Decrement stock for every product in one conditional ``UPDATE``.
+
+    The ``WHERE stock_quantity >= qty`` guard is evaluated per row after the row lock is taken, so if fewer
+    rows than products were updated somebody else bought the last units and the caller's transaction must
+    roll back. The catalog generation is not bumped: cached product pages carry stale stock, which the views
+    replace with live values.
+    """
+    quantity = Case(*[When(pk=product_id, then=Value(amount)) for product_id, amount in quantities.items()],
+                    output_field=IntegerField())
+    updated = (Product.objects
+               .filter(pk__in=quantities.keys(), stock_quantity__gte=quantity)
+               .update(stock_quantity=F('stock_quantity') - quantity))
+    if updated != len(quantities):
+        raise CustomAPIException(ErrorCodes.OUT_OF_STOCK)
+
+
+def create_order(user_id, quantities, prices):
+    total_price = sum(prices[product_id] * amount for product_id, amount in quantities.items())
+    order = Order.objects.create(user_id=user_id, total_price=total_price)
+    items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=product_id, quantity=amount, price=prices[product_id])
+        for product_id, amount in quantities.items()
+    ])
+    return order, items
+
+
+def place_order(user_id, items):
+    quantities = merge_quantities(items)
+    with transaction.atomic():
+        prices = dict(Product.objects.filter(pk__in=quantities.keys()).values_list('pk', 'price'))
+        if len(prices) != len(quantities):
+            raise CustomAPIException(ErrorCodes.NOT_FOUND, message='Product does not exist')
+        reserve_stock(quantities)
+        return create_order(user_id, quantities, prices)
+
+
+def lock_products(product_ids, lock=LOCK_WAIT):
+    """
+    Lock the product rows in primary key order, so concurrent checkouts always queue in the same order and
+    cannot deadlock. With ``nowait``/``skip_locked`` a contended row fails the checkout immediately instead of
+    waiting behind the other buyer.
+    """
+    products = (Product.objects
+                .select_for_update(nowait=lock == LOCK_NOWAIT, skip_locked=lock == LOCK_SKIP_LOCKED)
+                .filter(pk__in=product_ids)
+                .order_by('pk'))
+    try:
+        locked = {product_id: (price, stock) for product_id, price, stock in
+                  products.values_list('pk', 'price', 'stock_quantity')}
+    except OperationalError:
+        raise CustomAPIException(ErrorCodes.PRODUCT_BUSY)
+    if len(locked) != len(product_ids):
+        raise CustomAPIException(ErrorCodes.PRODUCT_BUSY)
+    return locked
+
+
+def checkout_cart(user_id, lock=LOCK_WAIT):
+    store = get_cart_store()
+    version = store.flush_cart(user_id)
+    with transaction.atomic():
+        rows = list(CartItem.objects.filter(cart__user_id=user_id).values('cart_id', 'product', 'quantity'))
+        if not rows:
+            raise CustomAPIException(ErrorCodes.NOT_FOUND, message='Cart is empty')
+        quantities = merge_quantities(rows)
+        locked = lock_products(quantities.keys(), lock)
+        if any(locked[product_id][1] < amount for product_id, amount in quantities.items()):
+            raise CustomAPIException(ErrorCodes.OUT_OF_STOCK)
+        reserve_stock(quantities)
+        prices = {product_id: price for product_id, (price, _) in locked.items()}
+        order, items = create_order(user_id, quantities, prices)
+        CartItem.objects.filter(cart_id=rows[0]['cart_id']).delete()
+        transaction.on_commit(lambda: store.discard(user_id, version, quantities))
+        return order, items
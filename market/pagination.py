@@ -0,0 +1,84 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+
+from django.db.models import Q
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+PRODUCT_ORDERING_FIELDS = {'created_at': 'created_at', 'price': 'price', 'rating': 'rating_average'}
+PRODUCT_ORDERING_CHOICES = tuple(prefix + name for name in PRODUCT_ORDERING_FIELDS for prefix in ('', '-'))
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a ``(field, id)`` keyset.
+
+    Every page is a ``WHERE (field, id) > (value, pk) ORDER BY field, id LIMIT n`` query, so deep pages cost
+    the same as the first one and no ``COUNT(*)`` is ever issued. Cursors are opaque base64 tokens.
+    """
+
+    def __init__(self, ordering='-created_at', page_size=DEFAULT_PAGE_SIZE):
+        self.ordering = ordering
+        self.field = PRODUCT_ORDERING_FIELDS[ordering.lstrip('-')]
+        self.descending = ordering.startswith('-')
+        self.page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        payload = json.dumps({'o': self.ordering, 'v': value, 'id': obj.pk, 'r': reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if payload['o'] != self.ordering:
+                raise ValueError(payload['o'])
+            value, pk, reverse = payload['v'], payload['id'], payload['r']
+            if type(pk) is not int or type(reverse) is not bool:
+                raise ValueError(payload)
+            return self.decode_value(value), pk, reverse
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise CustomAPIException(ErrorCodes.INVALID_INPUT, message='Invalid cursor')
+
+    def decode_value(self, value):
+        # The cursor is client input: anything but the type encode_cursor() writes would fail in the query.
+        if self.field == 'created_at':
+            if not isinstance(value, str):
+                raise ValueError(value)
+            return datetime.fromisoformat(value)
+        if type(value) not in (int, float) or not math.isfinite(value):
+            raise ValueError(value)
+        return float(value)
+
+    def paginate(self, queryset, cursor=None):
+        value, pk, reverse = self.decode_cursor(cursor) if cursor else (None, None, False)
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{prefix}{self.field}', f'{prefix}id')
+        if cursor:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field}__{lookup}': value}) | Q(**{self.field: value, f'id__{lookup}': pk}))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if reverse or has_more:
+                next_cursor = self.encode_cursor(rows[-1], reverse=False)
+            if (reverse and has_more) or (not reverse and cursor):
+                previous_cursor = self.encode_cursor(rows[0], reverse=True)
+        return rows, next_cursor, previous_cursor
@@ -9,7 +9,7 @@ def is_super_admin(func):
     def wrapper(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             raise CustomAPIException(ErrorCodes.FORBIDDEN)
-        elif request.user.role == ADMIN:
+        elif request.user.user_roles == ADMIN:
             return func(self, request, *args, **kwargs)
 
         raise CustomAPIException(ErrorCodes.FORBIDDEN)
@@ -22,7 +22,7 @@ def is_authenticated_user(func):
     def wrapper(self, request, *args, **kwargs):
         if not request.user.is_authenticated:
             raise CustomAPIException(ErrorCodes.FORBIDDEN)
-        elif request.user.role in [ADMIN, ORDINARY_USER]:
+        elif request.user.user_roles in [ADMIN, ORDINARY_USER]:
             return func(self, request, *args, **kwargs)
         raise CustomAPIException(ErrorCodes.FORBIDDEN)
 
@@ -0,0 +1,39 @@
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+from .models import Product
+
+RATING_VALUES = range(1, 6)
+RATING_FIELDS = ['rating_sum', 'rating_count', 'rating_average'] + [f'rating_{value}' for value in RATING_VALUES]
+
+
+def apply_rating(product_id, rating, sign=1):
+    """
+    Add (``sign=1``) or remove (``sign=-1``) one rating from the product aggregates in a single ``UPDATE``.
+
+    Every right-hand side reads the pre-update row, so ``rating_average`` is computed from the same values
+    the counters are moving from. The catalog generation is left alone, so cached product pages show the new
+    aggregates once they expire, at most ``CATALOG_CACHE_TIMEOUT`` seconds later.
+    """
+    if product_id is None or rating not in RATING_VALUES:
+        return
+    rating_sum = F('rating_sum') + sign * rating
+    rating_count = F('rating_count') + sign
+    histogram = f'rating_{rating}'
+    Product.objects.filter(pk=product_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_average=Coalesce(Cast(rating_sum, FloatField()) / NullIf(rating_count, 0), Value(0.0)),
+        **{histogram: F(histogram) + sign},
+    )
+
+
+def record_review_created(review):
+    apply_rating(review.product_id, review.rating)
+
+
+def record_review_updated(old_product_id, old_rating, review):
+    if (old_product_id, old_rating) == (review.product_id, review.rating):
+        return
+    apply_rating(old_product_id, old_rating, sign=-1)
+    apply_rating(review.product_id, review.rating)
@@ -0,0 +1,137 @@
+import heapq
+import math
+import re
+import threading
+from collections import defaultdict
+
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce, Concat
+
+from .cache import get_catalog_generation
+from .models import Author, Product
+
+SEARCH_CONFIG = 'simple'
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Same relative weights PostgreSQL gives to the A/B/C labels used in product_search_vector().
+FIELD_WEIGHTS = {'name': 1.0, 'authors': 0.4, 'description': 0.2}
+TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def product_search_vector():
+    author_names = (Author.objects.filter(author_products=OuterRef('pk'))
+                    .order_by()
+                    .values('author_products')
+                    .annotate(names=StringAgg(Concat('first_name', Value(' '), 'last_name'), delimiter=' '))
+                    .values('names'))
+    author_text = Coalesce(Subquery(author_names), Value(''), output_field=TextField())
+    return (SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(author_text, weight='B', config=SEARCH_CONFIG)
+            + SearchVector('description', weight='C', config=SEARCH_CONFIG))
+
+
+def update_search_vectors(product_ids=None):
+    """
+    Recompute ``Product.search_vector`` in a single ``UPDATE``.
+
+    ``product_ids`` may be a list or a values queryset; ``None`` rebuilds every product. On other databases
+    the in-process index is rebuilt lazily from the catalog generation instead, so this is a no-op there.
+    """
+    if not is_postgres():
+        return 0
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    return products.update(search_vector=product_search_vector())
+
+
+def tokenize(text):
+    return TOKEN_REGEX.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """
+    Pure-Python fallback used when the database is not PostgreSQL (SQLite test runs).
+
+    Postings map each token to ``{product_id: weighted term frequency}`` and are rebuilt whenever the catalog
+    generation changes. Queries intersect the postings of every token (AND semantics, like ``websearch``) and
+    rank with a tf-idf score.
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.postings = {}
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def build(self):
+        authors = defaultdict(list)
+        for product_id, first_name, last_name in (Product.author.through.objects
+                                                  .values_list('product_id', 'author__first_name',
+                                                               'author__last_name')
+                                                  .iterator()):
+            authors[product_id].append(f'{first_name} {last_name}')
+
+        postings = defaultdict(dict)
+        size = 0
+        for product_id, name, description in Product.objects.values_list('pk', 'name', 'description').iterator():
+            size += 1
+            fields = (('name', name), ('authors', ' '.join(authors.get(product_id, ()))),
+                      ('description', description))
+            for field, text in fields:
+                for token in tokenize(text):
+                    posting = postings[token]
+                    posting[product_id] = posting.get(product_id, 0) + FIELD_WEIGHTS[field]
+        self.postings, self.size = dict(postings), size
+
+    def ensure_current(self):
+        generation = get_catalog_generation()
+        if generation != self.generation:
+            with self.lock:
+                if generation != self.generation:
+                    self.build()
+                    self.generation = generation
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        tokens = set(tokenize(query))
+        if not tokens:
+            return []
+        self.ensure_current()
+        postings = [self.postings.get(token) for token in tokens]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        idf = [math.log(1 + self.size / len(posting)) for posting in postings]
+        scores = {product_id: sum(posting[product_id] * weight for posting, weight in zip(postings, idf))
+                  for product_id in candidates}
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+inverted_index = InvertedIndex()
+
+
+def search_products(query, limit=DEFAULT_SEARCH_LIMIT):
+    if is_postgres():
+        search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+        return list(Product.objects
+                    .filter(search_vector=search_query)
+                    .annotate(rank=SearchRank(F('search_vector'), search_query))
+                    .order_by('-rank', '-id')[:limit])
+
+    ranked = inverted_index.search(query, limit)
+    products = Product.objects.in_bulk([product_id for product_id, _ in ranked])
+    results = []
+    for product_id, rank in ranked:
+        product = products.get(product_id)
+        if product is not None:
+            product.rank = rank
+            results.append(product)
+    return results
@@ -1,8 +1,17 @@
+from django.conf import settings
 from rest_framework import serializers
 
+from market.bulk import CSV, DEFAULT_IMPORT_CHUNK_SIZE, FILE_FORMATS, MAX_IMPORT_CHUNK_SIZE
+from market.images import picture_srcset
 from market.models import Product, Category, SubCategory, Author, Review, Order, OrderItem, Cart, CartItem, Payment
+from market.orders import LOCK_MODES
+from market.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, PRODUCT_ORDERING_CHOICES
+from market.ratings import RATING_VALUES
+from market.search import DEFAULT_SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from market.streaming import DEFAULT_CHUNK_SIZE, MAX_CHUNK_SIZE
 from exceptions.error_messages import ErrorCodes
 from exceptions.exception import CustomAPIException
+from users.uploads import StreamedImageField
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,10 +25,38 @@ class SubCategorySerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'category']
 
 
+class SubCategoryTreeSerializer(serializers.ModelSerializer):
+    product_count = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = SubCategory
+        fields = ['id', 'name', 'description', 'product_count']
+
+
+class CategoryTreeSerializer(serializers.ModelSerializer):
+    sub_categories = SubCategoryTreeSerializer(many=True)
+    product_count = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Category
+        fields = ['id', 'name', 'description', 'product_count', 'sub_categories']
+
+
+class CategoryTreeParamsSerializer(serializers.Serializer):
+    counts = serializers.BooleanField(required=False, default=False)
+
+
 class ProductSerializer(serializers.ModelSerializer):
+    picture = StreamedImageField(required=False, allow_null=True)
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'price', 'category', 'description', 'stock_quantity']
+        fields = ['id', 'name', 'price', 'category', 'description', 'stock_quantity', 'rating_average',
+                  'rating_count', 'picture', 'srcset']
+
+    def get_srcset(self, product):
+        return picture_srcset(product, self.context.get('request'))
         
         
 class ProductPartialUpdateSerializer(serializers.Serializer):
@@ -45,8 +82,26 @@ class ProductFilterSerializer(serializers.Serializer):
     min_price = serializers.IntegerField(required=False)
     category_id = serializers.IntegerField(required=False)
     subcategory_id = serializers.IntegerField(required=False)
+    facets = serializers.BooleanField(required=False, default=False)
+    price_buckets = serializers.CharField(required=False)
+
+    def validate_price_buckets(self, value):
+        try:
+            boundaries = [float(boundary) for boundary in value.split(',') if boundary.strip()]
+        except ValueError:
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED,
+                                     message='price_buckets must be comma separated numbers')
+        if not boundaries or len(boundaries) > 20:
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED,
+                                     message='price_buckets must contain between 1 and 20 boundaries')
+        if any(low >= high for low, high in zip(boundaries, boundaries[1:])):
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED,
+                                     message='price_buckets must be in ascending order')
+        return boundaries
 
     def validate(self, data):
+        if data['facets'] and 'price_buckets' not in data:
+            data['price_buckets'] = list(settings.PRODUCT_PRICE_BUCKETS)
         if data.get('max_price') and data.get('min_price') and data.get('min_price') > data.get('max_price'):
             raise CustomAPIException(ErrorCodes.VALIDATION_FAILED,
                                      message='min_price must be less than max_price')
@@ -59,6 +114,57 @@ class ProductFilterSerializer(serializers.Serializer):
         return data
 
 
+class ProductPaginationSerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(required=False, default=DEFAULT_PAGE_SIZE, min_value=1,
+                                         max_value=MAX_PAGE_SIZE)
+    ordering = serializers.ChoiceField(choices=PRODUCT_ORDERING_CHOICES, required=False, default='-created_at')
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(required=False, default=DEFAULT_SEARCH_LIMIT, min_value=1,
+                                     max_value=MAX_SEARCH_LIMIT)
+
+
+class ProductSearchResultSerializer(ProductSerializer):
+    rank = serializers.FloatField(read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['rank']
+
+
+class StreamingSerializer(serializers.Serializer):
+    stream = serializers.BooleanField(required=False, default=False)
+    chunk_size = serializers.IntegerField(required=False, default=DEFAULT_CHUNK_SIZE, min_value=1,
+                                          max_value=MAX_CHUNK_SIZE)
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    sku = serializers.CharField(max_length=64)
+    name = serializers.CharField(max_length=255)
+    price = serializers.FloatField(min_value=0)
+    description = serializers.CharField(required=False, allow_blank=True)
+    stock_quantity = serializers.IntegerField(required=False, min_value=0)
+    category = serializers.CharField(required=False, allow_null=True)
+    sub_category = serializers.CharField(required=False, allow_null=True)
+    authors = serializers.ListField(child=serializers.CharField(), required=False)
+
+
+class ProductImportSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    file_format = serializers.ChoiceField(choices=FILE_FORMATS, required=False)
+    chunk_size = serializers.IntegerField(required=False, default=DEFAULT_IMPORT_CHUNK_SIZE, min_value=1,
+                                          max_value=MAX_IMPORT_CHUNK_SIZE)
+
+
+class ProductExportSerializer(serializers.Serializer):
+    # Not ``format``: DRF reads that query parameter to pick a renderer.
+    file_format = serializers.ChoiceField(choices=FILE_FORMATS, required=False, default=CSV)
+    chunk_size = serializers.IntegerField(required=False, default=DEFAULT_CHUNK_SIZE, min_value=1,
+                                          max_value=MAX_CHUNK_SIZE)
+
+
 class AuthorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Author
@@ -70,6 +176,11 @@ class ReviewSerializer(serializers.ModelSerializer):
         model = Review
         fields = ['id', 'user', 'product', 'rating', 'comment']
 
+    def validate_rating(self, rating):
+        if rating not in RATING_VALUES:
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, message='rating must be between 1 and 5')
+        return rating
+
 
 class OrderSerializer(serializers.ModelSerializer):
     class Meta:
@@ -83,6 +194,23 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'order', 'quantity', 'price']
 
 
+class OrderLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+
+
+class OrderCreateSerializer(serializers.Serializer):
+    items = OrderLineSerializer(many=True, allow_empty=False, max_length=500)
+
+
+class CheckoutSerializer(serializers.Serializer):
+    lock = serializers.ChoiceField(choices=LOCK_MODES, required=False)
+
+    def validate(self, data):
+        data.setdefault('lock', settings.CHECKOUT_LOCK_MODE)
+        return data
+
+
 class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
@@ -95,6 +223,15 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'cart', 'quantity']
 
 
+class CartLineSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=10000)
+
+
+class CartQuantitySerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(min_value=0, max_value=10000)
+
+
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
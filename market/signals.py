@@ -0,0 +1,70 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import bump_catalog_generation
+from .images import picture_name, picture_variant_pool
+from .models import Product, Category, SubCategory, Author
+from .search import is_postgres, update_search_vectors
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=SubCategory)
+@receiver(post_delete, sender=SubCategory)
+@receiver(post_save, sender=Author)
+@receiver(post_delete, sender=Author)
+@receiver(m2m_changed, sender=Product.author.through)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_generation()
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    update_search_vectors([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def build_product_picture_variants(sender, instance, **kwargs):
+    source = picture_name(instance)
+    if source and (instance.picture_variants or {}).get('source') != source:
+        transaction.on_commit(partial(picture_variant_pool.submit, instance.pk, source))
+
+
+@receiver(m2m_changed, sender=Product.author.through)
+def update_product_authors_search_vector(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        update_search_vectors([instance.pk])
+    elif pk_set:
+        update_search_vectors(list(pk_set))
+    elif action == 'post_clear':
+        update_search_vectors(getattr(instance, '_search_product_ids', []))
+
+
+@receiver(m2m_changed, sender=Product.author.through)
+def remember_author_products_before_clear(sender, instance, action, reverse, **kwargs):
+    if reverse and action == 'pre_clear' and is_postgres():
+        instance._search_product_ids = list(instance.author_products.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Author)
+def update_author_products_search_vector(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vectors(instance.author_products.values('pk'))
+
+
+@receiver(pre_delete, sender=Author)
+def remember_author_products(sender, instance, **kwargs):
+    if is_postgres():
+        instance._search_product_ids = list(instance.author_products.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Author)
+def update_deleted_author_products_search_vector(sender, instance, **kwargs):
+    update_search_vectors(getattr(instance, '_search_product_ids', []))
@@ -0,0 +1,37 @@
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+DEFAULT_CHUNK_SIZE = 2000
+MAX_CHUNK_SIZE = 10000
+
+
+def iter_json_envelope(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield ``{"result": [...], "ok": true}`` piece by piece.
+
+    The queryset is walked with ``iterator(chunk_size=...)`` (a server-side cursor on PostgreSQL) and each
+    chunk is serialized on its own, so only one chunk of rows is held in memory at a time.
+    """
+    encoder = JSONEncoder()
+    yield '{"result": ['
+    chunk = []
+    first = True
+    for obj in queryset.iterator(chunk_size=chunk_size):
+        chunk.append(obj)
+        if len(chunk) == chunk_size:
+            yield _encode_chunk(encoder, serializer_class, chunk, first)
+            first = False
+            chunk = []
+    if chunk:
+        yield _encode_chunk(encoder, serializer_class, chunk, first)
+    yield '], "ok": true}'
+
+
+def _encode_chunk(encoder, serializer_class, chunk, first):
+    items = ','.join(encoder.encode(item) for item in serializer_class(chunk, many=True).data)
+    return items if first else ',' + items
+
+
+def streaming_json_response(queryset, serializer_class, chunk_size=DEFAULT_CHUNK_SIZE):
+    return StreamingHttpResponse(iter_json_envelope(queryset, serializer_class, chunk_size),
+                                 content_type='application/json')
@@ -1,3 +1,495 @@
-from django.test import TestCase
+import base64
+import json
+import threading
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from rest_framework.test import APIClient
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+from market.bulk import import_products, read_rows
+from market.cache import get_catalog_generation
+from market.carts import CacheCartStore
+from market.facets import compute_facets
+from market.images import PictureVariantPool
+from market.models import Product, Category, SubCategory, Author, Cart, CartItem, Order, OrderItem
+from market.orders import checkout_cart, lock_products, place_order, LOCK_WAIT, LOCK_NOWAIT
+from market.pagination import KeysetPaginator
+from market.ratings import apply_rating
+from market.search import InvertedIndex
+from users.models import User, DONE, ADMIN, ORDINARY_USER
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@skipUnlessDBFeature('has_select_for_update', 'has_select_for_update_nowait')
+class CheckoutConcurrencyTest(TransactionTestCase):
+    buyers = 40
+    stock = 7
+
+    def setUp(self):
+        self.product = Product.objects.create(name='Popular', price=10, description='d', stock_quantity=self.stock)
+        self.user_ids = []
+        for index in range(self.buyers):
+            user = User.objects.create(username=f'buyer-{index}', password='password', auth_status=DONE)
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            self.user_ids.append(user.id)
+
+    def run_checkouts(self, lock):
+        outcomes = []
+        barrier = threading.Barrier(len(self.user_ids))
+
+        def buy(user_id):
+            try:
+                barrier.wait()
+                checkout_cart(user_id, lock)
+                outcomes.append('ok')
+            except CustomAPIException as exc:
+                outcomes.append(exc.detail['error_code'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user_id,)) for user_id in self.user_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def assert_not_oversold(self, sold):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock_quantity, self.stock - sold)
+        self.assertGreaterEqual(self.product.stock_quantity, 0)
+        self.assertEqual(Order.objects.count(), sold)
+        self.assertEqual(OrderItem.objects.aggregate(total=Sum('quantity'))['total'] or 0, sold)
+        self.assertEqual(CartItem.objects.count(), self.buyers - sold)
+
+    def test_waiting_checkouts_sell_exactly_the_stock(self):
+        outcomes = self.run_checkouts(LOCK_WAIT)
+        self.assertEqual(outcomes.count('ok'), self.stock)
+        self.assertEqual(outcomes.count(ErrorCodes.OUT_OF_STOCK.value), self.buyers - self.stock)
+        self.assert_not_oversold(self.stock)
+
+    def test_nowait_checkouts_fail_fast_without_overselling(self):
+        outcomes = self.run_checkouts(LOCK_NOWAIT)
+        sold = outcomes.count('ok')
+        self.assertLessEqual(sold, self.stock)
+        self.assertTrue(set(outcomes) <= {'ok', ErrorCodes.OUT_OF_STOCK.value, ErrorCodes.PRODUCT_BUSY.value})
+        self.assert_not_oversold(sold)
+
+
+def authenticated_client(username, role=ORDINARY_USER):
+    user = User.objects.create(username=username, password='password', auth_status=DONE, user_roles=role)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION='Bearer ' + user.token()['access'])
+    return client
+
+
+def make_cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index, price in enumerate([5, 3, 3, 9, 1, 3, 7]):
+            Product.objects.create(name=f'Product {index}', price=price, description='d', rating_average=index % 3)
+        self.client = authenticated_client('reader')
+
+    def expected_ids(self, ordering):
+        field = KeysetPaginator(ordering).field
+        prefix = '-' if ordering.startswith('-') else ''
+        return list(Product.objects.order_by(f'{prefix}{field}', f'{prefix}id').values_list('id', flat=True))
+
+    def test_walks_forward_and_back_through_ties(self):
+        for ordering in ('price', '-price', 'created_at', '-created_at', 'rating'):
+            paginator = KeysetPaginator(ordering, page_size=3)
+            pages, cursor = [], None
+            while True:
+                rows, cursor, previous = paginator.paginate(Product.objects.all(), cursor)
+                pages.append(([row.id for row in rows], previous))
+                if cursor is None:
+                    break
+            self.assertEqual([pk for ids, _ in pages for pk in ids], self.expected_ids(ordering))
+            self.assertEqual([len(ids) for ids, _ in pages], [3, 3, 1])
+            self.assertIsNone(pages[0][1])
+            for index in range(len(pages) - 1, 0, -1):
+                rows, _, _ = paginator.paginate(Product.objects.all(), pages[index][1])
+                self.assertEqual([row.id for row in rows], pages[index - 1][0])
+
+    def test_tampered_cursor_is_rejected(self):
+        cursors = [make_cursor({'o': 'price', 'v': value, 'id': 1, 'r': False})
+                   for value in (None, 'abc', [1], {'a': 1}, True)]
+        cursors += [make_cursor({'o': 'price', 'v': 3.0, 'id': '1', 'r': False}),
+                    make_cursor({'o': 'created_at', 'v': 3.0, 'id': 1, 'r': False}),
+                    make_cursor({'o': '-price', 'v': 3.0, 'id': 1, 'r': False}),
+                    make_cursor([1, 2]), 'not a cursor']
+        for cursor in cursors:
+            response = self.client.get('/api/v1/market/product/', {'ordering': 'price', 'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json()['error_code'], ErrorCodes.INVALID_INPUT.value)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Cached', price=10, description='d')
+        self.client = authenticated_client('reader')
+
+    def prices(self, path='/api/v1/market/product/', params=None):
+        return [product['price'] for product in self.client.get(path, params).json()['result']]
+
+    def stock(self, path):
+        return [product['stock_quantity'] for product in self.client.get(path).json()['result']]
+
+    def test_catalog_write_invalidates_cached_pages(self):
+        self.assertEqual(self.prices(), [10])
+        # A queryset update sends no signal, so the cached page is still served.
+        Product.objects.filter(pk=self.product.pk).update(price=20)
+        self.assertEqual(self.prices(), [10])
+        generation = get_catalog_generation()
+        self.product.refresh_from_db()
+        self.product.save()
+        self.assertGreater(get_catalog_generation(), generation)
+        self.assertEqual(self.prices(), [20])
+
+    def test_category_write_invalidates_filtered_pages(self):
+        category = Category.objects.create(name='Books', description='d')
+        params = {'category_id': category.pk}
+        self.assertEqual(self.prices('/api/v1/market/product_filter/', params), [])
+        Product.objects.filter(pk=self.product.pk).update(category=category)
+        self.assertEqual(self.prices('/api/v1/market/product_filter/', params), [])
+        category.save()
+        self.assertEqual(self.prices('/api/v1/market/product_filter/', params), [10])
+
+    def test_sales_keep_cached_pages_but_serve_live_stock(self):
+        self.product.stock_quantity = 5
+        self.product.save()
+        self.assertEqual(self.stock('/api/v1/market/product/'), [5])
+        self.assertEqual(self.stock('/api/v1/market/product_search/?q=cached'), [5])
+        generation = get_catalog_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(User.objects.get().pk, [{'product': self.product.pk, 'quantity': 2}])
+        self.assertEqual(get_catalog_generation(), generation)
+        self.assertEqual(self.stock('/api/v1/market/product/'), [3])
+        self.assertEqual(self.stock('/api/v1/market/product_search/?q=cached'), [3])
+
+    def test_ratings_expire_with_the_page_instead_of_invalidating_it(self):
+        self.assertEqual(self.prices(), [10])
+        generation = get_catalog_generation()
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_rating(self.product.pk, 4)
+            apply_rating(self.product.pk, 1)
+        self.assertEqual(get_catalog_generation(), generation)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_average), (2, 2.5))
+
+    @override_settings(ALLOWED_HOSTS=['shop.example.com', 'admin.example.com'])
+    def test_pages_are_cached_per_host(self):
+        for host in ('shop.example.com', 'admin.example.com', 'shop.example.com'):
+            [product] = self.client.get('/api/v1/market/product/', HTTP_HOST=host).json()['result']
+            self.assertTrue(product['picture'].startswith(f'http://{host}/'), product['picture'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SearchFallbackTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.in_name = Product.objects.create(name='Python Cookbook', price=10, description='Recipes')
+        self.in_description = Product.objects.create(name='Recipes', price=10, description='Python recipes')
+        self.by_author = Product.objects.create(name='Dune', price=10, description='Desert planet')
+        self.by_author.author.add(Author.objects.create(first_name='Frank', last_name='Herbert'))
+        self.index = InvertedIndex()
+
+    def result_ids(self, query):
+        return [product_id for product_id, _ in self.index.search(query)]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.result_ids('python'), [self.in_name.pk, self.in_description.pk])
+
+    def test_every_token_must_match(self):
+        self.assertEqual(self.result_ids('python cookbook'), [self.in_name.pk])
+        self.assertEqual(self.result_ids('python dune'), [])
+        self.assertEqual(self.result_ids('!!'), [])
+
+    def test_author_names_are_indexed(self):
+        self.assertEqual(self.result_ids('HERBERT'), [self.by_author.pk])
+
+    def test_index_is_rebuilt_after_a_catalog_write(self):
+        self.assertEqual(self.result_ids('arrakis'), [])
+        self.by_author.description = 'Arrakis'
+        self.by_author.save()
+        self.assertEqual(self.result_ids('arrakis'), [self.by_author.pk])
+
+    def test_search_endpoint(self):
+        response = authenticated_client('reader').get('/api/v1/market/product_search/', {'q': 'python'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['id'] for product in response.json()['result']],
+                         [self.in_name.pk, self.in_description.pk])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class FacetCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.books = Category.objects.create(name='Books', description='d')
+        self.games = Category.objects.create(name='Games', description='d')
+        self.novels = SubCategory.objects.create(name='Novels', description='d', category=self.books)
+        for price, category, sub_category in [(5, self.books, self.novels), (10, self.books, self.novels),
+                                              (20, self.books, None), (60, self.games, None), (8, None, None)]:
+            Product.objects.create(name='p', price=price, description='d', category=category,
+                                   sub_category=sub_category)
+
+    def test_counts_every_dimension(self):
+        facets = compute_facets(Product.objects.all(), [10, 50])
+        self.assertCountEqual(facets['category'], [{'id': self.books.pk, 'count': 3},
+                                                   {'id': self.games.pk, 'count': 1}, {'id': None, 'count': 1}])
+        self.assertCountEqual(facets['sub_category'], [{'id': self.novels.pk, 'count': 2},
+                                                       {'id': None, 'count': 3}])
+        self.assertEqual(facets['price'], [{'min': None, 'max': 10, 'count': 2}, {'min': 10, 'max': 50, 'count': 2},
+                                           {'min': 50, 'max': None, 'count': 1}])
+
+    def test_filter_endpoint_counts_the_filtered_products(self):
+        response = authenticated_client('reader').get('/api/v1/market/product_filter/', {
+            'category_id': self.books.pk, 'facets': 'true', 'price_buckets': '10,50'})
+        self.assertEqual(response.status_code, 200)
+        facets = response.json()['facets']
+        self.assertEqual(facets['category'], [{'id': self.books.pk, 'count': 3}])
+        self.assertEqual([bucket['count'] for bucket in facets['price']], [1, 2, 0])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PlaceOrderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='buyer', password='password', auth_status=DONE)
+        self.book = Product.objects.create(name='Book', price=12.5, description='d', stock_quantity=5)
+        self.pen = Product.objects.create(name='Pen', price=2, description='d', stock_quantity=1)
+
+    def stock(self):
+        return dict(Product.objects.values_list('pk', 'stock_quantity'))
+
+    def test_reserves_stock_and_prices_on_the_server(self):
+        order, items = place_order(self.user.id, [{'product': self.book.pk, 'quantity': 2},
+                                                  {'product': self.pen.pk, 'quantity': 1},
+                                                  {'product': self.book.pk, 'quantity': 1}])
+        self.assertEqual(order.total_price, 12.5 * 3 + 2)
+        self.assertEqual({(item.product_id, item.quantity, item.price) for item in items},
+                         {(self.book.pk, 3, 12.5), (self.pen.pk, 1, 2)})
+        self.assertEqual(self.stock(), {self.book.pk: 2, self.pen.pk: 0})
+
+    def test_out_of_stock_line_rolls_back_the_whole_order(self):
+        with self.assertRaises(CustomAPIException) as raised:
+            place_order(self.user.id, [{'product': self.book.pk, 'quantity': 1},
+                                       {'product': self.pen.pk, 'quantity': 2}])
+        self.assertEqual(raised.exception.detail['error_code'], ErrorCodes.OUT_OF_STOCK.value)
+        self.assertEqual(self.stock(), {self.book.pk: 5, self.pen.pk: 1})
+        self.assertFalse(Order.objects.exists())
+
+    def test_unknown_product_is_not_found(self):
+        with self.assertRaises(CustomAPIException) as raised:
+            place_order(self.user.id, [{'product': self.book.pk, 'quantity': 1}, {'product': 0, 'quantity': 1}])
+        self.assertEqual(raised.exception.detail['error_code'], ErrorCodes.NOT_FOUND.value)
+        self.assertEqual(self.stock(), {self.book.pk: 5, self.pen.pk: 1})
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class ProductImportTest(TestCase):
+    url = '/api/v1/market/product_import/'
+
+    def setUp(self):
+        cache.clear()
+        self.books = Category.objects.create(name='Books', description='d')
+        self.novels = SubCategory.objects.create(name='Novels', description='d', category=self.books)
+        self.tolstoy = Author.objects.create(first_name='Leo', last_name='Tolstoy', biography='b')
+        self.existing = Product.objects.create(sku='B-1', name='Old name', price=1, description='Kept',
+                                               stock_quantity=7, category=self.books)
+        self.existing.author.add(self.tolstoy)
+
+    def upload(self, content, name='products.csv', role=ADMIN, **data):
+        return authenticated_client(role, role).post(self.url, {
+            'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart')
+
+    def test_upserts_by_sku_and_reports_invalid_rows(self):
+        response = self.upload(
+            'sku,name,price,stock_quantity,category,sub_category,authors\n'
+            'B-1,War and Peace,15,,,,\n'
+            'B-2,Anna Karenina,12,3,books,Novels,leo  TOLSTOY\n'
+            'B-3,Bad price,-1,,,,\n'
+            'B-4,Lost,5,,Toys,,\n'
+            ',No sku,5,,,,\n', chunk_size=1)
+        self.assertEqual(response.status_code, 200)
+        report = response.json()['result']
+        self.assertEqual({key: report[key] for key in ('rows', 'created', 'updated', 'failed')},
+                         {'rows': 5, 'created': 1, 'updated': 1, 'failed': 3})
+        self.assertEqual([(error['line'], error['sku'], sorted(error['errors'])) for error in report['errors']],
+                         [(4, 'B-3', ['price']), (5, 'B-4', ['category']), (6, None, ['sku'])])
+        created = Product.objects.get(sku='B-2')
+        self.assertEqual((created.name, created.price, created.stock_quantity, created.category_id,
+                          created.sub_category_id), ('Anna Karenina', 12, 3, self.books.pk, self.novels.pk))
+        self.assertEqual(list(created.author.all()), [self.tolstoy])
+        self.assertFalse(Product.objects.filter(sku__in=['B-3', 'B-4']).exists())
+
+    def test_missing_columns_are_left_untouched(self):
+        report = import_products(read_rows(SimpleUploadedFile('p.csv', b'sku,name,price\nB-1,New name,2\n'), 'csv'))
+        self.assertEqual((report.updated, report.failed), (1, 0))
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.description,
+                          self.existing.stock_quantity, self.existing.category_id),
+                         ('New name', 2, 'Kept', 7, self.books.pk))
+        self.assertEqual(list(self.existing.author.all()), [self.tolstoy])
+
+    def test_json_lines_rows_with_different_columns(self):
+        response = self.upload('{"sku": "B-1", "name": "Renamed", "price": 3, "authors": []}\n'
+                               '{"sku": "B-5", "name": "New", "price": 4, "description": "Fresh"}\n'
+                               '[1, 2]\n', name='products.jsonl')
+        report = response.json()['result']
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 1))
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.description, self.existing.stock_quantity),
+                         ('Renamed', 'Kept', 7))
+        self.assertFalse(self.existing.author.exists())
+        self.assertEqual(Product.objects.get(sku='B-5').description, 'Fresh')
+
+    def test_catalog_cache_is_invalidated(self):
+        generation = get_catalog_generation()
+        self.upload('sku,name,price\nB-1,New name,2\n')
+        self.assertNotEqual(get_catalog_generation(), generation)
+
+    def test_header_without_required_columns_is_rejected(self):
+        response = self.upload('sku,name\nB-1,Name\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error_code'], ErrorCodes.VALIDATION_FAILED.value)
+        self.assertEqual(Product.objects.get(sku='B-1').name, 'Old name')
+
+    def test_requires_an_admin(self):
+        response = self.upload('sku,name,price\nB-1,New name,2\n', role=ORDINARY_USER)
+        self.assertEqual(response.json()['error_code'], ErrorCodes.FORBIDDEN.value)
+        self.assertEqual(Product.objects.get(sku='B-1').name, 'Old name')
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CacheCartConcurrencyTest(TransactionTestCase):
+    writers = 40
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='shopper', password='password', auth_status=DONE)
+        self.product_ids = [Product.objects.create(name=f'Product {index}', price=1, description='d').pk
+                            for index in range(self.writers)]
+        self.store = CacheCartStore()
+
+    def test_concurrent_adds_are_all_kept_and_flushed(self):
+        barrier = threading.Barrier(self.writers + 1)
+        errors = []
+
+        def add(product_id):
+            try:
+                barrier.wait()
+                self.store.add(self.user.pk, product_id, 1)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        def flush():
+            try:
+                barrier.wait()
+                for _ in range(20):
+                    self.store.flush()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add, args=(product_id,)) for product_id in self.product_ids]
+        threads.append(threading.Thread(target=flush))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = {product_id: 1 for product_id in self.product_ids}
+        self.assertEqual(self.store.get_items(self.user.pk), expected)
+        self.store.flush()
+        self.assertEqual(dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity')),
+                         expected)
+
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], CART_BACKEND='cache')
+class CacheCartCheckoutTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='shopper', password='password', auth_status=DONE)
+        self.book, self.pen, self.ink = [Product.objects.create(name=name, price=1, description='d',
+                                                                stock_quantity=10)
+                                         for name in ('Book', 'Pen', 'Ink')]
+        self.store = CacheCartStore()
+        self.store.add(self.user.pk, self.book.pk, 2)
+        self.store.add(self.user.pk, self.pen.pk, 1)
+
+    def saved_items(self):
+        return dict(CartItem.objects.filter(cart__user=self.user).values_list('product_id', 'quantity'))
+
+    def test_checkout_empties_the_cart(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order, items = checkout_cart(self.user.pk)
+        self.assertEqual({(item.product_id, item.quantity) for item in items}, {(self.book.pk, 2), (self.pen.pk, 1)})
+        self.assertEqual(self.store.get_items(self.user.pk), {})
+        self.assertEqual(self.saved_items(), {})
+
+    def test_edits_made_during_checkout_are_kept(self):
+        def edit_then_lock(product_ids, lock):
+            self.store.add(self.user.pk, self.ink.pk, 3)
+            self.store.add(self.user.pk, self.book.pk, 1)
+            return lock_products(product_ids, lock)
+
+        with mock.patch('market.orders.lock_products', side_effect=edit_then_lock):
+            with self.captureOnCommitCallbacks(execute=True):
+                order, items = checkout_cart(self.user.pk)
+        self.assertEqual({(item.product_id, item.quantity) for item in items}, {(self.book.pk, 2), (self.pen.pk, 1)})
+        remaining = {self.ink.pk: 3, self.book.pk: 1}
+        self.assertEqual(self.store.get_items(self.user.pk), remaining)
+        self.store.flush()
+        self.assertEqual(self.saved_items(), remaining)
+
+class PictureVariantPoolTest(SimpleTestCase):
+    def setUp(self):
+        self.pool = PictureVariantPool(workers=1, max_pending=4)
+        self.pool.executor = mock.Mock()
+        self.pool.executor.submit.side_effect = lambda *args: Future()
+
+    def test_pending_picture_is_not_submitted_again(self):
+        future = self.pool.submit(1, 'product_pictures/a.jpg')
+        self.assertIs(self.pool.submit(1, 'product_pictures/a.jpg'), future)
+        other = self.pool.submit(1, 'product_pictures/b.jpg')
+        self.assertIsNot(other, future)
+        self.assertEqual(self.pool.executor.submit.call_count, 2)
+        self.assertEqual(self.pool.stats()['duplicates'], 1)
+        with mock.patch('market.images.bump_catalog_generation'):
+            future.set_result(True)
+        self.assertIsNot(self.pool.submit(1, 'product_pictures/a.jpg'), future)
+        self.assertEqual(self.pool.executor.submit.call_count, 3)
+
+    def test_failed_submit_frees_the_picture(self):
+        self.pool.executor.submit.side_effect = RuntimeError('pool is shut down')
+        with self.assertRaises(RuntimeError):
+            self.pool.submit(1, 'product_pictures/a.jpg')
+        self.assertEqual(self.pool.stats()['pending'], 0)
+
+    def test_inline_build_frees_the_picture(self):
+        pool = PictureVariantPool(workers=0, max_pending=4)
+        with mock.patch('market.images.process_product_picture', return_value=False) as process:
+            pool.submit(1, 'product_pictures/a.jpg')
+            pool.submit(1, 'product_pictures/a.jpg')
+        self.assertEqual(process.call_count, 2)
+        self.assertEqual(pool.stats()['pending'], 0)
@@ -0,0 +1,46 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count, Prefetch
+from rest_framework.renderers import JSONRenderer
+
+from .cache import get_catalog_generation
+from .models import Category, SubCategory
+from .serializers import CategoryTreeSerializer
+
+
+def category_tree_etag(with_counts=False):
+    # One cheap probe over the two small tables; deletes change the row counts even when MAX(updated_at) doesn't.
+    quote = connection.ops.quote_name
+    category_table, subcategory_table = quote(Category._meta.db_table), quote(SubCategory._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT (SELECT MAX(updated_at) FROM {category_table}), (SELECT COUNT(*) FROM {category_table}), '
+            f'(SELECT MAX(updated_at) FROM {subcategory_table}), (SELECT COUNT(*) FROM {subcategory_table})')
+        stamp = list(cursor.fetchone())
+    if with_counts:
+        # Product counts move with product writes, which the catalog generation already tracks without a query.
+        stamp.append(get_catalog_generation())
+    digest = hashlib.sha1(repr((stamp, with_counts)).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def build_category_tree(with_counts=False):
+    categories = Category.objects.order_by('id')
+    subcategories = SubCategory.objects.order_by('id')
+    if with_counts:
+        categories = categories.annotate(product_count=Count('category_products'))
+        subcategories = subcategories.annotate(product_count=Count('sub_category_products'))
+    categories = categories.prefetch_related(Prefetch('sub_categories', queryset=subcategories))
+    return CategoryTreeSerializer(categories, many=True).data
+
+
+def render_category_tree(etag, with_counts=False):
+    key = f'market:category_tree:{etag}'
+    body = cache.get(key)
+    if body is None:
+        body = JSONRenderer().render({'result': build_category_tree(with_counts), 'ok': True})
+        cache.set(key, body, settings.CATALOG_CACHE_TIMEOUT)
+    return body
@@ -1,14 +1,27 @@
 from django.urls import path
-from .views import CategoryApiView, SubCategoryApiView, ProductApiView, ReviewApiView, AuthorApiView, OrderApiView
+from .views import (CategoryApiView, SubCategoryApiView, ProductApiView, ReviewApiView, AuthorApiView, OrderApiView,
+                    OrderItemApiView, CartItemApiView)
 urlpatterns = [
     path('category/', CategoryApiView.as_view({'get': 'list'}), name='category'),
+    path('category_tree/', CategoryApiView.as_view({'get': 'tree'}), name='category_tree'),
     path('subcategory/', SubCategoryApiView.as_view({'get': 'list'}), name='subcategory'),
     path('product/', ProductApiView.as_view({'get': 'list'}), name='product'),
     path('product_filter/', ProductApiView.as_view({'get': 'filter_product'}), name='product_filter'),
+    path('product_search/', ProductApiView.as_view({'get': 'search'}), name='product_search'),
+    path('product_import/', ProductApiView.as_view({'post': 'import_products'}), name='product_import'),
+    path('product_export/', ProductApiView.as_view({'get': 'export_products'}), name='product_export'),
     path('review/', ReviewApiView.as_view({'get': 'list', 'post':'create'}), name='review'),
     path('review/<int:pk>/', ReviewApiView.as_view({'put': 'update'})),
     path('author/', AuthorApiView.as_view({'get': 'list'}), name='author'),
     path('order/', OrderApiView.as_view({'get': 'customers_list', 'post':'create'}), name='order'),
+    path('order/place/', OrderApiView.as_view({'post': 'place_order'}), name='order_place'),
+    path('order/checkout/', OrderApiView.as_view({'post': 'checkout'}), name='order_checkout'),
     path('orders_admin/', OrderApiView.as_view({'get': 'list'}), name='orders_admin'),
     path('order/<int:pk>/', OrderApiView.as_view({'patch':'update', 'get':'get_order'}), name='order_detail'),
-]
\ No newline at end of file
+    path('order_items_admin/', OrderItemApiView.as_view({'get': 'list'}), name='order_items_admin'),
+    path('cart_items/', CartItemApiView.as_view({'get': 'users_list', 'post': 'create', 'delete': 'clear'}),
+         name='cart_items'),
+    path('cart_items/<int:pk>/', CartItemApiView.as_view({'put': 'update', 'delete': 'destroy'}),
+         name='cart_item_detail'),
+    path('cart_items_admin/', CartItemApiView.as_view({'get': 'list'}), name='cart_items_admin'),
+]
@@ -2,21 +2,58 @@ from drf_yasg import openapi
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.viewsets import ViewSet
+from django.db import transaction
 from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
 from exceptions.error_messages import ErrorCodes
 from exceptions.exception import CustomAPIException
 from .serializers import (
     ProductSerializer, CategorySerializer, SubCategorySerializer,
     AuthorSerializer, ReviewSerializer, OrderSerializer,
     OrderItemSerializer, CartSerializer,CartItemSerializer, 
-    ProductFilterSerializer, ProductPartialUpdateSerializer)
+    ProductFilterSerializer, ProductPartialUpdateSerializer, ProductPaginationSerializer, StreamingSerializer,
+    CategoryTreeParamsSerializer, ProductSearchSerializer, ProductSearchResultSerializer, OrderCreateSerializer,
+    CheckoutSerializer, CartLineSerializer, CartQuantitySerializer, ProductImportSerializer, ProductExportSerializer)
+from .bulk import CONTENT_TYPES, detect_format, export_rows, import_products, read_rows, render_export
+from .cache import cached_catalog
+from .carts import get_cart_store, cart_lines
+from .facets import compute_facets
+from .orders import place_order, checkout_cart
+from .pagination import KeysetPaginator, PRODUCT_ORDERING_CHOICES
+from .ratings import record_review_created, record_review_updated
+from .search import search_products
+from .streaming import streaming_json_response
+from .tree import category_tree_etag, render_category_tree
 from .permissions import is_super_admin, is_authenticated_user
+from users.authentication import ClaimsJWTAuthentication
+from users.uploads import streamed_upload
 from .models import (Category, Product, SubCategory, 
     Review, Author, Order, OrderItem, Cart, CartItem)
 from drf_yasg.utils import swagger_auto_schema
 
+STREAMING_PARAMETERS = [
+    openapi.Parameter(name='stream', in_=openapi.IN_QUERY, description='Stream the list in chunks',
+                      type=openapi.TYPE_BOOLEAN),
+    openapi.Parameter(name='chunk_size', in_=openapi.IN_QUERY, description='Rows fetched per chunk when streaming',
+                      type=openapi.TYPE_INTEGER),
+]
+
+
+def bulk_list_response(request, queryset, serializer_class):
+    serializer_params = StreamingSerializer(data=request.query_params)
+    if not serializer_params.is_valid():
+        raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer_params.errors)
+    if serializer_params.validated_data['stream']:
+        return streaming_json_response(queryset.order_by('id'), serializer_class,
+                                       serializer_params.validated_data['chunk_size'])
+    return Response(data={'result': serializer_class(queryset, many=True).data, 'ok': True},
+                    status=status.HTTP_200_OK)
+
 
 class CategoryApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
         operation_summary='List of categories',
         operation_description='List of categories', responses={
@@ -37,11 +74,51 @@ class CategoryApiView(ViewSet):
         return Response(
             data={'result': CategorySerializer(categories, many=True, context={'request': request}).data, 'ok': True},
             status=status.HTTP_200_OK)
-    
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(name='counts', in_=openapi.IN_QUERY, description='Include product counts per node',
+                              type=openapi.TYPE_BOOLEAN),
+        ],
+        operation_summary='Category tree',
+        operation_description='Categories with their subcategories nested. Supports If-None-Match.', responses={
+            200: openapi.Response(description='Category tree', examples={
+                'application/json': [{
+                    'id': openapi.TYPE_INTEGER,
+                    'name': openapi.TYPE_STRING,
+                    'description': openapi.TYPE_STRING,
+                    'product_count': openapi.TYPE_INTEGER,
+                    'sub_categories': [{
+                        'id': openapi.TYPE_INTEGER,
+                        'name': openapi.TYPE_STRING,
+                        'description': openapi.TYPE_STRING,
+                        'product_count': openapi.TYPE_INTEGER,
+                    }],
+                }]
+            }),
+            304: openapi.Response(description='Not modified'),
+        },
+        tags=['Category']
+    )
+    @is_authenticated_user
+    def tree(self, request):
+        serializer_params = CategoryTreeParamsSerializer(data=request.query_params)
+        if not serializer_params.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer_params.errors)
+        with_counts = serializer_params.validated_data['counts']
+        etag = category_tree_etag(with_counts)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(render_category_tree(etag, with_counts), content_type='application/json')
+        response['ETag'] = etag
+        return response
+
     # need create/ update/ retrieve
 
 
 class SubCategoryApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
         operation_summary='List of subcategories',
         operation_description='List of subcategories', responses={
@@ -64,39 +141,96 @@ class SubCategoryApiView(ViewSet):
                   'ok': True}, status=status.HTTP_200_OK)
 
 
+PAGINATION_PARAMETERS = [
+    openapi.Parameter(name='cursor', in_=openapi.IN_QUERY, description='Opaque cursor from a previous page',
+                      type=openapi.TYPE_STRING),
+    openapi.Parameter(name='page_size', in_=openapi.IN_QUERY, description='Page size (1-100)',
+                      type=openapi.TYPE_INTEGER),
+    openapi.Parameter(name='ordering', in_=openapi.IN_QUERY, description='Ordering of products',
+                      type=openapi.TYPE_STRING, enum=list(PRODUCT_ORDERING_CHOICES)),
+]
+
+
+def product_filter_q(filters):
+    filter_ = Q()
+    if filters.get('category_id'):
+        filter_ &= Q(category_id=filters['category_id'])
+    if filters.get('subcategory_id'):
+        filter_ &= Q(sub_category_id=filters['subcategory_id'])
+    if filters.get('max_price'):
+        filter_ &= Q(price__lte=filters['max_price'])
+    if filters.get('min_price'):
+        filter_ &= Q(price__gte=filters['min_price'])
+    return filter_
+
+
 class ProductApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    @staticmethod
+    def pagination_params(request):
+        serializer_params = ProductPaginationSerializer(data=request.query_params)
+        if not serializer_params.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer_params.errors)
+        return serializer_params.validated_data
+
+    @staticmethod
+    def paginate(request, queryset, pagination):
+        paginator = KeysetPaginator(ordering=pagination['ordering'], page_size=pagination['page_size'])
+        products, next_cursor, previous_cursor = paginator.paginate(queryset, pagination.get('cursor'))
+        return {'result': ProductSerializer(products, many=True, context={'request': request}).data,
+                'next': next_cursor, 'previous': previous_cursor}
+
+    @staticmethod
+    def with_live_stock(products):
+        # Stock moves with every sale, so it is read per request instead of being cached with the page.
+        stock = dict(Product.objects.filter(pk__in=[product['id'] for product in products])
+                     .values_list('pk', 'stock_quantity'))
+        return [{**product, 'stock_quantity': stock.get(product['id'], product['stock_quantity'])}
+                for product in products]
+
     @swagger_auto_schema(
+        manual_parameters=PAGINATION_PARAMETERS,
         operation_summary='List of products',
-        operation_description='List of products', responses={
+        operation_description='List of products, paginated with opaque next/previous cursors', responses={
             200: openapi.Response(description='List of products', examples={
-                'application/json': [{
-                    'id': openapi.TYPE_INTEGER,
-                    'name': openapi.TYPE_STRING,
-                    'description': openapi.TYPE_STRING,
-                    'category_id': openapi.TYPE_INTEGER,
-                    'price': openapi.TYPE_INTEGER,
-                    'subcategory_id': openapi.TYPE_INTEGER,
-                    'picture': openapi.TYPE_STRING,
-                    'stock_quantity': openapi.TYPE_INTEGER,
-                    'author': openapi.TYPE_STRING,
-                }]
+                'application/json': {
+                    'result': [{
+                        'id': openapi.TYPE_INTEGER,
+                        'name': openapi.TYPE_STRING,
+                        'description': openapi.TYPE_STRING,
+                        'category_id': openapi.TYPE_INTEGER,
+                        'price': openapi.TYPE_INTEGER,
+                        'subcategory_id': openapi.TYPE_INTEGER,
+                        'picture': openapi.TYPE_STRING,
+                        'srcset': {'webp': openapi.TYPE_STRING, 'jpeg': openapi.TYPE_STRING},
+                        'stock_quantity': openapi.TYPE_INTEGER,
+                        'author': openapi.TYPE_STRING,
+                    }],
+                    'next': openapi.TYPE_STRING,
+                    'previous': openapi.TYPE_STRING,
+                }
             })
         },
         tags=['Product']
     )
     @is_authenticated_user
     def list(self, request):
-        products = Product.objects.all()
-        return Response(
-            data={'result': ProductSerializer(products, many=True, context={'request': request}).data, 'ok': True},
-            status=status.HTTP_200_OK)
+        pagination = self.pagination_params(request)
+        page = cached_catalog('product_list', pagination,
+                              lambda: self.paginate(request, Product.objects.all(), pagination), request)
+        page['result'] = self.with_live_stock(page['result'])
+        return Response(data={**page, 'ok': True}, status=status.HTTP_200_OK)
+
     @swagger_auto_schema(
         manual_parameters=[
             openapi.Parameter(name='max_price', in_=openapi.IN_QUERY, description='Maximum price of product', type=openapi.TYPE_NUMBER),
             openapi.Parameter(name='min_price', in_=openapi.IN_QUERY, description='Minimum price of product', type=openapi.TYPE_NUMBER),
             openapi.Parameter(name='category_id', in_=openapi.IN_QUERY, description='Category id', type=openapi.TYPE_INTEGER),
             openapi.Parameter(name='subcategory_id', in_=openapi.IN_QUERY, description='Subcategory id', type=openapi.TYPE_INTEGER),
-        ],
+            openapi.Parameter(name='facets', in_=openapi.IN_QUERY, description='Include category, subcategory and price facet counts', type=openapi.TYPE_BOOLEAN),
+            openapi.Parameter(name='price_buckets', in_=openapi.IN_QUERY, description='Comma separated price bucket boundaries, e.g. 10,50,100', type=openapi.TYPE_STRING),
+        ] + PAGINATION_PARAMETERS,
         operation_summary='Filtered products',
         operation_description='Filtered products by price and categories',
         responses={200: ProductSerializer(many=True)},
@@ -104,28 +238,99 @@ class ProductApiView(ViewSet):
     )
     @is_authenticated_user
     def filter_product(self, request):
-        serializer_params = ProductFilterSerializer(request.query_params, context={'request': request})
+        serializer_params = ProductFilterSerializer(data=request.query_params, context={'request': request})
         if not serializer_params.is_valid():
             raise CustomAPIException(ErrorCodes.NOT_FOUND, serializer_params.errors)
-        max_price = serializer_params.validated_data.get('max_price')
-        min_price = serializer_params.validated_data.get('min_price')
-        category_id = serializer_params.validated_data.get('category_id')
-        subcategory_id = serializer_params.validated_data.get('subcategory_id')
-        filter_ = Q()
-        if category_id:
-            filter_ &= Q(category_id=category_id)
-        if subcategory_id:
-            filter_ &= Q(subcategory_id=subcategory_id)
-        if max_price:
-            filter_ &= Q(price__gte=max_price)
-        if min_price:
-            filter_ &= Q(price__lte=min_price)
-        products = Product.objects.filter(filter_)
-        return Response(
-            data={'result': ProductSerializer(products, many=True, context={'request': request}).data,
-                  'ok': True}, status=status.HTTP_200_OK
-        )
+        filters = serializer_params.validated_data
+        pagination = self.pagination_params(request)
+        products = Product.objects.filter(product_filter_q(filters))
+
+        def build_page():
+            page = self.paginate(request, products, pagination)
+            if filters['facets']:
+                page['facets'] = compute_facets(products, filters['price_buckets'])
+            return page
+
+        page = cached_catalog('product_filter', {**filters, **pagination}, build_page, request)
+        page['result'] = self.with_live_stock(page['result'])
+        return Response(data={**page, 'ok': True}, status=status.HTTP_200_OK)
     
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(name='q', in_=openapi.IN_QUERY, description='Search query', type=openapi.TYPE_STRING,
+                              required=True),
+            openapi.Parameter(name='limit', in_=openapi.IN_QUERY, description='Maximum number of results (1-100)',
+                              type=openapi.TYPE_INTEGER),
+        ],
+        operation_summary='Search products',
+        operation_description='Full-text search over product name, description and author names, best match first',
+        responses={200: ProductSearchResultSerializer(many=True)},
+        tags=['Product']
+    )
+    @is_authenticated_user
+    def search(self, request):
+        serializer_params = ProductSearchSerializer(data=request.query_params)
+        if not serializer_params.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer_params.errors)
+        query = serializer_params.validated_data['q']
+        limit = serializer_params.validated_data['limit']
+        result = cached_catalog('product_search', serializer_params.validated_data,
+                                lambda: ProductSearchResultSerializer(search_products(query, limit), many=True,
+                                                                      context={'request': request}).data,
+                                request)
+        return Response(data={'result': self.with_live_stock(result), 'ok': True}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary='Import products',
+        operation_description='Upsert products by sku from a CSV or JSON Lines file. Category, sub-category and '
+                              'author names are resolved to existing rows; invalid rows are reported and skipped.',
+        request_body=ProductImportSerializer,
+        responses={200: openapi.Response(description='Import report', examples={
+            'application/json': {
+                'result': {
+                    'rows': openapi.TYPE_INTEGER,
+                    'created': openapi.TYPE_INTEGER,
+                    'updated': openapi.TYPE_INTEGER,
+                    'failed': openapi.TYPE_INTEGER,
+                    'errors': [{'line': openapi.TYPE_INTEGER, 'sku': openapi.TYPE_STRING,
+                                'errors': openapi.TYPE_OBJECT}],
+                    'errors_truncated': openapi.TYPE_BOOLEAN,
+                    'error': openapi.TYPE_STRING,
+                },
+                'ok': True,
+            }
+        })},
+        tags=['Product']
+    )
+    @is_super_admin
+    def import_products(self, request):
+        serializer = ProductImportSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer.errors)
+        upload = serializer.validated_data['file']
+        file_format = serializer.validated_data.get('file_format') or detect_format(upload.name)
+        report = import_products(read_rows(upload, file_format), serializer.validated_data['chunk_size'])
+        if report.error and not report.written:
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, message=report.error)
+        return Response(data={'result': report.as_dict(), 'ok': True}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        query_serializer=ProductExportSerializer,
+        operation_summary='Export products',
+        operation_description='Stream every product as CSV or JSON Lines, in the columns the import accepts',
+        tags=['Product']
+    )
+    @is_super_admin
+    def export_products(self, request):
+        serializer_params = ProductExportSerializer(data=request.query_params)
+        if not serializer_params.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer_params.errors)
+        file_format = serializer_params.validated_data['file_format']
+        chunks = export_rows(chunk_size=serializer_params.validated_data['chunk_size'])
+        response = StreamingHttpResponse(render_export(chunks, file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
     @swagger_auto_schema(
         operation_summary='Create product',
         operation_description='Create product',
@@ -134,6 +339,7 @@ class ProductApiView(ViewSet):
         tags=['Product']
     )
     @is_super_admin
+    @streamed_upload
     def create(self, request):
         serializer = ProductSerializer(data=request.data)
         if not serializer.is_valid():
@@ -160,6 +366,8 @@ class ProductApiView(ViewSet):
 
 
 class ReviewApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
         operation_summary='List of reviews',
         operation_description='List of reviews', responses={
@@ -195,7 +403,9 @@ class ReviewApiView(ViewSet):
         serializer = ReviewSerializer(data=data, context={'request': request})
         if not serializer.is_valid():
             raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer.errors)
-        serializer.save()
+        with transaction.atomic():
+            review = serializer.save()
+            record_review_created(review)
         return Response(data={'result': serializer.data, 'ok': True}, status=status.HTTP_201_CREATED)
 
     @swagger_auto_schema(
@@ -215,13 +425,19 @@ class ReviewApiView(ViewSet):
         serializer = ReviewSerializer(review, data=data, partial=True)
         if not serializer.is_valid():
             raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer.errors)
-        serializer.save()
+        old_product_id, old_rating = review.product_id, review.rating
+        with transaction.atomic():
+            review = serializer.save()
+            record_review_updated(old_product_id, old_rating, review)
         return Response(data={'result': serializer.data, 'ok': True}, status=status.HTTP_200_OK)
 
 
 
 class AuthorApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
+        manual_parameters=STREAMING_PARAMETERS,
         operation_summary='List of authors',
         operation_description='List of authors', responses={
             200: openapi.Response(description='List of authors', examples={
@@ -238,16 +454,16 @@ class AuthorApiView(ViewSet):
     )
     @is_super_admin
     def list(self, request):
-        authors = Author.objects.all()
-        return Response(
-            data={'result': AuthorSerializer(authors, many=True).data, 'ok': True}, status=status.HTTP_200_OK
-        )
+        return bulk_list_response(request, Author.objects.all(), AuthorSerializer)
     
     # need create/ update
 
 
 class OrderApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
+        manual_parameters=STREAMING_PARAMETERS,
         operation_summary='List of orders for Admins',
         operation_description='List of orders for Admins', responses={
             200: openapi.Response(description='List of orders for Admins', examples={
@@ -263,10 +479,7 @@ class OrderApiView(ViewSet):
     )
     @is_super_admin
     def list(self, request):
-        orders = Order.objects.all()
-        return Response(
-            data={'result': OrderSerializer(orders, many=True).data, 'ok': True}, status=status.HTTP_200_OK
-        )
+        return bulk_list_response(request, Order.objects.all(), OrderSerializer)
 
     @swagger_auto_schema(
         operation_summary='List of orders for Users',
@@ -306,6 +519,42 @@ class OrderApiView(ViewSet):
         serializer.save()
         return Response(data={'result': serializer.data, 'ok': True}, status=status.HTTP_201_CREATED)
 
+    @swagger_auto_schema(
+        operation_summary='Place order',
+        operation_description='Create an order with its items in one request. Prices and the total are '
+                              'computed on the server and stock is reserved atomically.',
+        request_body=OrderCreateSerializer,
+        responses={201: OrderSerializer()},
+        tags=['Order']
+    )
+    @is_authenticated_user
+    def place_order(self, request):
+        serializer = OrderCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer.errors)
+        order, items = place_order(request.user.id, serializer.validated_data['items'])
+        result = OrderSerializer(order).data
+        result['items'] = OrderItemSerializer(items, many=True).data
+        return Response(data={'result': result, 'ok': True}, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        operation_summary='Checkout',
+        operation_description='Turn the caller\'s cart into an order. lock=nowait or lock=skip_locked fails fast '
+                              'when another checkout holds the same products; lock=wait queues behind it.',
+        request_body=CheckoutSerializer,
+        responses={201: OrderSerializer()},
+        tags=['Order']
+    )
+    @is_authenticated_user
+    def checkout(self, request):
+        serializer = CheckoutSerializer(data=request.data)
+        if not serializer.is_valid():
+            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED, serializer.errors)
+        order, items = checkout_cart(request.user.id, serializer.validated_data['lock'])
+        result = OrderSerializer(order).data
+        result['items'] = OrderItemSerializer(items, many=True).data
+        return Response(data={'result': result, 'ok': True}, status=status.HTTP_201_CREATED)
+
     @swagger_auto_schema(
         operation_summary='Order update',
         operation_description='Order update',
@@ -343,7 +592,10 @@ class OrderApiView(ViewSet):
 
 
 class OrderItemApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
+        manual_parameters=STREAMING_PARAMETERS,
         operation_summary='Orders list for admins',
         operation_description='Orders list for admins', responses={
             200: openapi.Response(description='Orders list for admins', examples={
@@ -358,12 +610,13 @@ class OrderItemApiView(ViewSet):
     )
     @is_super_admin
     def list(self, request):
-        order_items = OrderItem.objects.all()
-        return Response(data={'result': OrderItemSerializer(order_items, many=True).data, 'ok': True}, status=status.HTTP_200_OK)
+        return bulk_list_response(request, OrderItem.objects.all(), OrderItemSerializer)
     
 
 
 class CartApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
         operation_summary='Carts list',
         operation_description='Carts list', responses={
@@ -399,7 +652,10 @@ class CartApiView(ViewSet):
 
 
 class CartItemApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
     @swagger_auto_schema(
+        manual_parameters=STREAMING_PARAMETERS,
         operation_summary='CartItems list',
         operation_description='CartItems list', responses={
             200: openapi.Response(description='CartItems list', examples={
@@ -414,40 +670,80 @@ class CartItemApiView(ViewSet):
     )
     @is_super_admin
     def list(self, request):
-        cart_items = CartItem.objects.all()
-        return Response(data={'result': CartItemSerializer(cart_items, many=True).data, 'ok': True}, status=status.HTTP_200_OK)
+        return bulk_list_response(request, CartItem.objects.all(), CartItemSerializer)
 
     @swagger_auto_schema(
         operation_summary='User\'s CartItem list',
-        operation_description = 'User\'s CartItem list', responses={
-        200: openapi.Response(description='User\'s CartItem list', examples={
-            'application/json': [{
-                'id': openapi.TYPE_INTEGER,
-                'quantity': openapi.TYPE_INTEGER,
-                'product_id': openapi.TYPE_INTEGER,
-                'cart_id': openapi.TYPE_INTEGER,
-            }]
-        })
-    }
+        operation_description='User\'s CartItem list', responses={
+            200: openapi.Response(description='User\'s CartItem list', examples={
+                'application/json': [{
+                    'product': openapi.TYPE_INTEGER,
+                    'quantity': openapi.TYPE_INTEGER,
+                }]
+            })
+        },
+        tags=['CartItem']
     )
     @is_authenticated_user
     def users_list(self, request):
-        cart_items = CartItem.objects.filter(user_id=request.user.id)
-        return Response(data={'result': CartItemSerializer(cart_items, many=True).data, 'ok': True}, status=status.HTTP_200_OK)
+        items = get_cart_store().get_items(request.user.id)
+        return Response(data={'result': cart_lines(items), 'ok': True}, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
         operation_summary='Cart Item create',
-        operation_description='Cart Item create',
-        request_body = CartItemSerializer,
-        responses={201: CartItemSerializer()},
-        tags = ['CartItem']
+        operation_description='Add a product to the caller\'s cart; the quantity is added to any already there.',
+        request_body=CartLineSerializer,
+        responses={201: CartLineSerializer(many=True)},
+        tags=['CartItem']
     )
     @is_authenticated_user
     def create(self, request):
-        data = request.data
-        data['user_id'] = request.user.id
-        serializer = CartItemSerializer(data=data, context={'request': request})
+        serializer = CartLineSerializer(data=request.data)
         if not serializer.is_valid():
             raise CustomAPIException(ErrorCodes.INVALID_INPUT, serializer.errors)
-        serializer.save()
-        return Response(data={'result': serializer.data, 'ok': True}, status=status.HTTP_201_CREATED)
+        product_id = serializer.validated_data['product']
+        if not Product.objects.filter(pk=product_id).exists():
+            raise CustomAPIException(ErrorCodes.NOT_FOUND, message='Product does not exist')
+        items = get_cart_store().add(request.user.id, product_id, serializer.validated_data['quantity'])
+        return Response(data={'result': cart_lines(items), 'ok': True}, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        operation_summary='Cart Item update',
+        operation_description='Set the quantity of a product in the caller\'s cart; 0 removes it.',
+        request_body=CartQuantitySerializer,
+        responses={200: CartLineSerializer(many=True)},
+        tags=['CartItem']
+    )
+    @is_authenticated_user
+    def update(self, request, pk):
+        serializer = CartQuantitySerializer(data=request.data)
+        if not serializer.is_valid():
+            raise CustomAPIException(ErrorCodes.INVALID_INPUT, serializer.errors)
+        store = get_cart_store()
+        quantity = serializer.validated_data['quantity']
+        if quantity and pk not in store.get_items(request.user.id):
+            raise CustomAPIException(ErrorCodes.NOT_FOUND, message='Product is not in the cart')
+        items = store.set(request.user.id, pk, quantity)
+        return Response(data={'result': cart_lines(items), 'ok': True}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary='Cart Item delete',
+        operation_description='Remove a product from the caller\'s cart',
+        responses={200: CartLineSerializer(many=True)},
+        tags=['CartItem']
+    )
+    @is_authenticated_user
+    def destroy(self, request, pk):
+        items = get_cart_store().remove(request.user.id, pk)
+        return Response(data={'result': cart_lines(items), 'ok': True}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary='Cart clear',
+        operation_description='Remove every product from the caller\'s cart',
+        responses={200: CartLineSerializer(many=True)},
+        tags=['CartItem']
+    )
+    @is_authenticated_user
+    def clear(self, request):
+        items = get_cart_store().clear(request.user.id)
+        return Response(data={'result': cart_lines(items), 'ok': True}, status=status.HTTP_200_OK)
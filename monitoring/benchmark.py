@@ -0,0 +1,323 @@
+import io
+import random
+import resource
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import ExitStack
+
+from django.contrib.auth.hashers import make_password
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from PIL import Image
+from rest_framework.test import APIClient
+
+from market.carts import get_cart_store
+from market.models import Author, Category, Order, Product, Review, SubCategory
+from market.ratings import record_review_created
+from market.search import update_search_vectors
+from users.mailer import percentile
+from users.models import ADMIN, DONE, VIA_EMAIL, VIA_PHONE, User
+
+ROUTE_MODULES = ('users.urls', 'market.urls')
+PASSWORD = 'Bench-password-1'
+
+
+class Route:
+    def __init__(self, template, method, view, action):
+        self.template = template
+        self.method = method
+        self.view = view
+        self.action = action
+
+    @property
+    def key(self):
+        return f'{self.method.upper()} {self.template}'
+
+    def path(self, **kwargs):
+        path = self.template
+        for name, value in kwargs.items():
+            path = path.replace(f'<int:{name}>', str(value))
+        return path
+
+
+def discover_routes():
+    """Every (path, method) pair served by ``users.urls`` and ``market.urls``, in URLconf order."""
+    routes = []
+    for resolver in get_resolver().url_patterns:
+        if not isinstance(resolver, URLResolver):
+            continue
+        if getattr(resolver.urlconf_module, '__name__', None) not in ROUTE_MODULES:
+            continue
+        prefix = '/' + str(resolver.pattern)
+        for pattern in resolver.url_patterns:
+            callback = pattern.callback
+            for method, action in callback.actions.items():
+                routes.append(Route(prefix + str(pattern.pattern), method, callback.cls.__name__, action))
+    return routes
+
+
+class Dataset:
+    def __init__(self, users, admin, products, reviews, orders):
+        self.users = users
+        self.admin = admin
+        self.products = products
+        self.reviews = reviews
+        self.orders = orders
+        self.access = {user.pk: user.token()['access'] for user in users + [admin]}
+
+    def user(self, worker):
+        return self.users[worker % len(self.users)]
+
+
+def seed_dataset(users=20, products=1000, categories=10):
+    """Create a catalog and ``users`` verified customers, each with a review, an order and a cart line."""
+    password = make_password(PASSWORD)
+    category_objects = Category.objects.bulk_create(
+        [Category(name=f'Category {index}', description='Benchmark category') for index in range(categories)])
+    subcategories = SubCategory.objects.bulk_create([
+        SubCategory(name=f'Subcategory {category.pk}-{index}', description='Benchmark subcategory',
+                    category=category)
+        for category in category_objects for index in range(3)])
+    authors = Author.objects.bulk_create(
+        [Author(first_name=f'Author{index}', last_name='Bench') for index in range(20)])
+    product_objects = Product.objects.bulk_create([
+        Product(name=f'Product {index} {random.choice(["red", "blue", "green"])} widget',
+                description=f'Benchmark product number {index}', price=random.randint(1, 1000),
+                stock_quantity=1000000, category=subcategory.category, sub_category=subcategory)
+        for index, subcategory in enumerate(random.choices(subcategories, k=products))])
+    Product.author.through.objects.bulk_create([
+        Product.author.through(product_id=product.pk, author_id=random.choice(authors).pk)
+        for product in product_objects])
+    update_search_vectors()
+
+    tag = uuid.uuid4().hex[:8]
+    user_objects = User.objects.bulk_create([
+        User(username=f'bench_{tag}_{index}', email=f'bench_{tag}_{index}@example.com', password=password,
+             auth_types=VIA_EMAIL, auth_status=DONE)
+        for index in range(users)])
+    admin = User.objects.create(username=f'bench_{tag}_admin', password=password, auth_types=VIA_PHONE,
+                                auth_status=DONE, user_roles=ADMIN)
+    reviews, orders = {}, {}
+    for user in user_objects:
+        review = Review.objects.create(user=user, product=random.choice(product_objects), rating=5,
+                                       comment='Benchmark review')
+        record_review_created(review)
+        reviews[user.pk] = review.pk
+        orders[user.pk] = Order.objects.create(user=user, total_price=0).pk
+        get_cart_store().add(user.pk, random.choice(product_objects).pk, 1)
+    return Dataset(user_objects, admin, [product.pk for product in product_objects], reviews, orders)
+
+
+def png_upload():
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 30, 30)).save(buffer, 'PNG')
+    buffer.seek(0)
+    buffer.name = 'bench.png'
+    return buffer
+
+
+def csv_upload(rows=50):
+    lines = ['sku,name,price,stock_quantity']
+    lines += [f'BENCH-{uuid.uuid4().hex[:12]},Imported product {index},{random.randint(1, 1000)},10'
+              for index in range(rows)]
+    buffer = io.BytesIO(('\n'.join(lines) + '\n').encode())
+    buffer.name = 'bench.csv'
+    return buffer
+
+
+def cart_product(dataset, user):
+    store = get_cart_store()
+    items = store.get_items(user.pk)
+    if not items:
+        items = store.add(user.pk, random.choice(dataset.products), 1)
+    return next(iter(items))
+
+
+def checkout_call(dataset, user):
+    cart_product(dataset, user)
+    return user, {}, {}, 'json'
+
+
+# Each scenario builds one call for a worker's user: (token owner or None, path kwargs, data, format). ``data``
+# is the query string of GET requests and the body of the others. Scenarios run before the timed request, so
+# preparing state (a fresh refresh token, a cart line) is not measured.
+SCENARIOS = {
+    # LoginApiView keeps the default IsAuthenticated permission, so login is called with a valid token.
+    ('LoginApiView', 'login'): lambda d, user: (
+        user, {}, {'user_input': user.username, 'password': PASSWORD}, 'json'),
+    ('LoginApiView', 'refresh'): lambda d, user: (user, {}, {'refresh': user.token()['refresh_token']}, 'json'),
+    ('LogoutApiView', 'logout'): lambda d, user: (user, {}, {'refresh': user.token()['refresh_token']}, 'json'),
+    ('SignUpApiView', 'create'): lambda d, user: (
+        None, {}, {'email_phone_number': f'signup_{uuid.uuid4().hex}@example.com'}, 'json'),
+    ('VerifyApiView', 'verify_code'): lambda d, user: (
+        user, {}, {'verify_code': user.create_verify_code(VIA_EMAIL)}, 'json'),
+    ('NewVerifyCodeApiView', 'get_new_code'): lambda d, user: (user, {}, None, None),
+    ('ChangeUserInformationApiView', 'update'): lambda d, user: (
+        user, {}, {'first_name': 'Bench', 'last_name': 'Marker', 'username': user.username, 'password': PASSWORD,
+                   'confirm_password': PASSWORD}, 'json'),
+    ('ChangeUserInformationApiView', 'partial_update'): lambda d, user: (
+        user, {}, {'first_name': 'Benchmark'}, 'json'),
+    ('ChangeUserPhotoApiView', 'update'): lambda d, user: (user, {}, {'photo': png_upload()}, 'multipart'),
+    ('ForgotPasswordApiView', 'forgot_password'): lambda d, user: (None, {}, {'email_or_phone': user.email}, 'json'),
+    ('ResetPasswordApiViewSet', 'reset_password'): lambda d, user: (
+        user, {}, {'password': PASSWORD, 'confirm_password': PASSWORD}, 'json'),
+    ('EmailStatsApiView', 'stats'): lambda d, user: (d.admin, {}, None, None),
+    ('PasswordHashStatsApiView', 'stats'): lambda d, user: (d.admin, {}, None, None),
+    ('CategoryApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+    ('CategoryApiView', 'tree'): lambda d, user: (user, {}, {'counts': 'true'}, None),
+    ('SubCategoryApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+    ('ProductApiView', 'list'): lambda d, user: (user, {}, {'page_size': 20}, None),
+    ('ProductApiView', 'filter_product'): lambda d, user: (
+        user, {}, {'min_price': 100, 'max_price': 600, 'facets': 'true'}, None),
+    ('ProductApiView', 'search'): lambda d, user: (
+        user, {}, {'q': random.choice(['red widget', 'blue', 'product 12'])}, None),
+    ('ProductApiView', 'import_products'): lambda d, user: (d.admin, {}, {'file': csv_upload()}, 'multipart'),
+    ('ProductApiView', 'export_products'): lambda d, user: (d.admin, {}, {'file_format': 'jsonl'}, None),
+    ('ReviewApiView', 'list'): lambda d, user: (user, {}, None, None),
+    ('ReviewApiView', 'create'): lambda d, user: (
+        user, {}, {'product': random.choice(d.products), 'rating': random.randint(1, 5), 'comment': 'Benchmark'},
+        'json'),
+    ('ReviewApiView', 'update'): lambda d, user: (
+        user, {'pk': d.reviews[user.pk]}, {'rating': random.randint(1, 5)}, 'json'),
+    ('AuthorApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+    ('OrderApiView', 'customers_list'): lambda d, user: (user, {}, None, None),
+    ('OrderApiView', 'create'): lambda d, user: (user, {}, {'total_price': 10, 'status': 1}, 'json'),
+    ('OrderApiView', 'place_order'): lambda d, user: (
+        user, {}, {'items': [{'product': random.choice(d.products), 'quantity': 1}]}, 'json'),
+    ('OrderApiView', 'checkout'): checkout_call,
+    ('OrderApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+    ('OrderApiView', 'update'): lambda d, user: (
+        user, {'pk': d.orders[user.pk]}, {'total_price': 10, 'status': 1}, 'json'),
+    ('OrderApiView', 'get_order'): lambda d, user: (user, {'pk': d.orders[user.pk]}, None, None),
+    ('OrderItemApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+    ('CartItemApiView', 'users_list'): lambda d, user: (user, {}, None, None),
+    ('CartItemApiView', 'create'): lambda d, user: (
+        user, {}, {'product': random.choice(d.products), 'quantity': 1}, 'json'),
+    ('CartItemApiView', 'clear'): lambda d, user: (user, {}, None, None),
+    ('CartItemApiView', 'update'): lambda d, user: (user, {'pk': cart_product(d, user)}, {'quantity': 2}, 'json'),
+    ('CartItemApiView', 'destroy'): lambda d, user: (user, {'pk': cart_product(d, user)}, None, None),
+    ('CartItemApiView', 'list'): lambda d, user: (d.admin, {}, None, None),
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+def max_rss_mb():
+    # Process-lifetime high-water mark; ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def summarize(samples, statuses, elapsed, peak_alloc=None):
+    latencies = [latency for latency, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        'requests': len(samples),
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+        'errors': sum(count for code, count in statuses.items() if code >= 500),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'avg': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99': round(percentile(latencies, 0.99) * 1000, 3),
+            'max': round(max(latencies, default=0.0) * 1000, 3),
+        },
+        'queries': {
+            'avg': round(sum(queries) / len(queries), 2) if queries else 0.0,
+            'max': max(queries, default=0),
+        },
+        # Python heap allocated above the level at the start of this endpoint's timed run, at its highest;
+        # ``None`` when tracemalloc is off.
+        'peak_alloc_mb': round(peak_alloc / (1024 * 1024), 1) if peak_alloc is not None else None,
+    }
+
+
+def call_route(client, route, dataset, user):
+    owner, kwargs, data, data_format = SCENARIOS[(route.view, route.action)](dataset, user)
+    headers = {'HTTP_AUTHORIZATION': f'Bearer {dataset.access[owner.pk]}'} if owner else {}
+
+    def request():
+        response = getattr(client, route.method)(route.path(**kwargs), data, format=data_format, **headers)
+        if response.streaming:
+            # Streamed bodies are produced while they are read; drain them so the whole response is timed.
+            for _ in response.streaming_content:
+                pass
+        return response
+    return request
+
+
+def run_route(route, dataset, requests, threads, warmup=0):
+    """
+    Drive one route from ``threads`` concurrent clients until ``requests`` timed calls have been made.
+
+    While tracemalloc is tracing, its peak is reset before the timed calls, so the reported allocation peak
+    belongs to this route alone and not to whichever endpoint ran before it.
+    """
+    client = APIClient(raise_request_exception=False)
+    for index in range(warmup):
+        call_route(client, route, dataset, dataset.user(index))()
+
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    samples, statuses = [], {}
+
+    def worker(index):
+        client = APIClient(raise_request_exception=False)
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            while True:
+                with lock:
+                    if next(remaining, None) is None:
+                        break
+                request = call_route(client, route, dataset, dataset.user(index))
+                counter.total = 0
+                started = time.perf_counter()
+                response = request()
+                latency = time.perf_counter() - started
+                with lock:
+                    samples.append((latency, counter.total))
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        connections.close_all()
+
+    workers = [threading.Thread(target=worker, args=(index,), name=f'bench-{index}') for index in range(threads)]
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        allocated, _ = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    peak_alloc = tracemalloc.get_traced_memory()[1] - allocated if tracing else None
+    return summarize(samples, statuses, elapsed, peak_alloc)
+
+
+def compare_reports(baseline, current, threshold, min_latency_ms=1.0):
+    """Regressions of ``current`` against ``baseline``: p95 latency or average query count went up."""
+    regressions = []
+    for key, result in current['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(key)
+        if previous is None:
+            continue
+        old_p95, new_p95 = previous['latency_ms']['p95'], result['latency_ms']['p95']
+        if new_p95 - old_p95 > min_latency_ms and new_p95 > old_p95 * (1 + threshold):
+            regressions.append(f'{key}: p95 {old_p95:.1f}ms -> {new_p95:.1f}ms')
+        old_queries, new_queries = previous['queries']['avg'], result['queries']['avg']
+        if new_queries > old_queries + 0.5:
+            regressions.append(f'{key}: queries {old_queries:.1f} -> {new_queries:.1f}')
+        if result['errors'] > previous['errors']:
+            regressions.append(f'{key}: 5xx responses {previous["errors"]} -> {result["errors"]}')
+    return regressions
@@ -0,0 +1,113 @@
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_databases, setup_test_environment, teardown_databases
+
+from monitoring.benchmark import SCENARIOS, compare_reports, discover_routes, max_rss_mb, run_route, seed_dataset
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Seed a test database and drive every users and market route with concurrent authenticated clients, '
+            'reporting latency percentiles, throughput, query counts and peak Python allocations per endpoint as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per endpoint')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent clients per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint')
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--only', action='append', default=[],
+                            help='Only run endpoints whose "METHOD /path" contains this text (repeatable)')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--compare', help='Baseline JSON report; exit with an error on regressions')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative p95 latency increase before it counts as a regression')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database if it exists')
+        parser.add_argument('--no-trace-memory', dest='trace_memory', action='store_false',
+                            help='Skip tracemalloc (no peak_alloc_mb); tracing slows every allocation down')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        routes = [route for route in discover_routes()
+                  if not options['only'] or any(text in route.key for text in options['only'])]
+        uncovered = [route.key for route in routes if (route.view, route.action) not in SCENARIOS]
+        for key in uncovered:
+            self.stderr.write(self.style.WARNING(f'No scenario for {key}, skipped'))
+
+        setup_test_environment()
+        databases = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(MEDIA_ROOT=media_root, SMS_BACKEND='fake'):
+                if options['trace_memory']:
+                    tracemalloc.start()
+                try:
+                    report = self.run_benchmark(routes, options)
+                finally:
+                    tracemalloc.stop()
+        finally:
+            teardown_databases(databases, verbosity=0, keepdb=options['keepdb'])
+        report['uncovered'] = uncovered
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            regressions = compare_reports(baseline, report, options['threshold'])
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+            self.stderr.write(self.style.SUCCESS(f'No regressions against {options["compare"]}'))
+
+    def run_benchmark(self, routes, options):
+        dataset = seed_dataset(users=options['users'], products=options['products'])
+        report = {
+            'meta': {
+                'commit': git_commit(),
+                'started_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'requests': options['requests'],
+                'threads': options['threads'],
+                'users': options['users'],
+                'products': options['products'],
+                'trace_memory': options['trace_memory'],
+            },
+            'endpoints': {},
+        }
+        for route in routes:
+            if (route.view, route.action) not in SCENARIOS:
+                continue
+            result = run_route(route, dataset, options['requests'], options['threads'], options['warmup'])
+            report['endpoints'][route.key] = result
+            self.stderr.write(f'{route.key}: p50 {result["latency_ms"]["p50"]:.1f}ms, '
+                              f'p95 {result["latency_ms"]["p95"]:.1f}ms, {result["throughput_rps"]:.0f} req/s, '
+                              f'{result["queries"]["avg"]:.1f} queries, statuses {result["statuses"]}')
+        report['meta']['max_rss_mb'] = round(max_rss_mb(), 1)
+        return report
@@ -0,0 +1,197 @@
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+FILE_PATTERN = 'metrics-*.json'
+
+COUNTER, HISTOGRAM = ('counter', 'histogram')
+METRICS = {
+    'http_requests_total': (COUNTER, 'Requests handled, by view, action and status code.'),
+    'http_request_errors_total': (COUNTER, 'Error responses, by view, action and ErrorCodes name.'),
+    'http_request_duration_seconds': (HISTOGRAM, 'Request latency in seconds, by view and action.'),
+    'http_response_size_bytes': (HISTOGRAM, 'Response body size in bytes, by view and action.'),
+    'metrics_overhead_seconds_total': (COUNTER, 'Time spent recording metrics inside requests.'),
+    'metrics_dropped_total': (COUNTER, 'Samples dropped because the series limit was reached.'),
+}
+BUCKETS = {
+    'http_request_duration_seconds': LATENCY_BUCKETS,
+    'http_response_size_bytes': SIZE_BUCKETS,
+}
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in pairs) + '}'
+
+
+def format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Counters and fixed-bucket histograms kept in memory by each process.
+
+    Recording is a dict lookup and a bisect under one lock; requests never touch the disk. When ``directory``
+    is set, a background thread writes this process's samples to its own JSON file there every
+    ``flush_interval`` seconds (and at exit), and ``collect()`` sums every file in the directory, so any worker
+    can serve the totals of all of them. Files are named per process start, so the directory should be emptied
+    when the whole service is restarted. At most ``max_series`` label sets are kept; samples for new ones
+    beyond that are dropped and counted in ``metrics_dropped_total``.
+    """
+
+    def __init__(self, directory, flush_interval, max_series):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.max_series = max_series
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.pid = None
+        self.path = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        # Called on every record; a forked worker gets its own file and flush thread.
+        if self.pid == os.getpid() or not self.directory:
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.path = os.path.join(self.directory, f'metrics-{self.pid}-{uuid.uuid4().hex[:8]}.json')
+            self.stopped = threading.Event()
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self.run, name='metrics-flush', daemon=True).start()
+        atexit.register(self.shutdown)
+
+    def has_room(self, store, key):
+        if key in store or len(self.counters) + len(self.histograms) < self.max_series:
+            return True
+        dropped = ('metrics_dropped_total', ())
+        self.counters[dropped] = self.counters.get(dropped, 0) + 1
+        return False
+
+    def inc(self, name, labels=(), amount=1):
+        self.start()
+        key = (name, tuple(labels))
+        with self.lock:
+            if self.has_room(self.counters, key):
+                self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        self.start()
+        buckets = BUCKETS[name]
+        key = (name, tuple(labels))
+        with self.lock:
+            if not self.has_room(self.histograms, key):
+                return
+            sample = self.histograms.get(key)
+            if sample is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count.
+                sample = self.histograms[key] = [0] * (len(buckets) + 1) + [0, 0]
+            sample[bisect.bisect_left(buckets, value)] += 1
+            sample[-2] += value
+            sample[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(sample)]
+                               for (name, labels), sample in self.histograms.items()],
+            }
+
+    def flush(self):
+        if self.path is None:
+            return
+        data = self.snapshot()
+        temporary = f'{self.path}.tmp'
+        try:
+            with open(temporary, 'w') as file:
+                json.dump(data, file)
+            os.replace(temporary, self.path)
+        except OSError:
+            logger.exception('Could not write metrics to %s', self.path)
+
+    def run(self):
+        stopped = self.stopped
+        while not stopped.wait(self.flush_interval):
+            self.flush()
+
+    def shutdown(self):
+        self.stopped.set()
+        self.flush()
+
+    def collect(self):
+        """Samples of every process sharing ``directory``, with this process's own taken live."""
+        snapshots = [self.snapshot()]
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, FILE_PATTERN)):
+                if path == self.path:
+                    continue
+                try:
+                    with open(path) as file:
+                        snapshots.append(json.load(file))
+                except (OSError, ValueError):
+                    continue
+        counters, histograms = {}, {}
+        for data in snapshots:
+            for name, labels, value in data['counters']:
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, sample in data['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                merged = histograms.get(key)
+                histograms[key] = sample if merged is None else [a + b for a, b in zip(merged, sample)]
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == COUNTER:
+                for (sample_name, labels), value in sorted(counters.items()):
+                    if sample_name == name:
+                        lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+                continue
+            bounds = BUCKETS[name] + (float('inf'),)
+            for (sample_name, labels), sample in sorted(histograms.items()):
+                if sample_name != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(bounds, sample):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", format_number(bound))])} '
+                                 f'{cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_number(sample[-2])}')
+                lines.append(f'{name}_count{format_labels(labels)} {sample[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics_registry = MetricsRegistry(
+    directory=settings.METRICS_DIR,
+    flush_interval=settings.METRICS_FLUSH_INTERVAL,
+    max_series=settings.METRICS_MAX_SERIES,
+)
@@ -0,0 +1,106 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+
+from exceptions.error_messages import ErrorCodes
+from users.authentication import ClaimsJWTAuthentication
+from users.models import ADMIN
+from .metrics import metrics_registry
+from .profiler import QueryProfile, QueryRecorder, endpoint_report
+
+logger = logging.getLogger(__name__)
+
+ERROR_NAMES = {code.value: code.name for code in ErrorCodes}
+
+
+def requested_by_admin(request):
+    try:
+        result = ClaimsJWTAuthentication().authenticate(request)
+    except APIException:
+        return False
+    return result is not None and getattr(result[0], 'user_roles', None) == ADMIN
+
+
+class QueryProfilerMiddleware:
+    """
+    Counts and times every SQL statement a request runs and reports it in ``X-Query-*`` response headers and
+    in the per-endpoint report.
+
+    Profiling is on for every request with ``QUERY_PROFILER_ENABLED``; otherwise an admin can ask for it per
+    request with the ``X-Profile-Queries: 1`` header. Streaming responses only count the queries run before the
+    body starts.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def should_profile(self, request):
+        if settings.QUERY_PROFILER_ENABLED:
+            return True
+        return request.headers.get('X-Profile-Queries') == '1' and requested_by_admin(request)
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+
+        profile = QueryProfile(recorder.queries, settings.QUERY_PROFILER_N_PLUS_ONE_THRESHOLD)
+        for header, value in profile.headers().items():
+            response[header] = value
+        match = request.resolver_match
+        endpoint = f'{request.method} /{match.route}' if match else f'{request.method} {request.path}'
+        endpoint_report.record(endpoint, profile)
+        if profile.n_plus_one:
+            logger.warning('Probable N+1 on %s: %s', endpoint, profile.n_plus_one)
+        return response
+
+
+def view_labels(request):
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched', ''
+    view = getattr(match.func, 'cls', match.func)
+    actions = getattr(match.func, 'actions', None) or {}
+    return getattr(view, '__name__', match.view_name), actions.get(request.method.lower(), request.method.lower())
+
+
+def error_name(response):
+    data = getattr(response, 'data', None)
+    code = data.get('error_code') if isinstance(data, dict) else None
+    return ERROR_NAMES.get(code, 'NONE')
+
+
+class MetricsMiddleware:
+    """
+    Records request count, latency, response size and ``ErrorCodes`` of every request in ``metrics_registry``,
+    labelled by ViewSet and action. The time spent recording is itself counted in
+    ``metrics_overhead_seconds_total``.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        finished = time.perf_counter()
+        if settings.METRICS_ENABLED:
+            view, action = view_labels(request)
+            labels = (('view', view), ('action', action))
+            metrics_registry.inc('http_requests_total', labels + (('status', response.status_code),))
+            metrics_registry.observe('http_request_duration_seconds', finished - started, labels)
+            if not response.streaming:
+                metrics_registry.observe('http_response_size_bytes', len(response.content), labels)
+            if response.status_code >= 400:
+                metrics_registry.inc('http_request_errors_total', labels + (('error_code', error_name(response)),))
+            metrics_registry.inc('metrics_overhead_seconds_total', amount=time.perf_counter() - finished)
+        return response
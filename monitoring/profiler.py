@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from collections import Counter
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+FROM_TABLE = re.compile(r'\bFROM\s+"?(\w+)"?', re.IGNORECASE)
+EQUALITY_LOOKUP = re.compile(r'\bWHERE\b.*=\s*%s', re.IGNORECASE | re.DOTALL)
+MAX_ENDPOINTS = 500
+MAX_SHAPES = 10
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals become ``%s`` and ``IN (%s, %s, ...)`` lists collapse."""
+    sql = STRING_LITERAL.sub('%s', sql)
+    sql = NUMBER_LITERAL.sub('%s', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """``execute_wrapper`` callback that times every statement of one request."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+
+class QueryProfile:
+    def __init__(self, queries, n_plus_one_threshold):
+        self.count = len(queries)
+        self.duration = sum(duration for _, duration in queries)
+        shapes = Counter(normalize_sql(sql) for sql, _ in queries)
+        self.duplicates = {shape: count for shape, count in shapes.items() if count > 1}
+        # Probable N+1: the same single-row style SELECT (``WHERE ... = %s``) issued over and over.
+        self.n_plus_one = {
+            shape: count for shape, count in self.duplicates.items()
+            if count >= n_plus_one_threshold and shape.upper().startswith('SELECT')
+            and EQUALITY_LOOKUP.search(shape)
+        }
+
+    @property
+    def duplicate_count(self):
+        return sum(count - 1 for count in self.duplicates.values())
+
+    @property
+    def n_plus_one_tables(self):
+        return sorted({match.group(1) for shape in self.n_plus_one for match in [FROM_TABLE.search(shape)] if match})
+
+    def headers(self):
+        headers = {
+            'X-Query-Count': str(self.count),
+            'X-Query-Time-Ms': f'{self.duration * 1000:.2f}',
+            'X-Query-Duplicates': str(self.duplicate_count),
+            'X-Query-N-Plus-One': str(len(self.n_plus_one)),
+        }
+        if self.n_plus_one:
+            headers['X-Query-N-Plus-One-Tables'] = ','.join(self.n_plus_one_tables)
+        return headers
+
+
+class EndpointReport:
+    """Per-endpoint aggregates of the profiled requests handled by this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, profile):
+        with self.lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                if len(self.endpoints) >= MAX_ENDPOINTS:
+                    return
+                stats = self.endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time_ms': 0.0, 'duplicates': 0,
+                    'n_plus_one_requests': 0, 'n_plus_one': Counter(),
+                }
+            stats['requests'] += 1
+            stats['queries'] += profile.count
+            stats['max_queries'] = max(stats['max_queries'], profile.count)
+            stats['db_time_ms'] += profile.duration * 1000
+            stats['duplicates'] += profile.duplicate_count
+            if profile.n_plus_one:
+                stats['n_plus_one_requests'] += 1
+                stats['n_plus_one'].update(profile.n_plus_one)
+
+    def snapshot(self):
+        with self.lock:
+            items = [(endpoint, dict(stats, n_plus_one=stats['n_plus_one'].copy()))
+                     for endpoint, stats in self.endpoints.items()]
+        result = []
+        for endpoint, stats in items:
+            requests = stats['requests']
+            result.append({
+                'endpoint': endpoint,
+                'requests': requests,
+                'avg_queries': round(stats['queries'] / requests, 2),
+                'max_queries': stats['max_queries'],
+                'avg_db_time_ms': round(stats['db_time_ms'] / requests, 2),
+                'avg_duplicates': round(stats['duplicates'] / requests, 2),
+                'n_plus_one_requests': stats['n_plus_one_requests'],
+                'n_plus_one': [{'sql': shape, 'executions': count}
+                               for shape, count in stats['n_plus_one'].most_common(MAX_SHAPES)],
+            })
+        return sorted(result, key=lambda row: row['avg_queries'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.endpoints.clear()
+
+
+endpoint_report = EndpointReport()
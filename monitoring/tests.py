@@ -0,0 +1,91 @@
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from market.models import Product
+from monitoring.profiler import QueryProfile, endpoint_report, normalize_sql
+from users.models import User, DONE, ADMIN, ORDINARY_USER
+
+PRODUCT_LOOKUP = 'SELECT "market_product"."id" FROM "market_product" WHERE "market_product"."id" = {} LIMIT 21'
+
+
+class NormalizeSqlTest(SimpleTestCase):
+    def test_literals_become_placeholders(self):
+        self.assertEqual(normalize_sql("SELECT * FROM t WHERE name = 'O''Brien' AND price > -1.5 AND id = 42"),
+                         'SELECT * FROM t WHERE name = %s AND price > %s AND id = %s')
+
+    def test_identifiers_with_digits_are_kept(self):
+        self.assertEqual(normalize_sql('SELECT "t"."col1" FROM "table2" WHERE "t"."x" = %s'),
+                         'SELECT "t"."col1" FROM "table2" WHERE "t"."x" = %s')
+
+    def test_in_lists_and_whitespace_collapse(self):
+        self.assertEqual(normalize_sql('SELECT *\n  FROM t WHERE id IN (%s, %s,%s)'),
+                         normalize_sql('SELECT * FROM t WHERE id IN (1, 2, 3, 4, 5)'))
+        self.assertEqual(normalize_sql('SELECT * FROM t WHERE id IN (1, 2)'), 'SELECT * FROM t WHERE id IN (...)')
+
+
+class QueryProfileTest(SimpleTestCase):
+    def test_repeated_lookups_are_grouped_as_n_plus_one(self):
+        queries = [('SELECT "market_product"."id" FROM "market_product" LIMIT 20', 0.001)]
+        queries += [(PRODUCT_LOOKUP.format(pk), 0.002) for pk in range(1, 6)]
+        queries += [('UPDATE "market_product" SET "price" = 1 WHERE "id" = 1', 0.001)] * 4
+        profile = QueryProfile(queries, n_plus_one_threshold=3)
+        self.assertEqual(profile.count, 10)
+        self.assertEqual(profile.duplicate_count, 4 + 3)
+        self.assertEqual(profile.n_plus_one, {normalize_sql(PRODUCT_LOOKUP.format(1)): 5})
+        self.assertEqual(profile.n_plus_one_tables, ['market_product'])
+        headers = profile.headers()
+        self.assertEqual(headers['X-Query-Count'], '10')
+        self.assertEqual(headers['X-Query-N-Plus-One'], '1')
+        self.assertEqual(headers['X-Query-N-Plus-One-Tables'], 'market_product')
+
+    def test_below_threshold_is_not_reported(self):
+        profile = QueryProfile([(PRODUCT_LOOKUP.format(pk), 0.001) for pk in (1, 2)], n_plus_one_threshold=3)
+        self.assertEqual(profile.duplicate_count, 1)
+        self.assertEqual(profile.n_plus_one, {})
+        self.assertNotIn('X-Query-N-Plus-One-Tables', profile.headers())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   QUERY_PROFILER_ENABLED=False)
+class QueryProfilerMiddlewareTest(TestCase):
+    url = '/api/v1/market/product/'
+
+    def setUp(self):
+        endpoint_report.reset()
+        Product.objects.create(name='Product', price=1, description='d')
+
+    def client_for(self, role):
+        user = User.objects.create(username=role, password='password', auth_status=DONE, user_roles=role)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Bearer ' + user.token()['access'])
+        return client
+
+    def test_admin_opts_in_with_the_header(self):
+        client = self.client_for(ADMIN)
+        self.assertNotIn('X-Query-Count', client.get(self.url))
+        response = client.get(self.url, HTTP_X_PROFILE_QUERIES='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Count', response)
+        self.assertIn('X-Query-Time-Ms', response)
+        [report] = endpoint_report.snapshot()
+        self.assertEqual((report['endpoint'], report['requests']), ('GET /api/v1/market/product/', 1))
+
+    def test_header_is_ignored_for_other_users(self):
+        response = self.client_for(ORDINARY_USER).get(self.url, HTTP_X_PROFILE_QUERIES='1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Query-Count', response)
+        self.assertEqual(endpoint_report.snapshot(), [])
+
+
+class MetricsEndpointTest(SimpleTestCase):
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
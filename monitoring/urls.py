@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import QueryReportApiView
+
+urlpatterns = [
+    path('queries/', QueryReportApiView.as_view({'get': 'report', 'delete': 'reset'}), name='query-report'),
+]
@@ -0,0 +1,52 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+
+from market.permissions import is_super_admin
+from users.authentication import ClaimsJWTAuthentication
+from .metrics import metrics_registry
+from .profiler import endpoint_report
+
+
+def metrics(request):
+    """
+    Prometheus text exposition of all worker processes, for scrapers sending ``Authorization: Bearer
+    <METRICS_TOKEN>``. Without a configured token the endpoint does not exist (404).
+    """
+    if not settings.METRICS_TOKEN:
+        return HttpResponse(status=404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                               f'Bearer {settings.METRICS_TOKEN}'.encode()):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class QueryReportApiView(ViewSet):
+    authentication_classes = [ClaimsJWTAuthentication]
+
+    @swagger_auto_schema(
+        operation_summary='SQL query report',
+        operation_description='Per-endpoint query counts, database time (ms), duplicated statements and probable '
+                              'N+1 statements of the requests profiled by this process.',
+        responses={200: openapi.Response('SQL query report', )},
+        tags=['Monitoring']
+    )
+    @is_super_admin
+    def report(self, request):
+        return Response(data={'result': endpoint_report.snapshot(), 'ok': True}, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        operation_summary='Reset SQL query report',
+        responses={200: openapi.Response('Report cleared', )},
+        tags=['Monitoring']
+    )
+    @is_super_admin
+    def reset(self, request):
+        endpoint_report.reset()
+        return Response(data={'result': 'Report cleared', 'ok': True}, status=status.HTTP_200_OK)
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models import F
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User, TOKEN_CLAIMS
+
+TOKEN_VERSION_KEY = 'users:token_version:{}'
+
+
+def add_user_claims(token, user):
+    for claim in TOKEN_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+def cache_token_version(user_id, version):
+    cache.set(TOKEN_VERSION_KEY.format(user_id), version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+
+
+def get_token_version(user_id):
+    """The current token version of an active user, or ``None`` for inactive and deleted users."""
+    version = cache.get(TOKEN_VERSION_KEY.format(user_id))
+    if version is None:
+        version = (User.objects.filter(pk=user_id, is_active=True)
+                   .values_list('token_version', flat=True).first())
+        if version is not None:
+            cache_token_version(user_id, version)
+    return version
+
+
+def forget_token_versions(user_ids):
+    cache.delete_many([TOKEN_VERSION_KEY.format(user_id) for user_id in user_ids])
+
+
+def invalidate_user_tokens(user_ids):
+    """Revoke every token issued to ``user_ids``."""
+    User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)
+    forget_token_versions(user_ids)
+
+
+def shared_token_versions():
+    # A local-memory cache is private to one process, so a version bumped by one worker would stay stale in
+    # the others for up to TOKEN_VERSION_CACHE_TIMEOUT.
+    return not isinstance(caches['default'], LocMemCache)
+
+
+class ClaimsUser(TokenUser):
+    """``request.user`` built from the access-token claims alone."""
+
+    @cached_property
+    def user_roles(self):
+        return self.token.get('user_roles')
+
+    @cached_property
+    def auth_status(self):
+        return self.token.get('auth_status')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates from the token claims instead of loading the ``User`` row.
+
+    The only per-request lookup is the user's ``token_version``, read from the cache (the database is hit once
+    per user after a miss). Changing a user's role or deactivating them bumps the version, so tokens issued
+    before the change stop working. Versions must live in a cache shared by every worker (memcached, Redis);
+    with the local-memory cache, and for tokens without the claims, the regular ``User`` lookup is used.
+    """
+
+    def get_user(self, validated_token):
+        if 'user_roles' not in validated_token or not shared_token_versions():
+            user = super().get_user(validated_token)
+            if validated_token.get('token_version', user.token_version) != user.token_version:
+                raise InvalidToken('Token is no longer valid')
+            return user
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        if validated_token.get('token_version') != get_token_version(user_id):
+            raise InvalidToken('Token is no longer valid')
+        return ClaimsUser(validated_token)
@@ -0,0 +1,149 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.module_loading import import_string
+
+from config.workers import init_worker
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+from .mailer import percentile
+
+QUEUE_TIME_WINDOW = 1000
+
+
+def hasher_path(hasher):
+    return f'{type(hasher).__module__}.{type(hasher).__qualname__}'
+
+
+# The hasher class is resolved by the caller, so the workers honour the caller's PASSWORD_HASHERS.
+def check_password_job(path, password, encoded, submitted):
+    started = time.time()
+    return import_string(path)().verify(password, encoded), started - submitted
+
+
+def make_password_job(path, password, submitted):
+    started = time.time()
+    hasher = import_string(path)()
+    return hasher.encode(password, hasher.salt()), started - submitted
+
+
+class PasswordHashPool:
+    """
+    Runs PBKDF2 hashing and verification in a dedicated pool of ``workers`` processes.
+
+    Request threads only wait on a future, so a login spike uses at most ``workers`` cores and everything else
+    keeps its CPU. Admission is bounded: at most ``max_pending`` hashes may be queued or running, and a caller
+    that cannot get a slot within ``admission_timeout`` seconds is turned away with ``TOO_MANY_REQUESTS``
+    instead of growing the queue. The time each job spent queued is kept for ``stats()``. With ``workers=0``
+    everything runs inline.
+    """
+
+    def __init__(self, workers, max_pending, admission_timeout):
+        self.workers = workers
+        self.admission_timeout = admission_timeout
+        self.slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self.lock = threading.Lock()
+        self.executor = None
+        self.counters = {'submitted': 0, 'completed': 0, 'rejected': 0, 'in_flight': 0}
+        self.queue_times = deque(maxlen=QUEUE_TIME_WINDOW)
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=init_worker,
+                    initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),),
+                )
+            return self.executor
+
+    def submit(self, job, *args):
+        if not self.slots.acquire(timeout=self.admission_timeout):
+            self.count('rejected')
+            raise CustomAPIException(ErrorCodes.TOO_MANY_REQUESTS)
+        self.count('submitted')
+        self.count('in_flight')
+        try:
+            future = self.get_executor().submit(job, *args, time.time())
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool for this and later jobs.
+            with self.lock:
+                self.executor = None
+            try:
+                future = self.get_executor().submit(job, *args, time.time())
+            except BaseException:
+                self.finish(None)
+                raise
+        except BaseException:
+            self.finish(None)
+            raise
+        future.add_done_callback(self.finish)
+        return future
+
+    def finish(self, future):
+        with self.lock:
+            self.counters['in_flight'] -= 1
+            if future is not None and not future.cancelled() and future.exception() is None:
+                self.counters['completed'] += 1
+                self.queue_times.append(future.result()[1])
+        self.slots.release()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    @staticmethod
+    def verify_hasher(encoded):
+        if not encoded or not hashers.is_password_usable(encoded):
+            return None
+        try:
+            return hashers.identify_hasher(encoded)
+        except ValueError:
+            return None
+
+    def check_password(self, password, encoded):
+        if not self.workers:
+            return hashers.check_password(password, encoded)
+        hasher = self.verify_hasher(encoded)
+        if hasher is None:
+            return False
+        return self.submit(check_password_job, hasher_path(hasher), password, encoded).result()[0]
+
+    def make_password(self, password):
+        if not self.workers or password is None:
+            return hashers.make_password(password)
+        hasher = hashers.get_hasher('default')
+        return self.submit(make_password_job, hasher_path(hasher), password).result()[0]
+
+    def stats(self):
+        with self.lock:
+            queue_times = list(self.queue_times)
+            result = dict(self.counters)
+        result.update({
+            'workers': self.workers,
+            'queue_time_avg': sum(queue_times) / len(queue_times) if queue_times else 0.0,
+            'queue_time_p95': percentile(queue_times, 0.95),
+            'queue_time_max': max(queue_times, default=0.0),
+        })
+        return result
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+password_hash_pool = PasswordHashPool(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+    admission_timeout=settings.PASSWORD_HASH_ADMISSION_TIMEOUT,
+)
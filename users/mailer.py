@@ -0,0 +1,158 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+logger = logging.getLogger(__name__)
+
+LATENCY_WINDOW = 1000
+_STOP = object()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class EmailPool:
+    """
+    A fixed number of worker threads draining one bounded queue of ``EmailMessage`` objects.
+
+    Each worker takes whatever is queued (up to ``batch_size``, waiting at most ``batch_wait`` seconds to fill a
+    batch) and sends it over a single ``get_connection()`` with ``send_messages()``, so a signup burst costs a
+    handful of SMTP sessions instead of one thread and one connection per message. When the queue is full the
+    caller sends its own message, which slows the burst down without dropping anything. ``shutdown()`` runs at
+    exit and lets the workers drain the queue before they stop.
+    """
+
+    def __init__(self, workers, queue_size, batch_size, batch_wait, shutdown_timeout):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.shutdown_timeout = shutdown_timeout
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.counters = {'queued': 0, 'sent': 0, 'failed': 0, 'batches': 0, 'inline': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        with self.lock:
+            if self.threads or self.closed:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self.run, name=f'email-pool-{index}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+        atexit.register(self.shutdown)
+
+    def submit(self, message):
+        if self.workers and not self.threads:
+            self.start()
+        if self.threads and not self.closed:
+            try:
+                self.queue.put_nowait((message, time.monotonic()))
+                self.count('queued')
+                return
+            except queue.Full:
+                pass
+        self.count('inline')
+        self.deliver([(message, time.monotonic())])
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def next_batch(self):
+        first = self.queue.get()
+        if first is _STOP:
+            return None, True
+        batch, deadline = [first], time.monotonic() + self.batch_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch, stop = self.next_batch()
+            if batch:
+                self.deliver(batch)
+
+    def deliver(self, batch):
+        messages = [message for message, _ in batch]
+        for attempt in range(2):
+            try:
+                with get_connection(fail_silently=False) as connection:
+                    connection.send_messages(messages)
+                break
+            except Exception:
+                if attempt:
+                    logger.exception('Could not send %d emails', len(messages))
+                    self.count('failed', len(messages))
+                    return
+        finished = time.monotonic()
+        with self.lock:
+            self.counters['sent'] += len(messages)
+            self.counters['batches'] += 1
+            self.latencies.extend(finished - enqueued for _, enqueued in batch)
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            result = dict(self.counters)
+        result.update({
+            'workers': len(self.threads),
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_max': max(latencies, default=0.0),
+        })
+        return result
+
+    def shutdown(self, timeout=None):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            threads = list(self.threads)
+        # The stop markers queue up behind every pending message, so the workers drain the queue first.
+        for _ in threads:
+            self.queue.put(_STOP)
+        deadline = time.monotonic() + (self.shutdown_timeout if timeout is None else timeout)
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        leftover = []
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            self.deliver(leftover)
+
+
+email_pool = EmailPool(
+    workers=settings.EMAIL_POOL_WORKERS,
+    queue_size=settings.EMAIL_POOL_QUEUE_SIZE,
+    batch_size=settings.EMAIL_POOL_BATCH_SIZE,
+    batch_wait=settings.EMAIL_POOL_BATCH_WAIT,
+    shutdown_timeout=settings.EMAIL_POOL_SHUTDOWN_TIMEOUT,
+)
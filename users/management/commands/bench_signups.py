@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from users.models import User, generate_username
+
+
+def legacy_username():
+    # The pre-allocator behaviour: query until a candidate is free.
+    username = generate_username()
+    while User.objects.filter(username=username):
+        username = f'{username}{random.randint(1, 20)}'
+    return username
+
+
+class QueryCounter:
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark username allocation by signing up many users (they are deleted afterwards unless --keep)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--report-every', type=int, default=10000)
+        parser.add_argument('--legacy', action='store_true', help='Use the old query-until-free loop')
+        parser.add_argument('--keep', action='store_true', help='Keep the created users')
+
+    def handle(self, *args, **options):
+        # Hash once up front so the benchmark measures username allocation, not PBKDF2.
+        password = make_password('benchmark-password', hasher='pbkdf2_sha256')
+        counter = QueryCounter()
+        created = []
+        started = last = time.monotonic()
+        with connection.execute_wrapper(counter):
+            for index in range(1, options['users'] + 1):
+                user = User(password=password, username=legacy_username() if options['legacy'] else '')
+                user.save()
+                created.append(user.pk)
+                if index % options['report_every'] == 0:
+                    now = time.monotonic()
+                    rate = options['report_every'] / (now - last)
+                    self.stdout.write(f'{index} signups, last batch {rate:.0f}/s, '
+                                      f'{counter.total / index:.3f} queries per signup')
+                    last = now
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["users"]} signups in {elapsed:.1f}s ({options["users"] / elapsed:.0f}/s, '
+            f'{counter.total / options["users"]:.3f} queries per signup, '
+            f'{"legacy loop" if options["legacy"] else "insert-and-retry allocator"})'))
+
+        if not options['keep']:
+            for offset in range(0, len(created), 5000):
+                User.objects.filter(pk__in=created[offset:offset + 5000]).delete()
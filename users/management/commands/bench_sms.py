@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.mailer import percentile
+from users.sms import FakeSmsTransport, build_dispatcher
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the SMS dispatcher offline against the fake transport'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000)
+        parser.add_argument('--phones', type=int, default=None,
+                            help='Distinct numbers to send to (default: one per message, so nothing coalesces)')
+        parser.add_argument('--concurrency', type=int, default=None)
+        parser.add_argument('--latency', type=float, default=0.05, help='Simulated seconds per send')
+        parser.add_argument('--failure-rate', type=float, default=0.0)
+        parser.add_argument('--coalesce-window', type=float, default=None)
+
+    def handle(self, *args, **options):
+        transport = FakeSmsTransport(latency=options['latency'], failure_rate=options['failure_rate'])
+        overrides = {name: options[name] for name in ('concurrency', 'coalesce_window') if options[name] is not None}
+        dispatcher = build_dispatcher(lambda: transport, **overrides)
+        phones = options['phones'] or options['messages']
+
+        started = time.monotonic()
+        futures = [dispatcher.submit(f'+99890{index % phones:07d}', f'Hi, your confirmation code is {index}')
+                   for index in range(options['messages'])]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception:
+                results.append('failed')
+        elapsed = time.monotonic() - started
+        dispatcher.shutdown()
+
+        stats = dispatcher.stats()
+        latencies = sorted(dispatcher.latencies)
+        self.stdout.write(f'{options["messages"]} messages in {elapsed:.2f}s '
+                          f'({options["messages"] / elapsed:.0f} msg/s), {len(transport.sent)} delivered')
+        self.stdout.write(f'sent={stats["sent"]} coalesced={stats["coalesced"]} failed={stats["failed"]} '
+                          f'retried={stats["retried"]}')
+        self.stdout.write(f'latency p50={percentile(latencies, 0.5) * 1000:.1f}ms '
+                          f'p95={percentile(latencies, 0.95) * 1000:.1f}ms '
+                          f'max={stats["latency_max"] * 1000:.1f}ms')
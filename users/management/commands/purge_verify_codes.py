@@ -0,0 +1,35 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from users.models import UserConfirmation
+
+
+class Command(BaseCommand):
+    help = 'Delete expired UserConfirmation rows in primary key batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Keep rows for this many minutes after they expire')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        cutoff = datetime.now() - timedelta(minutes=options['grace_minutes'])
+        expired = UserConfirmation.objects.filter(expiration_time__lt=cutoff).order_by('pk')
+        total = 0
+        last_pk = 0
+        while True:
+            # Short transactions: each batch locks at most batch_size rows. The pk cursor starts every batch
+            # after the last one, instead of rescanning the rows (and dead tuples) already deleted.
+            ids = list(expired.filter(pk__gt=last_pk).values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_pk = ids[-1]
+            deleted, _ = UserConfirmation.objects.filter(pk__in=ids).delete()
+            total += deleted
+            self.stdout.write(f'{total} rows deleted')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {total} expired verification codes'))
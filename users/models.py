@@ -1,9 +1,12 @@
 import random
 import uuid
+from contextlib import nullcontext
 from datetime import datetime, timedelta
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager as BaseUserManager
 from django.core.validators import FileExtensionValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Q, When
+from django.db.models.functions import Lower
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from base_model.base_m import BaseModel
@@ -11,6 +14,40 @@ from base_model.base_m import BaseModel
 ORDINARY_USER, MANAGER, ADMIN = ('ordinary_user', 'manager', 'admin')
 VIA_EMAIL, VIA_PHONE = ('via_email', 'via_phone')
 NEW, CODE_VERIFIED, DONE, PHOTO_STEP = ('new', 'code_verified', 'done', 'photo_step')
+TOKEN_CLAIMS = ('user_roles', 'auth_status', 'token_version')
+# Changing any of these revokes the tokens already issued to the user.
+TOKEN_REVOKING_FIELDS = ('user_roles', 'is_active')
+USERNAME_PREFIX = 'instagram-'
+USERNAME_ATTEMPTS = 5
+VERIFY_CODE_LENGTH = 4
+
+
+def generate_username():
+    return f'{USERNAME_PREFIX}{uuid.uuid4().hex[-12:]}'
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Bulk role/activation changes bypass User.save(), so the token version is bumped here, only on the rows
+        # whose value actually changes.
+        revoking = [field for field in TOKEN_REVOKING_FIELDS if field in kwargs]
+        if not revoking or 'token_version' in kwargs:
+            return super().update(**kwargs)
+        changed = Q()
+        for field in revoking:
+            changed |= ~Q(**{field: kwargs[field]})
+        user_ids = list(self.filter(changed).values_list('pk', flat=True))
+        kwargs['token_version'] = Case(When(changed, then=F('token_version') + 1), default=F('token_version'),
+                                       output_field=models.PositiveIntegerField())
+        updated = super().update(**kwargs)
+        if user_ids:
+            from .authentication import forget_token_versions
+            transaction.on_commit(lambda: forget_token_versions(user_ids), using=self.db)
+        return updated
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
 
 
 class User(AbstractUser, BaseModel):
@@ -35,29 +72,39 @@ class User(AbstractUser, BaseModel):
     phone_number = models.CharField(max_length=13, unique=True, null=True, blank=True)
     photo = models.ImageField(upload_to='user_photos/', null=True, blank=True,
                               validators=[FileExtensionValidator(allowed_extensions=['jpg', 'png', 'jpeg', 'heif'])])
+    token_version = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = UserManager()
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(Lower('username'), name='users_user_username_lower'),
+            models.Index(Lower('email'), name='users_user_email_lower'),
+        ]
 
     def __str__(self):
         return self.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_token_state = {field: instance.__dict__.get(field) for field in TOKEN_REVOKING_FIELDS}
+        return instance
+
     @property
     def full_name(self):
         return f'{self.first_name} {self.last_name}'
 
     def create_verify_code(self, verify_type):
-        code = ''.join([str(random.randint(11, 101) % 10) for _ in range(4)])
-        UserConfirmation.objects.create(
-            user_id=self.id,
-            code=code,
-            verify_type=verify_type
-        )
+        from .verification import get_code_store
+        code = ''.join([str(random.randint(11, 101) % 10) for _ in range(VERIFY_CODE_LENGTH)])
+        get_code_store().create(self.id, code, verify_type)
         return code
 
     def check_username(self):
         if not self.username:
-            temp_username = f'instagram-{uuid.uuid4().__str__().split("-")[-1]}'
-            while User.objects.filter(username=temp_username):
-                temp_username = f'{temp_username}{random.randint(1, 20)}'
-            self.username = temp_username
+            self.username = generate_username()
+            self._generated_username = True
 
     def check_pass(self):
         if not self.password:
@@ -75,14 +122,56 @@ class User(AbstractUser, BaseModel):
 
     def token(self):
         refresh = RefreshToken.for_user(self)
+        for claim in TOKEN_CLAIMS:
+            refresh[claim] = getattr(self, claim)
         return {
             "access": str(refresh.access_token),
             "refresh_token": str(refresh)
         }
 
+    def check_token_version(self):
+        loaded = getattr(self, '_loaded_token_state', None) or {}
+        if any(loaded.get(field) is not None and loaded[field] != getattr(self, field)
+               for field in TOKEN_REVOKING_FIELDS):
+            self.token_version += 1
+            return True
+        return False
+
     def save(self, *args, **kwargs):
         self.clean()
-        super(User, self).save(*args, **kwargs)
+        version_changed = self.check_token_version()
+        if version_changed and kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        if getattr(self, '_generated_username', False):
+            self.save_with_generated_username(*args, **kwargs)
+        else:
+            super(User, self).save(*args, **kwargs)
+        self._loaded_token_state = {field: getattr(self, field) for field in TOKEN_REVOKING_FIELDS}
+        if version_changed:
+            from .authentication import cache_token_version, forget_token_versions
+            user_id, version = self.pk, self.token_version
+            if self.is_active:
+                transaction.on_commit(lambda: cache_token_version(user_id, version))
+            else:
+                transaction.on_commit(lambda: forget_token_versions([user_id]))
+
+    def save_with_generated_username(self, *args, **kwargs):
+        """
+        Insert with the random username and let the unique constraint report the (rare) collision, instead of
+        querying for a free name first. A signup is a single INSERT; the savepoint that makes a retry possible is
+        only taken when the save runs inside an outer transaction.
+        """
+        in_transaction = transaction.get_connection(kwargs.get('using')).in_atomic_block
+        for attempt in range(USERNAME_ATTEMPTS):
+            try:
+                with transaction.atomic(using=kwargs.get('using')) if in_transaction else nullcontext():
+                    super(User, self).save(*args, **kwargs)
+                break
+            except IntegrityError:
+                if attempt + 1 == USERNAME_ATTEMPTS or not User.objects.filter(username=self.username).exists():
+                    raise
+                self.username = generate_username()
+        self._generated_username = False
 
     def clean(self):
         self.check_username()
@@ -95,6 +184,11 @@ PHONE_EXPIRE = 2
 EMAIL_EXPIRE = 5
 
 
+def verify_code_expiration(verify_type):
+    minutes = EMAIL_EXPIRE if verify_type == VIA_EMAIL else PHONE_EXPIRE
+    return datetime.now() + timedelta(minutes=minutes)
+
+
 class UserConfirmation(BaseModel):
     TYPE_CHOICES = (
         (VIA_EMAIL, VIA_EMAIL),
@@ -106,14 +200,15 @@ class UserConfirmation(BaseModel):
     expiration_time = models.DateTimeField(null=True)
     is_confirmed = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'expiration_time'], condition=models.Q(is_confirmed=False),
+                         name='users_userconf_open_user_exp'),
+        ]
+
     def __str__(self):
         return str(self.user.__str__())
 
     def save(self, *args, **kwargs):
-
-        if self.verify_type == VIA_EMAIL:
-            self.expiration_time = datetime.now() + timedelta(minutes=EMAIL_EXPIRE)
-        else:
-            self.expiration_time = datetime.now() + timedelta(minutes=PHONE_EXPIRE)
-        print(self.expiration_time, '*' * 20)
+        self.expiration_time = verify_code_expiration(self.verify_type)
         super(UserConfirmation, self).save(*args, **kwargs)
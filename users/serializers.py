@@ -7,13 +7,15 @@ from django.core.validators import FileExtensionValidator
 from rest_framework.generics import get_object_or_404
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import AccessToken
-from django.contrib.auth.hashers import check_password
 
+from .authentication import add_user_claims
+from .hashing import password_hash_pool
+from .uploads import StreamedImageField
 from .models import User, VIA_EMAIL, VIA_PHONE, NEW, CODE_VERIFIED, DONE, PHOTO_STEP
 from rest_framework import serializers
 from django.db.models import Q
 from rest_framework.exceptions import ValidationError, PermissionDenied
-from .utils import check_email_or_phone, send_email, check_user_type
+from .utils import check_email_or_phone, send_email, resolve_login_user
 from exceptions.error_messages import ErrorCodes
 from exceptions.exception import CustomAPIException
 
@@ -166,7 +168,7 @@ class PartialChangeUserInformation(ChangeUserInformationSerializer):
 
 
 class ChangeUserPhotoSerializer(serializers.Serializer):
-    photo = serializers.ImageField(validators=[FileExtensionValidator(allowed_extensions=['png', 'jpg', 'jpeg'])])
+    photo = StreamedImageField(validators=[FileExtensionValidator(allowed_extensions=['png', 'jpg', 'jpeg'])])
 
     def update(self, instance, validated_data):
         photo = validated_data.get('photo')
@@ -184,29 +186,11 @@ class LoginSerializer(TokenObtainPairSerializer):
         self.fields['username'] = serializers.CharField(read_only=True, required=False)
 
     def auth_validate(self, data):
-        user_input = str(data.get('user_input')).lower()
-        print(user_input, '*' * 20)
-        if check_user_type(user_input) == 'username':
-            username = user_input
-        elif check_user_type(user_input) == 'email':
-            user = self.get_user(email__iexact=user_input)
-            username = user.username
-        elif check_user_type(user_input) == 'phone':
-            user = self.get_user(phone_number=user_input)
-            username = user.username
-        else:
-            raise CustomAPIException(ErrorCodes.VALIDATION_FAILED)
-        password = data.get('password', '')
-        current_user = User.objects.filter(username__iexact=username).first()
-        print(current_user, '*' * 20)
-        print(current_user.auth_status, '*' * 20)
-        if current_user is not None and current_user.auth_status in [CODE_VERIFIED, NEW]:
+        current_user = resolve_login_user(str(data.get('user_input')))
+        if current_user.auth_status in [CODE_VERIFIED, NEW]:
             raise CustomAPIException(ErrorCodes.NOT_REGISTERED_YET)
-        print(current_user.password, '*' * 20)
-
-        if check_password(password, current_user.password):
+        if password_hash_pool.check_password(data.get('password', ''), current_user.password):
             self.user = current_user
-
         else:
             raise CustomAPIException(ErrorCodes.INVALID_INPUT)
 
@@ -215,19 +199,10 @@ class LoginSerializer(TokenObtainPairSerializer):
         if self.user.auth_status not in [DONE, PHOTO_STEP]:
             raise CustomAPIException(ErrorCodes.FORBIDDEN)
         data = self.user.token()
-        print(data, 'token  ' * 10)
         data['auth_status'] = self.user.auth_status
         data['role'] = self.user.user_roles
-        print(data, 'token  ' * 10)
         return data
 
-    @staticmethod
-    def get_user(**kwargs):
-        users = User.objects.filter(**kwargs)
-        if not users.exists():
-            raise CustomAPIException(ErrorCodes.USER_DOES_NOT_EXISTS)
-        return users.first()
-
 
 class LoginRefreshSerializer(TokenRefreshSerializer):
     def validate(self, attrs):
@@ -237,6 +212,9 @@ class LoginRefreshSerializer(TokenRefreshSerializer):
         user = User.objects.filter(id=user_id).first()
         if not user:
             raise CustomAPIException(ErrorCodes.USER_DOES_NOT_EXISTS)
+        if access_token.get('token_version', user.token_version) != user.token_version:
+            raise CustomAPIException(ErrorCodes.INVALID_TOKEN)
+        data['access'] = str(add_user_claims(access_token, user))
         update_last_login(None, user)
         return data
 
@@ -279,7 +257,8 @@ class ResetPasswordSerializer(serializers.Serializer):
 
     def update(self, instance, validated_data):
         password = validated_data.pop('password')
-        instance.set_password(password)
+        instance.password = password_hash_pool.make_password(password)
+        instance._password = password
         instance.save()
         return instance
         # return super(ResetPasswordSerializer, self).update(instance, validated_data)  # password update qilinyapti
@@ -0,0 +1,259 @@
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import aiohttp
+from django.conf import settings
+
+from .mailer import percentile
+
+logger = logging.getLogger(__name__)
+
+SMS_TWILIO, SMS_FAKE = ('twilio', 'fake')
+SENT, COALESCED = ('sent', 'coalesced')
+LATENCY_WINDOW = 1000
+
+
+class SmsTransportError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+# Failures to open the connection: the request never reached Twilio, so resending cannot duplicate the SMS.
+CONNECT_ERRORS = (aiohttp.ClientConnectorError,) + tuple(
+    error for error in (getattr(aiohttp, 'ConnectionTimeoutError', None),) if error is not None)
+
+
+def is_retryable(exc):
+    """
+    Twilio answered 429 or 5xx, or the connection could not be opened. Anything else is not retried: a read
+    timeout or a dropped connection may come after Twilio accepted the message, and other exceptions are bugs.
+    """
+    if isinstance(exc, CONNECT_ERRORS):
+        return True
+    status = getattr(exc, 'status', None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class TwilioTransport:
+    """One Twilio client for the whole process, sending over a pooled aiohttp session."""
+
+    def __init__(self, account_sid, auth_token, from_number):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.client = None
+
+    async def open(self):
+        from twilio.http.async_http_client import AsyncTwilioHttpClient
+        from twilio.rest import Client
+        self.client = Client(self.account_sid, self.auth_token,
+                             http_client=AsyncTwilioHttpClient(pool_connections=True))
+
+    async def send(self, phone, body):
+        await self.client.messages.create_async(to=phone, from_=self.from_number, body=body)
+
+    async def close(self):
+        await self.client.http_client.close()
+
+
+class FakeSmsTransport:
+    """Sends nothing; sleeps ``latency`` seconds per message and fails ``failure_rate`` of them."""
+
+    def __init__(self, latency=0.05, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+
+    async def open(self):
+        pass
+
+    async def send(self, phone, body):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise SmsTransportError('Fake transport failure', status=503)
+        self.sent.append((phone, body))
+
+    async def close(self):
+        pass
+
+
+def build_transport():
+    if settings.SMS_BACKEND == SMS_FAKE:
+        return FakeSmsTransport()
+    return TwilioTransport(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN, settings.TWILIO_FROM_NUMBER)
+
+
+class SmsDispatcher:
+    """
+    Sends SMS from an asyncio event loop running in a background thread, so request threads only enqueue.
+
+    At most ``concurrency`` messages are in flight at once over the transport's shared session. Sends that
+    failed to connect or got a 429 or 5xx are retried with full-jitter exponential backoff; other failures are
+    not (see ``is_retryable``). Bursts to the same number are coalesced: the first message goes out
+    immediately, and anything submitted for that number during the next ``coalesce_window`` seconds collapses
+    into the latest one, sent when the window closes. Repeated "send me a new code" taps therefore cost one
+    extra SMS, not one each.
+    """
+
+    def __init__(self, transport_factory, concurrency, max_retries, backoff, backoff_max, coalesce_window,
+                 shutdown_timeout):
+        self.transport_factory = transport_factory
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.coalesce_window = coalesce_window
+        self.shutdown_timeout = shutdown_timeout
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.transport = None
+        self.semaphore = None
+        self.held = {}
+        self.tasks = set()
+        self.counters = {'submitted': 0, 'sent': 0, 'failed': 0, 'retried': 0, 'coalesced': 0}
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def start(self):
+        with self.lock:
+            if self.loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=loop.run_forever, name='sms-dispatcher', daemon=True)
+            self.thread.start()
+            try:
+                asyncio.run_coroutine_threadsafe(self.open(), loop).result()
+            except Exception:
+                loop.call_soon_threadsafe(loop.stop)
+                self.thread.join()
+                loop.close()
+                raise
+            self.loop = loop
+        atexit.register(self.shutdown)
+
+    async def open(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.transport = self.transport_factory()
+        await self.transport.open()
+
+    def submit(self, phone, body):
+        """Queue one message and return a ``concurrent.futures.Future`` resolving to ``'sent'`` or ``'coalesced'``."""
+        if self.loop is None:
+            self.start()
+        future = concurrent.futures.Future()
+        self.count('submitted')
+        self.loop.call_soon_threadsafe(self.accept, (phone, body, future, time.monotonic()))
+        return future
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def accept(self, message):
+        phone = message[0]
+        if not self.coalesce_window:
+            self.dispatch(message)
+        elif phone in self.held:
+            previous = self.held[phone]
+            if previous is not None:
+                self.count('coalesced')
+                previous[2].set_result(COALESCED)
+            self.held[phone] = message
+        else:
+            self.hold(phone)
+            self.dispatch(message)
+
+    def hold(self, phone):
+        self.held[phone] = None
+        asyncio.get_running_loop().call_later(self.coalesce_window, self.release, phone)
+
+    def release(self, phone):
+        message = self.held.pop(phone, None)
+        if message is not None:
+            self.hold(phone)
+            self.dispatch(message)
+
+    def dispatch(self, message):
+        task = asyncio.get_running_loop().create_task(self.deliver(message))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def deliver(self, message):
+        phone, body, future, enqueued = message
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    await self.transport.send(phone, body)
+                break
+            except Exception as exc:
+                if attempt == self.max_retries or not is_retryable(exc):
+                    logger.warning('Could not send SMS to %s: %s', phone, exc)
+                    self.count('failed')
+                    future.set_exception(exc)
+                    return
+                self.count('retried')
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)))
+        with self.lock:
+            self.counters['sent'] += 1
+            self.latencies.append(time.monotonic() - enqueued)
+        future.set_result(SENT)
+
+    def stats(self):
+        with self.lock:
+            latencies = list(self.latencies)
+            result = dict(self.counters)
+        result.update({
+            'in_flight': len(self.tasks),
+            'latency_avg': sum(latencies) / len(latencies) if latencies else 0.0,
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_max': max(latencies, default=0.0),
+        })
+        return result
+
+    async def drain(self):
+        # Held messages go out now instead of waiting for their window to close.
+        for phone in list(self.held):
+            message = self.held.pop(phone)
+            if message is not None:
+                self.dispatch(message)
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+        await self.transport.close()
+
+    def shutdown(self, timeout=None):
+        with self.lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self.drain(), loop).result(
+                self.shutdown_timeout if timeout is None else timeout)
+        except concurrent.futures.TimeoutError:
+            logger.warning('SMS dispatcher stopped with %d messages in flight', len(self.tasks))
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            self.thread.join()
+            loop.close()
+
+
+def build_dispatcher(transport_factory=build_transport, **options):
+    defaults = {
+        'concurrency': settings.SMS_CONCURRENCY,
+        'max_retries': settings.SMS_MAX_RETRIES,
+        'backoff': settings.SMS_RETRY_BACKOFF,
+        'backoff_max': settings.SMS_RETRY_BACKOFF_MAX,
+        'coalesce_window': settings.SMS_COALESCE_WINDOW,
+        'shutdown_timeout': settings.SMS_SHUTDOWN_TIMEOUT,
+    }
+    defaults.update(options)
+    return SmsDispatcher(transport_factory, **defaults)
+
+
+sms_dispatcher = build_dispatcher()
@@ -1,3 +1,321 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+import aiohttp
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+from users.hashing import password_hash_pool
+from users.models import User, UserConfirmation, DONE, ADMIN, ORDINARY_USER, VIA_PHONE, USERNAME_ATTEMPTS
+from users.serializers import LoginSerializer, ResetPasswordSerializer
+from users.sms import FakeSmsTransport, SmsTransportError, build_dispatcher, is_retryable
+from users.utils import resolve_login_user
+from users.verification import CacheCodeStore, DatabaseCodeStore
+
+ORDERS_URL = '/api/v1/market/order/'
+PHOTO_URL = '/api/v1/change-user-photo/'
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LocalCacheAuthenticationTest(TestCase):
+    """With the default local-memory cache every request loads the user row."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='member', password='password', auth_status=DONE)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.token()['access'])
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 401)
+
+    def test_revoked_token_is_rejected(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(user_roles=ADMIN)
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class SharedCacheAuthenticationTest(TestCase):
+    """Token versions in a shared cache: requests are authenticated from the token claims."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_directory = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cls.cache_directory,
+        }}))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.cache_directory, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='member', password='password', auth_status=DONE)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.token()['access'])
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 200)
+
+    def test_claims_are_trusted_without_loading_the_user(self):
+        with self.assertNumQueries(1):
+            # The version is cached by the first request; the one query is the order list itself.
+            self.assertEqual(self.client.get(ORDERS_URL).status_code, 200)
+
+    def test_deactivation_with_save_revokes_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 401)
+
+    def test_deactivation_with_update_revokes_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 401)
+
+    def test_role_change_with_update_revokes_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(user_roles=ADMIN)
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 401)
+
+    def test_updates_that_change_nothing_keep_tokens(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(pk=self.user.pk).update(is_active=True, user_roles=ORDINARY_USER)
+            User.objects.filter(pk=self.user.pk).update(first_name='Renamed')
+        self.assertEqual(User.objects.get(pk=self.user.pk).token_version, 0)
+        self.assertEqual(self.client.get(ORDERS_URL).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class LoginLookupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='MixedCase', email='Someone@Example.com', phone_number='+998901234567',
+                                        password='secret-pass', auth_status=DONE)
+
+    def test_username_and_email_ignore_case(self):
+        for user_input in ('MixedCase', 'mixedcase', 'MIXEDCASE', 'someone@example.com', 'SOMEONE@EXAMPLE.COM',
+                           '+998901234567'):
+            with self.assertNumQueries(1):
+                self.assertEqual(resolve_login_user(user_input).pk, self.user.pk, user_input)
+
+    def test_unknown_user(self):
+        with self.assertRaises(CustomAPIException) as raised:
+            resolve_login_user('nobody')
+        self.assertEqual(raised.exception.detail['error_code'], ErrorCodes.USER_DOES_NOT_EXISTS.value)
+
+    def test_login_with_differently_cased_email(self):
+        serializer = LoginSerializer(data={'user_input': 'SomeOne@EXAMPLE.com', 'password': 'secret-pass'})
+        self.assertTrue(serializer.is_valid())
+        self.assertIn('access', serializer.validated_data)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class VerifyCodeStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='verifier', password='password')
+
+    def check_store(self, store):
+        for sent in (4321, '4321', 421, '0421'):
+            code = str(sent).zfill(4)
+            store.create(self.user.id, code, VIA_PHONE)
+            self.assertFalse(store.confirm(self.user.id, 1234), sent)
+            self.assertTrue(store.confirm(self.user.id, sent), sent)
+            self.assertFalse(store.confirm(self.user.id, sent), sent)
+
+    def test_database_store_accepts_int_and_str_codes(self):
+        self.check_store(DatabaseCodeStore())
+
+    def test_cache_store_accepts_int_and_str_codes(self):
+        self.check_store(CacheCodeStore())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class GeneratedUsernameTest(TestCase):
+    def setUp(self):
+        User.objects.create(username='instagram-taken', email='taken@example.com', password='password')
+
+    def test_retries_with_a_new_name_after_a_collision(self):
+        names = iter(['instagram-taken', 'instagram-taken', 'instagram-fresh'])
+        with mock.patch('users.models.generate_username', side_effect=lambda: next(names)):
+            user = User.objects.create(email='new@example.com', password='password')
+        self.assertEqual(user.username, 'instagram-fresh')
+        self.assertEqual(User.objects.filter(email='new@example.com').count(), 1)
+
+    def test_gives_up_after_the_last_attempt(self):
+        with mock.patch('users.models.generate_username', return_value='instagram-taken') as generate:
+            with self.assertRaises(IntegrityError):
+                User.objects.create(email='new@example.com', password='password')
+        self.assertEqual(generate.call_count, USERNAME_ATTEMPTS)
+
+    def test_other_unique_violations_are_not_retried(self):
+        with mock.patch('users.models.generate_username', return_value='instagram-other') as generate:
+            with self.assertRaises(IntegrityError):
+                User.objects.create(email='taken@example.com', password='password')
+        self.assertEqual(generate.call_count, 1)
+
+
+def image_upload(size, image_format='JPEG', name='photo.jpg', noise=False):
+    image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3)) if noise else Image.new('RGB', size, 'red')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PhotoUploadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media_root))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create(username='photographer', password='password', auth_status=DONE)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.user.token()['access'])
+
+    def upload(self, photo):
+        return self.client.put(PHOTO_URL, {'photo': photo}, format='multipart')
+
+    def stored_photo(self):
+        self.user.refresh_from_db()
+        with self.user.photo.open('rb') as file:
+            return file.read()
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZE=4 * 1024)
+    def test_upload_over_the_cap_is_rejected(self):
+        # One file is caught while streaming, the other by its Content-Length before the body is read.
+        for size in ((48, 48), (200, 200)):
+            response = self.upload(image_upload(size, 'PNG', 'photo.png', noise=True))
+            self.assertEqual(response.status_code, 413, size)
+            self.assertEqual(response.json()['error_code'], ErrorCodes.FILE_TOO_LARGE.value)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.photo)
+
+    @override_settings(IMAGE_UPLOAD_MAX_DIMENSION=64)
+    def test_large_image_is_downscaled(self):
+        response = self.upload(image_upload((300, 150)))
+        self.assertEqual(response.status_code, 200)
+        with Image.open(io.BytesIO(self.stored_photo())) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (64, 32)))
+
+    @override_settings(IMAGE_UPLOAD_MAX_DIMENSION=64)
+    def test_small_image_is_kept_as_uploaded(self):
+        photo = image_upload((40, 20), 'PNG', 'photo.png')
+        content = photo.read()
+        photo.seek(0)
+        self.assertEqual(self.upload(photo).status_code, 200)
+        self.assertEqual(self.stored_photo(), content)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100 * 100)
+    def test_too_many_pixels_is_rejected(self):
+        response = self.upload(image_upload((200, 100)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('photo', response.json()['detail'])
+
+
+class PasswordHashPoolTest(TestCase):
+    def test_model_hashes_on_the_calling_thread(self):
+        with mock.patch.object(password_hash_pool, 'make_password') as make_password:
+            user = User.objects.create(username='plain', password='first-secret')
+        make_password.assert_not_called()
+        self.assertTrue(user.check_password('first-secret'))
+
+    def test_reset_hashes_in_the_pool(self):
+        user = User.objects.create(username='resetter', password='first-secret')
+        with mock.patch.object(password_hash_pool, 'make_password',
+                               wraps=password_hash_pool.make_password) as make_password:
+            ResetPasswordSerializer().update(user, {'password': 'second-secret'})
+        make_password.assert_called_once_with('second-secret')
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('second-secret'))
+
+
+class FailingSmsTransport(FakeSmsTransport):
+    def __init__(self, *errors):
+        super().__init__(latency=0)
+        self.errors = list(errors)
+        self.attempts = 0
+
+    async def send(self, phone, body):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        await super().send(phone, body)
+
+
+class SmsRetryTest(SimpleTestCase):
+    def connect_error(self):
+        return aiohttp.ClientConnectorError(mock.Mock(host='api.twilio.com', port=443, ssl=True),
+                                            OSError(111, 'Connection refused'))
+
+    def test_retryable_failures(self):
+        self.assertTrue(is_retryable(self.connect_error()))
+        self.assertTrue(is_retryable(SmsTransportError('busy', status=429)))
+        self.assertTrue(is_retryable(SmsTransportError('unavailable', status=503)))
+        for error in (SmsTransportError('bad number', status=400), SmsTransportError('no status'),
+                      asyncio.TimeoutError(), aiohttp.ServerDisconnectedError(), TypeError('bug'), KeyError('x')):
+            self.assertFalse(is_retryable(error), repr(error))
+
+    def deliver(self, transport):
+        dispatcher = build_dispatcher(lambda: transport, max_retries=3, backoff=0, backoff_max=0,
+                                      coalesce_window=0)
+        try:
+            return dispatcher.submit('+998901234567', 'code').result(timeout=5)
+        finally:
+            dispatcher.shutdown()
+
+    def test_connect_failures_and_server_errors_are_retried(self):
+        transport = FailingSmsTransport(self.connect_error(), SmsTransportError('unavailable', status=503))
+        self.assertEqual(self.deliver(transport), 'sent')
+        self.assertEqual(transport.attempts, 3)
+
+    def test_other_failures_are_raised_at_once(self):
+        for error in (asyncio.TimeoutError(), TypeError('bug')):
+            transport = FailingSmsTransport(error)
+            with self.assertRaises(type(error)), self.assertLogs('users.sms', 'WARNING'):
+                self.deliver(transport)
+            self.assertEqual((transport.attempts, transport.sent), (1, []))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class PurgeVerifyCodesTest(TestCase):
+    def test_deletes_expired_codes_in_pk_batches(self):
+        user = User.objects.create(username='verifier', password='password')
+        now = datetime.now()
+        UserConfirmation.objects.bulk_create(
+            [UserConfirmation(user=user, code='1234', verify_type=VIA_PHONE, expiration_time=now - timedelta(days=1))
+             for _ in range(5)] +
+            [UserConfirmation(user=user, code='1234', verify_type=VIA_PHONE, expiration_time=now)])
+        kept = UserConfirmation.objects.latest('pk').pk
+        with CaptureQueriesContext(connection) as queries:
+            call_command('purge_verify_codes', batch_size=2, stdout=io.StringIO())
+        self.assertEqual(list(UserConfirmation.objects.values_list('pk', flat=True)), [kept])
+        batches = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('SELECT') and 'expiration_time' in query['sql']]
+        self.assertEqual(len(batches), 4)
+        # Every batch after the first starts past the last primary key it deleted.
+        self.assertTrue(all('"id" >' in sql for sql in batches[1:]), batches)
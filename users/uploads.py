@@ -0,0 +1,110 @@
+import functools
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from exceptions.error_messages import ErrorCodes
+from exceptions.exception import CustomAPIException
+
+# Room for the multipart boundaries and the non-file fields sent next to the file.
+FORM_OVERHEAD = 64 * 1024
+IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def too_large(max_size):
+    return CustomAPIException(ErrorCodes.FILE_TOO_LARGE,
+                              message=f'Uploads are limited to {round(max_size / (1024 * 1024), 1):g} MB')
+
+
+class CappedUploadHandler(TemporaryFileUploadHandler):
+    """
+    Spools every uploaded file to a temporary file in 64 KB chunks, never to memory, and gives up once the
+    files of one request exceed ``max_size`` bytes. A ``Content-Length`` that is already over the cap is
+    rejected before any of the body is read.
+    """
+
+    def __init__(self, request, max_size):
+        super().__init__(request)
+        self.max_size = max_size
+        self.received = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_size + FORM_OVERHEAD:
+            raise too_large(self.max_size)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.file.close()
+            raise too_large(self.max_size)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def streamed_upload(func):
+    """Parse the multipart body of this action with ``CappedUploadHandler`` and ``IMAGE_UPLOAD_MAX_SIZE``."""
+    @functools.wraps(func)
+    def wrapper(self, request, *args, **kwargs):
+        django_request = request._request
+        django_request.upload_handlers = [CappedUploadHandler(django_request, settings.IMAGE_UPLOAD_MAX_SIZE)]
+        return func(self, request, *args, **kwargs)
+
+    return wrapper
+
+
+class StreamedImageField(serializers.ImageField):
+    """
+    An ``ImageField`` that checks the image from its header instead of decoding it.
+
+    Pillow opens the file lazily, so the format and dimensions are known after reading a few kilobytes.
+    Images over ``IMAGE_UPLOAD_MAX_PIXELS`` are rejected there, before any pixel is decoded. Images whose
+    longer side exceeds ``IMAGE_UPLOAD_MAX_DIMENSION`` are decoded at a reduced scale with ``draft()`` (JPEG
+    only), shrunk with ``thumbnail()`` and re-encoded to a temporary file. Smaller images are kept byte for
+    byte. Decoded memory therefore stays under the pixel cap whatever the size of the upload.
+    """
+    default_error_messages = {
+        'image_format': 'Unsupported image format. Use one of: {formats}.',
+        'too_many_pixels': 'Image is too large: at most {max_pixels} pixels are accepted.',
+    }
+
+    def to_internal_value(self, data):
+        upload = serializers.FileField.to_internal_value(self, data)
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', Image.DecompressionBombWarning)
+                image = Image.open(upload)
+        except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+            self.fail('too_many_pixels', max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS)
+        except (OSError, SyntaxError, ValueError):
+            self.fail('invalid_image')
+        if image.format not in IMAGE_FORMATS:
+            self.fail('image_format', formats=', '.join(IMAGE_FORMATS))
+        width, height = image.size
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.fail('too_many_pixels', max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS)
+        max_dimension = settings.IMAGE_UPLOAD_MAX_DIMENSION
+        if max(width, height) <= max_dimension:
+            upload.seek(0)
+            return upload
+        try:
+            return downscale(image, upload.name, max_dimension)
+        except (OSError, SyntaxError, ValueError):
+            self.fail('invalid_image')
+
+
+def downscale(image, name, max_dimension):
+    image_format = image.format
+    scale = max_dimension / max(image.size)
+    image.draft('RGB', (max(round(image.size[0] * scale), 1), max(round(image.size[1] * scale), 1)))
+    ImageOps.exif_transpose(image, in_place=True)
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=3.0)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = tempfile.TemporaryFile()
+    image.save(output, image_format, quality=90)
+    output.seek(0)
+    return File(output, name=name)
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import (SignUpApiView, VerifyApiView, NewVerifyCodeApiView,
                     ChangeUserInformationApiView, ChangeUserPhotoApiView, LoginApiView, LoginApiView, LogoutApiView,
-                    ForgotPasswordApiView, ResetPasswordApiViewSet)
+                    ForgotPasswordApiView, ResetPasswordApiViewSet, EmailStatsApiView,
+                    PasswordHashStatsApiView)
 
 urlpatterns = [
     path('login/', LoginApiView.as_view({'post': 'login'}), name='login'),
@@ -14,4 +15,6 @@ urlpatterns = [
     path('change-user-photo/', ChangeUserPhotoApiView.as_view({'put': 'update'}), name='change-user-photo'),
     path('forgot-password/', ForgotPasswordApiView.as_view({'post': 'forgot_password'}), name='forgot-password'),
     path('reset-password/', ResetPasswordApiViewSet.as_view({'post': 'reset_password'}), name='reset-password'),
+    path('email-stats/', EmailStatsApiView.as_view({'get': 'stats'}), name='email-stats'),
+    path('password-hash-stats/', PasswordHashStatsApiView.as_view({'get': 'stats'}), name='password-hash-stats'),
 ]
@@ -1,17 +1,21 @@
 import re
-import threading
-from twilio.rest import Client
+from functools import lru_cache
 from .models import User, NEW, CODE_VERIFIED, VIA_EMAIL, VIA_PHONE
 from exceptions.error_messages import ErrorCodes
 from exceptions.exception import CustomAPIException
 from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
+from django.template.loader import get_template
 from rest_framework.exceptions import ValidationError
-from decouple import config
-from datetime import datetime
+from django.db.models.functions import Lower
+from .mailer import email_pool
+from .sms import sms_dispatcher
+from .verification import get_code_store
 email_regex = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b")
 phone_regex = re.compile(r"(^\+998([- ])?(90|91|93|94|95|98|99|33|97|71)([- ])?(\d{3})([- ])?(\d{2})([- ])?(\d{2})$)")
 username_regex = re.compile(r"\b[A-Za-z0-9._-]{3,}\b")
+# Same precedence as check_user_type (username, then phone, then email), evaluated in a single pass.
+user_input_regex = re.compile(
+    rf"(?P<username>{username_regex.pattern})|(?P<phone>{phone_regex.pattern})|(?P<email>{email_regex.pattern})")
 
 
 def check_email_or_phone(email_or_phone):
@@ -26,24 +30,28 @@ def check_email_or_phone(email_or_phone):
 
 
 def check_user_type(user_input):
-    if re.fullmatch(username_regex, user_input):
-        user_input = "username"
-    elif re.fullmatch(phone_regex, user_input):
-        user_input = "phone"
-    elif re.fullmatch(email_regex, user_input):
-        user_input = "email"
-    else:
+    match = user_input_regex.fullmatch(user_input)
+    if match is None:
         raise CustomAPIException(ErrorCodes.VALIDATION_FAILED)
-    return user_input
+    return match.lastgroup
 
 
-class EmailThread(threading.Thread):
-    def __init__(self, email):
-        self.email = email
-        threading.Thread.__init__(self)
+def resolve_login_user(user_input):
+    """
+    Fetch the user a login identifier refers to with one indexed query.
 
-    def run(self):
-        self.email.send()
+    Usernames and emails are compared as ``lower(column) = value`` so the functional ``lower()`` indexes on
+    ``User`` are used; phone numbers hit the unique index on ``phone_number``.
+    """
+    user_type = check_user_type(user_input)
+    if user_type == "phone":
+        users = User.objects.filter(phone_number=user_input)
+    else:
+        users = User.objects.alias(login=Lower(user_type)).filter(login=user_input.lower())
+    user = next(iter(users[:1]), None)
+    if user is None:
+        raise CustomAPIException(ErrorCodes.USER_DOES_NOT_EXISTS)
+    return user
 
 
 class Email:
@@ -56,14 +64,16 @@ class Email:
         )
         if data.get('content_type') == 'html':
             email.content_subtype = 'html'
-        EmailThread(email).start()
+        email_pool.submit(email)
+
+
+@lru_cache(maxsize=None)
+def activation_template():
+    return get_template('email/authentication/activate_account.html')
 
 
 def send_email(email, code):
-    html_content = render_to_string(
-        'email/authentication/activate_account.html',
-        {'code': code}
-    )
+    html_content = activation_template().render({'code': code})
     Email.send_email(
         {
             'subject': "Registration",
@@ -75,15 +85,8 @@ def send_email(email, code):
 
 
 def send_phone_code(phone, code):
-    account_sit = config('account_sit')
-    auth_token = config('auth_token')
-    client = Client(account_sit, auth_token)
-    client.messages.create(
-        body="Hi, your confirmation code is {}\n".format(code),
-        from_="+998938340103",
-        to=f"{phone}"
-    )
-    
+    return sms_dispatcher.submit(phone, "Hi, your confirmation code is {}\n".format(code))
+
 
 def verify(self, request):
         user = request.user
@@ -97,10 +100,8 @@ def verify(self, request):
         return result
 
 def check_verify(user, code):
-        verifies = user.verify_codes.filter(expiration_time__gte=datetime.now(), code=code, is_confirmed=False)
-        if not verifies.exists():
+        if not get_code_store().confirm(user.id, code):
             raise CustomAPIException(ErrorCodes.EXPIRED_OR_INVALID_CODE)
-        verifies.update(is_confirmed=True)
 
         if user.auth_status == NEW:
             user.auth_status = CODE_VERIFIED
@@ -123,6 +124,5 @@ def get_verify_code(self, request):
 
 
 def check_verification(user):
-        verifies = user.verify_codes.filter(expiration_time__gte=datetime.now(), is_confirmed=False)
-        if verifies.exists():
+        if get_code_store().has_active(user.id):
             raise CustomAPIException(ErrorCodes.NOT_EXPIRED)
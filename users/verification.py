@@ -0,0 +1,77 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserConfirmation, verify_code_expiration, VERIFY_CODE_LENGTH
+
+CODE_DATABASE, CODE_CACHE = ('database', 'cache')
+VERIFY_CODE_KEY = 'users:verify_codes:{}'
+
+
+def normalize_code(code):
+    # Codes are stored as zero-padded strings, but JSON clients (and the documented serializer) send an int.
+    return str(code).strip().zfill(VERIFY_CODE_LENGTH)
+
+
+class DatabaseCodeStore:
+    """Codes are ``UserConfirmation`` rows, looked up through the partial ``(user, expiration_time)`` index."""
+
+    @staticmethod
+    def active(user_id):
+        return UserConfirmation.objects.filter(user_id=user_id, is_confirmed=False,
+                                               expiration_time__gte=datetime.now())
+
+    def create(self, user_id, code, verify_type):
+        UserConfirmation.objects.create(user_id=user_id, code=code, verify_type=verify_type)
+
+    def has_active(self, user_id):
+        return self.active(user_id).exists()
+
+    def confirm(self, user_id, code):
+        return self.active(user_id).filter(code=normalize_code(code)).update(is_confirmed=True) > 0
+
+
+class CacheCodeStore:
+    """
+    Unconfirmed codes live only in the cache, as one list per user that expires with its newest code, so
+    requesting and verifying a code never touches the database.
+    """
+
+    @staticmethod
+    def load(user_id):
+        now = datetime.now()
+        return [entry for entry in cache.get(VERIFY_CODE_KEY.format(user_id), []) if entry['expires'] >= now]
+
+    @staticmethod
+    def save(user_id, entries):
+        key = VERIFY_CODE_KEY.format(user_id)
+        if not entries:
+            cache.delete(key)
+            return
+        timeout = (max(entry['expires'] for entry in entries) - datetime.now()).total_seconds()
+        cache.set(key, entries, max(int(timeout) + 1, 1))
+
+    def create(self, user_id, code, verify_type):
+        entries = self.load(user_id)
+        entries.append({'code': code, 'verify_type': verify_type, 'expires': verify_code_expiration(verify_type)})
+        self.save(user_id, entries)
+
+    def has_active(self, user_id):
+        return bool(self.load(user_id))
+
+    def confirm(self, user_id, code):
+        code = normalize_code(code)
+        entries = self.load(user_id)
+        remaining = [entry for entry in entries if normalize_code(entry['code']) != code]
+        if len(remaining) == len(entries):
+            return False
+        self.save(user_id, remaining)
+        return True
+
+
+CODE_STORES = {CODE_DATABASE: DatabaseCodeStore(), CODE_CACHE: CacheCodeStore()}
+
+
+def get_code_store():
+    return CODE_STORES[settings.VERIFY_CODE_BACKEND]
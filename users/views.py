@@ -7,6 +7,10 @@ from exceptions.error_messages import ErrorCodes
 from exceptions.exception import CustomAPIException
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
+from market.permissions import is_super_admin
+from .hashing import password_hash_pool
+from .mailer import email_pool
+from .uploads import streamed_upload
 from .utils import send_email, check_email_or_phone, verify, get_verify_code
 from .serializers import (SignUpSerializer, ChangeUserInformationSerializer, ChangeUserPhotoSerializer,
                           LoginSerializer, LoginRefreshSerializer, LogoutSerializer, ForgotPasswordSerializer,
@@ -102,6 +106,7 @@ class ChangeUserPhotoApiView(ViewSet):
         responses={200: ChangeUserPhotoSerializer()},
         tags=['Authentication'],
     )
+    @streamed_upload
     def update(self, request):
         serializer = ChangeUserPhotoSerializer(data=request.data)
         if not serializer.is_valid():
@@ -217,3 +222,29 @@ class ResetPasswordApiViewSet(ViewSet):
             'refresh': user.token()['refresh_token'],
         }
         return Response(data={'result': data, 'ok': True}, status=status.HTTP_200_OK)
+
+
+class EmailStatsApiView(ViewSet):
+    @swagger_auto_schema(
+        operation_summary='Email pool stats',
+        operation_description='Queue depth, delivery counters and enqueue-to-sent latency (seconds) of the '
+                              'email worker pool in this process.',
+        responses={200: openapi.Response('Email pool stats', )},
+        tags=['Authentication']
+    )
+    @is_super_admin
+    def stats(self, request):
+        return Response(data={'result': email_pool.stats(), 'ok': True}, status=status.HTTP_200_OK)
+
+
+class PasswordHashStatsApiView(ViewSet):
+    @swagger_auto_schema(
+        operation_summary='Password hash pool stats',
+        operation_description='Jobs submitted, completed and rejected by admission control, and the time jobs '
+                              'spent queued (seconds) in the password hashing pool of this process.',
+        responses={200: openapi.Response('Password hash pool stats', )},
+        tags=['Authentication']
+    )
+    @is_super_admin
+    def stats(self, request):
+        return Response(data={'result': password_hash_pool.stats(), 'ok': True}, status=status.HTTP_200_OK)